@@ -4,8 +4,8 @@ import os
 from utils.document_processor import process_document
 from utils.openai_helper import OpenAIHelper
 from utils.translator import TranslationHelper
-from utils.risk_assessment import assess_risk_level, get_risk_color
-from utils.localization import get_ui_text
+from utils.risk_assessment import assess_risk_level, get_risk_color, format_risk_factor
+from utils.localization import get_ui_text, localize_risk_factors
 from utils.database import (
     save_document_history, 
     save_document_summary, 
@@ -15,9 +15,15 @@ from utils.database import (
     get_document_text,
     get_privacy_settings,
     update_privacy_settings,
-    delete_document_by_token
+    delete_document_by_token,
+    compute_content_hash,
+    find_duplicate_document,
+    get_saved_summary
 )
 from utils.history import display_history_page, display_document_details
+from utils.dashboard import display_stats_page
+from utils.retention import start_retention_worker
+from utils.write_behind import start_write_behind_queue
 
 # Set page configuration
 st.set_page_config(
@@ -168,8 +174,52 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Initialize singleton helpers
+@st.cache_resource
+def get_translation_helper():
+    """Create the translation helper once per process so backend latency statistics survive reruns"""
+    return TranslationHelper()
+
+@st.cache_resource
+def start_background_workers():
+    """Start the retention purge thread once per process; set RETENTION_WORKER=0 to run it externally"""
+    if os.environ.get("RETENTION_WORKER", "1") != "0":
+        return start_retention_worker()
+    return None
+
+@st.cache_resource
+def get_write_queue():
+    """Start the write-behind queue once per process; set WRITE_BEHIND=0 to save synchronously"""
+    if os.environ.get("WRITE_BEHIND", "1") != "0":
+        try:
+            return start_write_behind_queue()
+        except RuntimeError as e:
+            print(f"Saving synchronously: {e}")
+    return None
+
+def current_document_id():
+    """
+    Get the database ID of the current document
+
+    Documents queued without a reserved ID only get one once the queue has
+    written them; until then this returns None.
+    """
+    document_id = st.session_state.get('document_id')
+    return write_queue.resolve(document_id) if write_queue else document_id
+
 openai_helper = OpenAIHelper()
-translation_helper = TranslationHelper()
+translation_helper = get_translation_helper()
+start_background_workers()
+write_queue = get_write_queue()
+
+# Fixed labels on the analysis screen, translated together in one concurrent batch
+ANALYSIS_SCREEN_LABELS = [
+    "Upload another document", "Document Information", "Filename", "Size", "Language",
+    "Content Length", "characters", "Risk Level", "Risk Factors Detected", "No risk factors detected",
+    "Document Preview", "Show document text", "Generate Summary", "SUMMARIZE DOCUMENT",
+    "Summary Results", "Summary in", "Download Summary", "The system can identify:",
+    "Legal terms", "Contract clauses", "Liability issues", "Financial obligations",
+    "Key parties involved", "Important dates", "Legal notices", "Legal opinions", "Rights & duties"
+]
 
 # Initialize session state variables
 if 'document_text' not in st.session_state:
@@ -226,9 +276,10 @@ with top_col2:
         st.rerun()
 
 # CREATE TABS
-tab1, tab2 = st.tabs([
+tab1, tab2, tab3 = st.tabs([
     get_ui_text("process_document_tab", st.session_state.ui_language, "📄 Process Document"),
-    get_ui_text("document_history_tab", st.session_state.ui_language, "📋 Document History")
+    get_ui_text("document_history_tab", st.session_state.ui_language, "📋 Document History"),
+    get_ui_text("statistics_tab", st.session_state.ui_language, "📊 Statistics")
 ])
 
 # PROCESS DOCUMENT TAB
@@ -333,6 +384,12 @@ with tab1:
                     format_func=lambda x: "Simple" if x == "simple" else "Detailed"
                 )
             
+            # Identical uploads reuse the earlier analysis unless asked otherwise
+            st.session_state.force_reprocess = st.checkbox(
+                "Reprocess even if this file was analysed before",
+                value=False
+            )
+            
             # Process button - large and prominent
             st.markdown("<div style='text-align: center; margin-top: 30px;'>", unsafe_allow_html=True)
             process_button = st.button("PROCESS DOCUMENT", type="primary", use_container_width=True)
@@ -341,35 +398,66 @@ with tab1:
             if process_button:
                 try:
                     with st.spinner("Processing document..."):
-                        # Process the document
-                        st.session_state.document_text = process_document(uploaded_file)
-                        
-                        # Detect document language
-                        detected_language = translation_helper.detect_language(st.session_state.document_text)
+                        # Reuse the analysis of an identical earlier upload
+                        content_hash = compute_content_hash(uploaded_file.getvalue())
+                        duplicate = None
+                        if not st.session_state.force_reprocess:
+                            duplicate = find_duplicate_document(content_hash, selected_privacy)
+                        reused_text = get_document_text(duplicate['id']) if duplicate else None
                         
-                        # Assess risk level
-                        risk_level, risk_factors = assess_risk_level(st.session_state.document_text)
-                        st.session_state.risk_level = risk_level
-                        st.session_state.risk_factors = risk_factors
-                        
-                        # Save to database
-                        try:
-                            document_id = save_document_history(
-                                filename=uploaded_file.name,
-                                file_size_kb=round(uploaded_file.size / 1024, 2),
-                                document_language=detected_language,
-                                risk_level=risk_level,
-                                content_length=len(st.session_state.document_text),
-                                risk_factors=risk_factors,
-                                document_text=st.session_state.document_text,
-                                privacy_level=selected_privacy
-                            )
-                            st.session_state.document_id = document_id
-                        except Exception as db_error:
-                            print(f"Database error: {db_error}")
-                            st.session_state.document_id = None
-                        
-                        st.success(f"Successfully processed {uploaded_file.name}")
+                        if reused_text and not reused_text.startswith("[Encrypted content"):
+                            st.session_state.document_text = reused_text
+                            st.session_state.risk_level = duplicate['risk_level']
+                            st.session_state.risk_factors = duplicate['risk_factors']
+                            st.session_state.document_id = duplicate['id']
+                            st.session_state.document_info = None
+                            st.success(f"{uploaded_file.name} was analysed before; reusing that analysis")
+                        else:
+                            # Process the document
+                            st.session_state.document_text = process_document(uploaded_file)
+                            
+                            # Detect document language
+                            detected_language = translation_helper.detect_language(st.session_state.document_text)
+                            
+                            # Assess risk level
+                            risk_level, risk_factors = assess_risk_level(st.session_state.document_text)
+                            st.session_state.risk_level = risk_level
+                            st.session_state.risk_factors = risk_factors
+                            
+                            # Keep the metadata for display until a queued write lands
+                            st.session_state.document_info = {
+                                'filename': uploaded_file.name,
+                                'file_size_kb': round(uploaded_file.size / 1024, 2),
+                                'document_language': detected_language,
+                                'content_length': len(st.session_state.document_text)
+                            }
+                            
+                            # Save to database
+                            try:
+                                save_history = write_queue.save_document_history if write_queue else save_document_history
+                                document_id = save_history(
+                                    filename=uploaded_file.name,
+                                    file_size_kb=round(uploaded_file.size / 1024, 2),
+                                    document_language=detected_language,
+                                    risk_level=risk_level,
+                                    content_length=len(st.session_state.document_text),
+                                    risk_factors=risk_factors,
+                                    document_text=st.session_state.document_text,
+                                    privacy_level=selected_privacy,
+                                    content_hash=content_hash,
+                                    replace_duplicate=st.session_state.force_reprocess
+                                )
+                                # Another session saved the same file first; queued saves
+                                # never look it up here, so the page does not wait on the database
+                                if document_id is None and not write_queue:
+                                    duplicate = find_duplicate_document(content_hash, selected_privacy)
+                                    document_id = duplicate['id'] if duplicate else None
+                                st.session_state.document_id = document_id
+                            except Exception as db_error:
+                                print(f"Database error: {db_error}")
+                                st.session_state.document_id = None
+                            
+                            st.success(f"Successfully processed {uploaded_file.name}")
                         
                         # Force refresh to show analysis screen
                         st.rerun()
@@ -380,6 +468,18 @@ with tab1:
         # DOCUMENT ANALYSIS SCREEN
         # This section shows after a document is uploaded and processed
         
+        # Warm the translation cache for everything on this screen in one round trip
+        if st.session_state.target_language != "english":
+            try:
+                translation_helper.translate_many(
+                    ANALYSIS_SCREEN_LABELS
+                    + [st.session_state.detail_level.capitalize()]
+                    + ([st.session_state.risk_level] if st.session_state.risk_level else []),
+                    st.session_state.target_language
+                )
+            except Exception as e:
+                print(f"Batch translation failed: {e}")
+        
         # Add a clear button at the top - translate if needed
         if st.session_state.target_language != "english":
             try:
@@ -431,7 +531,8 @@ with tab1:
             # Show document info
             with info_col1:
                 if hasattr(st.session_state, 'document_id') and st.session_state.document_id:
-                    doc_info = get_document_with_risk_factors(st.session_state.document_id)
+                    document_id = current_document_id()
+                    doc_info = (document_id and get_document_with_risk_factors(document_id)) or st.session_state.get('document_info')
                     if doc_info:
                         # Translate document info labels if needed
                         if st.session_state.target_language != "english":
@@ -523,22 +624,22 @@ with tab1:
                             
                             st.markdown(f"**{risk_factors_text}:**")
                             
-                            # Translate each risk factor
-                            for factor in st.session_state.risk_factors:
-                                translated_factor = translation_helper.translate_text(
-                                    factor,
-                                    st.session_state.target_language
-                                )
+                            # Localize risk factors from cached templates and term names
+                            for translated_factor in localize_risk_factors(
+                                st.session_state.risk_factors,
+                                st.session_state.target_language,
+                                translation_helper
+                            ):
                                 st.markdown(f"• {translated_factor}")
                         except Exception as e:
                             # Fallback to English if translation fails
                             st.markdown("**Risk Factors Detected:**")
                             for factor in st.session_state.risk_factors:
-                                st.markdown(f"• {factor}")
+                                st.markdown(f"• {format_risk_factor(factor)}")
                     else:
                         st.markdown("**Risk Factors Detected:**")
                         for factor in st.session_state.risk_factors:
-                            st.markdown(f"• {factor}")
+                            st.markdown(f"• {format_risk_factor(factor)}")
                 else:
                     # Translate "No risk factors detected" if needed
                     if st.session_state.target_language != "english":
@@ -614,13 +715,25 @@ with tab1:
             if summarize_button:
                 try:
                     with st.spinner(f"Generating {st.session_state.detail_level} summary..."):
-                        st.session_state.summary = openai_helper.summarize_legal_document(
+                        # Summaries already generated for this document are reused
+                        document_id = current_document_id()
+                        reuse = document_id and not st.session_state.get('force_reprocess')
+                        saved_summary = get_saved_summary(document_id, st.session_state.detail_level) if reuse else None
+                        saved_translation = None
+                        if saved_summary and st.session_state.target_language != "english":
+                            saved_translation = get_saved_summary(
+                                document_id, st.session_state.detail_level, st.session_state.target_language
+                            )
+                        
+                        st.session_state.summary = saved_summary or openai_helper.summarize_legal_document(
                             st.session_state.document_text, 
                             st.session_state.detail_level
                         )
                         
                         # Translate if needed
-                        if st.session_state.target_language != "english":
+                        if saved_translation:
+                            st.session_state.translated_summary = saved_translation
+                        elif st.session_state.target_language != "english":
                             with st.spinner(f"Translating to {st.session_state.target_language.capitalize()}..."):
                                 translated_text = translation_helper.translate_text(
                                     st.session_state.summary,
@@ -633,17 +746,20 @@ with tab1:
                         # Save summary to database
                         if hasattr(st.session_state, 'document_id') and st.session_state.document_id:
                             try:
+                                save_summary = write_queue.save_document_summary if write_queue else save_document_summary
+                                
                                 # Save original English summary
-                                save_document_summary(
-                                    document_id=st.session_state.document_id,
-                                    summary_text=st.session_state.summary,
-                                    detail_level=st.session_state.detail_level,
-                                    language="english"
-                                )
+                                if not saved_summary:
+                                    save_summary(
+                                        document_id=st.session_state.document_id,
+                                        summary_text=st.session_state.summary,
+                                        detail_level=st.session_state.detail_level,
+                                        language="english"
+                                    )
                                 
                                 # Save translated summary if different from English
-                                if st.session_state.target_language != "english":
-                                    save_document_summary(
+                                if st.session_state.target_language != "english" and not saved_translation:
+                                    save_summary(
                                         document_id=st.session_state.document_id,
                                         summary_text=st.session_state.translated_summary,
                                         detail_level=st.session_state.detail_level,
@@ -801,6 +917,10 @@ with tab1:
 with tab2:
     display_history_page(st.session_state.ui_language)
 
+# STATISTICS TAB
+with tab3:
+    display_stats_page(st.session_state.ui_language)
+
 # Footer
 st.markdown("""
 <div class="footer">
@@ -0,0 +1,120 @@
+"""
+Query cost benchmark for the blind index of encrypted documents
+
+Builds synthetic blind indexes of increasing size in temporary tables, each
+with the same needle term planted in a fixed number of documents, and times
+exact-term lookups. A B-tree lookup on (term_hash, document_id) should cost
+the same whatever the number of indexed documents.
+
+Usage:
+    python blind_index_benchmark.py [--sizes 10000 100000 1000000] [--runs 50]
+"""
+import argparse
+import statistics
+import time
+
+from utils.database import get_connection, release_connection, blind_index
+
+# Distinct tokens per synthetic document
+TOKENS_PER_DOCUMENT = 40
+
+# Vocabulary the synthetic tokens are drawn from
+VOCABULARY_SIZE = 50000
+
+# Documents containing the needle term in every corpus
+NEEDLE_DOCUMENTS = 25
+
+NEEDLE_TERM = "indemnification"
+
+
+def build_corpus(cursor, documents):
+    """Fill a temporary blind index with synthetic documents and plant the needle"""
+    # Large corpora take longer than the pool's statement timeout to build
+    cursor.execute("SET LOCAL statement_timeout = 0")
+    cursor.execute("DROP TABLE IF EXISTS bench_blind_index")
+    cursor.execute("""
+        CREATE TEMP TABLE bench_blind_index (
+            term_hash BYTEA NOT NULL,
+            document_id INTEGER NOT NULL,
+            PRIMARY KEY (term_hash, document_id)
+        )
+    """)
+    # Skewed term choice, like natural language; digests stand in for HMACs
+    cursor.execute("""
+        INSERT INTO bench_blind_index
+        SELECT DISTINCT substring(decode(md5('term' || floor(power(random(), 3) * %s)::int), 'hex') FROM 1 FOR 16),
+               document_id
+        FROM generate_series(1, %s) AS document_id,
+             generate_series(1, %s) AS token
+    """, (VOCABULARY_SIZE, documents, TOKENS_PER_DOCUMENT))
+    cursor.execute("""
+        INSERT INTO bench_blind_index
+        SELECT %s, document_id FROM generate_series(1, %s) AS document_id
+        ON CONFLICT DO NOTHING
+    """, (blind_index.term_hash(NEEDLE_TERM), NEEDLE_DOCUMENTS))
+    cursor.execute("ANALYZE bench_blind_index")
+    cursor.execute("SELECT count(*) FROM bench_blind_index")
+    return cursor.fetchone()[0]
+
+
+def time_lookups(cursor, runs):
+    """Time the lookup search_encrypted_documents runs, for the needle term"""
+    term_hash = blind_index.term_hash(NEEDLE_TERM)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        cursor.execute("""
+            SELECT document_id FROM bench_blind_index
+            WHERE term_hash = ANY(%s)
+            GROUP BY document_id
+            HAVING count(*) = 1
+        """, ([term_hash],))
+        matches = len(cursor.fetchall())
+        timings.append(time.perf_counter() - start)
+
+    cursor.execute("""
+        EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)
+        SELECT document_id FROM bench_blind_index WHERE term_hash = %s
+    """, (term_hash,))
+    plan = cursor.fetchone()[0][0]["Plan"]
+    buffers = plan.get("Shared Hit Blocks", 0) + plan.get("Shared Read Blocks", 0)
+    return matches, timings, plan["Node Type"], buffers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark blind index term lookups")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="Numbers of synthetic documents")
+    parser.add_argument("--runs", type=int, default=50, help="Timed lookups per corpus")
+    args = parser.parse_args()
+
+    connection = get_connection()
+    if not connection:
+        print("Could not connect to the database")
+        return
+
+    try:
+        print(f"\nBlind index lookup: {TOKENS_PER_DOCUMENT} tokens per document, "
+              f"needle in {NEEDLE_DOCUMENTS} documents, {args.runs} runs\n")
+        header = f"{'documents':>10} {'index rows':>12} {'matches':>8} {'plan':>16} {'buffers':>8} {'p50 (ms)':>9} {'p95 (ms)':>9}"
+        print(header)
+        print("-" * len(header))
+
+        for documents in args.sizes:
+            with connection:
+                with connection.cursor() as cursor:
+                    rows = build_corpus(cursor, documents)
+                    matches, timings, node, buffers = time_lookups(cursor, args.runs)
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(0.95 * len(timings)))]
+            print(f"{documents:>10} {rows:>12} {matches:>8} {node:>16} {buffers:>8} "
+                  f"{statistics.median(timings) * 1000:>9.2f} {p95 * 1000:>9.2f}")
+    finally:
+        with connection:
+            with connection.cursor() as cursor:
+                cursor.execute("DROP TABLE IF EXISTS bench_blind_index")
+        release_connection(connection)
+
+
+if __name__ == "__main__":
+    main()
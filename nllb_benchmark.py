@@ -0,0 +1,120 @@
+"""
+Side-by-side latency and memory benchmark for the NLLB-200 translators
+
+Compares the PyTorch NLLBTranslator with the int8 CTranslate2NLLBTranslator.
+Each engine runs in its own process so peak memory is measured separately,
+once per beam size so the engines are compared at equal settings.
+
+Usage:
+    python nllb_benchmark.py [--runs 3] [--target hindi] [--threads 4] [--beam-sizes 2 5]
+"""
+import argparse
+import multiprocessing
+import resource
+import statistics
+import time
+
+SAMPLE_TEXT = (
+    "This Agreement shall commence on the Effective Date and continue for a period of three years. "
+    "Either party may terminate this Agreement immediately upon written notice if the other party "
+    "commits a material breach of any of its obligations. The Service Provider shall indemnify the "
+    "Client against all losses, damages and claims arising out of any breach of confidentiality. "
+    "All confidential information shall remain the property of the disclosing party and shall survive "
+    "the termination of this Agreement. Any dispute arising under this Agreement shall be referred to "
+    "arbitration in accordance with the Arbitration and Conciliation Act, 1996. "
+)
+
+# Roughly 1, 4 and 16 NLLB chunks worth of text
+TEXT_SIZES = {
+    "short": SAMPLE_TEXT,
+    "medium": SAMPLE_TEXT * 8,
+    "long": SAMPLE_TEXT * 32,
+}
+
+
+def peak_memory_mb():
+    """Peak resident set size of the current process in MB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_engine(engine, runs, target_language, threads, beam_size, queue):
+    """Load one engine, translate each sample and report timings through the queue"""
+    from utils.nllb_translator import NLLBTranslator, CTranslate2NLLBTranslator
+
+    start = time.perf_counter()
+    if engine == "pytorch":
+        import torch
+        if threads:
+            torch.set_num_threads(threads)
+        translator = NLLBTranslator(num_beams=beam_size)
+    else:
+        translator = CTranslate2NLLBTranslator(intra_threads=threads or None, beam_size=beam_size)
+    load_seconds = time.perf_counter() - start
+
+    if not translator.is_available:
+        queue.put({"engine": engine, "beam_size": beam_size, "error": "translator not available"})
+        return
+
+    # Warm up once so lazy initialisation is not counted
+    translator.translate("Warm up.", "english", target_language)
+
+    latencies = {}
+    for size, text in TEXT_SIZES.items():
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            translator.translate(text, "english", target_language)
+            timings.append(time.perf_counter() - start)
+        latencies[size] = timings
+
+    queue.put({
+        "engine": engine,
+        "beam_size": beam_size,
+        "load_seconds": load_seconds,
+        "latencies": latencies,
+        "peak_memory_mb": peak_memory_mb(),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark NLLB-200 translation engines")
+    parser.add_argument("--runs", type=int, default=3, help="Timed runs per text size")
+    parser.add_argument("--target", default="hindi", help="Target language name")
+    parser.add_argument("--threads", type=int, default=0, help="CPU threads per engine (0 = default)")
+    parser.add_argument("--beam-sizes", type=int, nargs="+", default=[2, 5],
+                        help="Beam sizes to run both engines with (2 is the CTranslate2 default, 5 the PyTorch one)")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for beam_size in args.beam_sizes:
+        for engine in ["pytorch", "ctranslate2"]:
+            queue = context.Queue()
+            process = context.Process(
+                target=run_engine, args=(engine, args.runs, args.target, args.threads, beam_size, queue)
+            )
+            process.start()
+            process.join()
+            results.append(queue.get() if not queue.empty() else
+                           {"engine": engine, "beam_size": beam_size, "error": "process failed"})
+
+    print(f"\nNLLB-200 benchmark: english -> {args.target}, {args.runs} runs per size\n")
+    header = f"{'engine':<12} {'beams':>5} {'load (s)':>9} {'peak RSS (MB)':>14}"
+    for size in TEXT_SIZES:
+        header += f" {size + ' p50 (s)':>16}"
+    print(header)
+    print("-" * len(header))
+
+    for result in results:
+        if "error" in result:
+            print(f"{result['engine']:<12} {result['beam_size']:>5} {result['error']}")
+            continue
+        row = (f"{result['engine']:<12} {result['beam_size']:>5} {result['load_seconds']:>9.1f} "
+               f"{result['peak_memory_mb']:>14.0f}")
+        for size in TEXT_SIZES:
+            row += f" {statistics.median(result['latencies'][size]):>16.2f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Side-by-side benchmark of the Postgres and SQLite storage backends
+
+Runs the same workload through the utils.database API on each backend: single
+and batched saves, summaries, history pages, detail loads, body reads,
+full-text search and bulk deletion. Each backend runs in its own process,
+since the backend is chosen when utils.database is imported. The documents
+written by the benchmark are deleted again at the end.
+
+Usage:
+    python storage_benchmark.py [--documents 500] [--backends postgres sqlite]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+
+SAMPLE_TEXT = (
+    "This Agreement shall commence on the Effective Date and continue for a period of three years. "
+    "Either party may terminate this Agreement immediately upon written notice if the other party "
+    "commits a material breach of any of its obligations. The Service Provider shall indemnify the "
+    "Client against all losses, damages and claims arising out of any breach of confidentiality. "
+)
+
+# Words mixed into every document so searches have selective terms to find
+VOCABULARY = [
+    "lease", "tenant", "landlord", "warranty", "arbitration", "royalty", "escrow", "severance",
+    "licence", "sublease", "easement", "novation", "guarantor", "covenant", "forfeiture", "lien",
+]
+
+SEARCH_QUERIES = ["indemnify", "escrow royalty", '"material breach"', "tenant -landlord", "novation"]
+
+# Documents per save_document_history_batch call
+BATCH_SIZE = 50
+
+# Repetitions of the read-only operations that do not depend on the document count
+READ_RUNS = 50
+
+
+def synthetic_document(rng, index):
+    """Build the save_document_history arguments of one synthetic document"""
+    from utils.risk_assessment import assess_risk_level
+
+    text = SAMPLE_TEXT * rng.randint(2, 20) + " ".join(rng.choices(VOCABULARY, k=40))
+    risk_level, risk_factors = assess_risk_level(text)
+    return {
+        "filename": f"benchmark-{index}.pdf",
+        "file_size_kb": round(len(text) / 1024, 2),
+        "document_language": "english",
+        "risk_level": risk_level,
+        "content_length": len(text),
+        "risk_factors": risk_factors,
+        "document_text": text,
+        # One in five documents is encrypted, like a mixed production workload
+        "privacy_level": "enhanced" if index % 5 == 0 else "standard",
+    }
+
+
+def timed(timings, operation, function, *args, **kwargs):
+    """Call function and record its latency under operation"""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    timings.setdefault(operation, []).append(time.perf_counter() - start)
+    return result
+
+
+def run_backend(backend, documents, sqlite_path, queue):
+    """Run the workload on one backend and report timings through the queue"""
+    os.environ["STORAGE_BACKEND"] = backend
+    if sqlite_path:
+        os.environ["SQLITE_PATH"] = sqlite_path
+    from utils import database
+
+    if not database.ensure_schema():
+        queue.put({"backend": backend, "error": "database unavailable"})
+        return
+
+    rng = random.Random(42)
+    inputs = [synthetic_document(rng, index) for index in range(documents)]
+    timings = {}
+    document_ids = []
+
+    # Half the documents one at a time, the rest in batches
+    half = documents // 2
+    for document in inputs[:half]:
+        document_ids.append(timed(timings, "save (single)", database.save_document_history, **document))
+    for start in range(half, documents, BATCH_SIZE):
+        batch = inputs[start:start + BATCH_SIZE]
+        document_ids.extend(timed(timings, "save (batch)", database.save_document_history_batch, batch) or [])
+    document_ids = [document_id for document_id in document_ids if document_id]
+    if not document_ids:
+        queue.put({"backend": backend, "error": "no documents were saved"})
+        return
+
+    for document_id in document_ids:
+        timed(timings, "save summary", database.save_document_summary,
+              document_id, SAMPLE_TEXT, "simple", "english")
+
+    for _ in range(READ_RUNS):
+        timed(timings, "recent documents", database.get_recent_documents, 20)
+
+    page_cursor = None
+    while True:
+        _, page_cursor = timed(timings, "history page", database.list_documents, limit=20, cursor=page_cursor)
+        if page_cursor is None:
+            break
+
+    tokens = []
+    for document_id in document_ids:
+        document = timed(timings, "document metadata", database.get_document_with_risk_factors, document_id)
+        tokens.append(document["access_token"])
+        details = timed(timings, "document details", database.load_document_details, document_id)
+        for summary in details["summaries"]:
+            summary["summary_text"]
+        timed(timings, "document text", database.get_document_text, document_id)
+
+    for _ in range(READ_RUNS // len(SEARCH_QUERIES)):
+        for query in SEARCH_QUERIES:
+            timed(timings, "search", database.search_documents, query)
+
+    deleted = timed(timings, "bulk delete", database.delete_documents, access_tokens=tokens)
+    queue.put({
+        "backend": backend,
+        "documents": len(document_ids),
+        "deleted": deleted["document_history"] if deleted else 0,
+        "timings": timings,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the storage backends")
+    parser.add_argument("--documents", type=int, default=500, help="Synthetic documents per backend")
+    parser.add_argument("--backends", nargs="+", default=["postgres", "sqlite"],
+                        choices=["postgres", "sqlite"], help="Backends to benchmark")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in args.backends:
+            # A fresh SQLite file per run, unless SQLITE_PATH points at a real deployment
+            sqlite_path = None
+            if backend == "sqlite" and "SQLITE_PATH" not in os.environ:
+                sqlite_path = os.path.join(directory, "benchmark.db")
+            queue = context.Queue()
+            process = context.Process(target=run_backend, args=(backend, args.documents, sqlite_path, queue))
+            process.start()
+            process.join()
+            results.append(queue.get() if not queue.empty() else {"backend": backend, "error": "process failed"})
+
+    print(f"\nStorage benchmark: {args.documents} documents, batches of {BATCH_SIZE}\n")
+    header = f"{'backend':<10} {'operation':<18} {'calls':>6} {'p50 (ms)':>9} {'p95 (ms)':>9} {'calls/s':>9}"
+    print(header)
+    print("-" * len(header))
+
+    for result in results:
+        if "error" in result:
+            print(f"{result['backend']:<10} {result['error']}")
+            continue
+        for operation, timings in result["timings"].items():
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(0.95 * len(timings)))]
+            rate = len(timings) / sum(timings) if sum(timings) else 0.0
+            print(f"{result['backend']:<10} {operation:<18} {len(timings):>6} "
+                  f"{statistics.median(timings) * 1000:>9.2f} {p95 * 1000:>9.2f} {rate:>9.0f}")
+        print(f"{result['backend']:<10} saved {result['documents']}, deleted {result['deleted']}")
+
+
+if __name__ == "__main__":
+    main()
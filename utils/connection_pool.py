@@ -0,0 +1,186 @@
+"""
+Process-wide Postgres connection pool for the database module
+Provides thread-safe checkout with health checks, statement timeouts and
+wait-time and saturation metrics
+"""
+import os
+import threading
+import time
+import logging
+from psycopg2 import pool, extensions
+
+logger = logging.getLogger(__name__)
+
+# Pool configuration from environment variables
+POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", 1))
+POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 10))
+
+# Seconds to wait for a free connection before giving up
+POOL_CHECKOUT_TIMEOUT = float(os.environ.get("DB_POOL_CHECKOUT_TIMEOUT", 10))
+
+# Server-side statement timeout applied to every pooled connection
+STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 30000))
+
+# Connections idle longer than this are pinged before being handed out
+HEALTH_CHECK_AFTER_SECONDS = float(os.environ.get("DB_POOL_HEALTH_CHECK_AFTER", 30))
+
+
+class ConnectionPool:
+    """
+    Blocking, thread-safe wrapper around psycopg2's ThreadedConnectionPool
+    """
+    def __init__(self, db_params, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+                 checkout_timeout=POOL_CHECKOUT_TIMEOUT, statement_timeout_ms=STATEMENT_TIMEOUT_MS):
+        """
+        Initialize the pool
+
+        Args:
+            db_params (dict): psycopg2.connect keyword arguments
+            min_size (int): Connections opened up front and kept open
+            max_size (int): Maximum number of open connections
+            checkout_timeout (float): Seconds to wait for a free connection
+            statement_timeout_ms (int): Statement timeout for every connection (0 disables)
+        """
+        params = dict(db_params)
+        if statement_timeout_ms:
+            params["options"] = f"{params.get('options', '')} -c statement_timeout={statement_timeout_ms}".strip()
+
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self._pool = pool.ThreadedConnectionPool(min_size, max_size, **params)
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._last_used = {}
+        self._metrics = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "discarded": 0,
+            "total_wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "in_use": 0,
+            "peak_in_use": 0,
+        }
+
+    def _is_healthy(self, connection):
+        """Check a connection before handing it out"""
+        if connection.closed:
+            return False
+        if connection.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+
+        # Only ping connections that sat idle long enough for the server to drop them
+        last_used = self._last_used.get(id(connection))
+        if last_used is None or time.monotonic() - last_used < HEALTH_CHECK_AFTER_SECONDS:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self):
+        """
+        Borrow a connection, waiting up to checkout_timeout for a free one
+
+        Returns:
+            connection: psycopg2 connection or None if none became available
+        """
+        start = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._metrics["waits"] += 1
+            if not self._slots.acquire(timeout=self.checkout_timeout):
+                with self._lock:
+                    self._metrics["timeouts"] += 1
+                logger.error(f"Timed out after {self.checkout_timeout}s waiting for a database connection")
+                return None
+        wait_seconds = time.monotonic() - start
+
+        try:
+            connection = self._pool.getconn()
+            while not self._is_healthy(connection):
+                with self._lock:
+                    self._metrics["discarded"] += 1
+                self._last_used.pop(id(connection), None)
+                self._pool.putconn(connection, close=True)
+                connection = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            metrics = self._metrics
+            metrics["checkouts"] += 1
+            metrics["total_wait_seconds"] += wait_seconds
+            metrics["max_wait_seconds"] = max(metrics["max_wait_seconds"], wait_seconds)
+            metrics["in_use"] += 1
+            metrics["peak_in_use"] = max(metrics["peak_in_use"], metrics["in_use"])
+        return connection
+
+    def putconn(self, connection):
+        """
+        Return a borrowed connection to the pool
+
+        Args:
+            connection: Connection obtained from getconn
+        """
+        try:
+            broken = connection.closed or connection.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN
+            if not broken and connection.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            if broken:
+                self._last_used.pop(id(connection), None)
+            else:
+                self._last_used[id(connection)] = time.monotonic()
+            self._pool.putconn(connection, close=broken)
+        except Exception as e:
+            logger.error(f"Error returning connection to pool: {e}")
+        finally:
+            with self._lock:
+                self._metrics["in_use"] -= 1
+            self._slots.release()
+
+    def stats(self):
+        """
+        Get pool metrics
+
+        Returns:
+            dict: Checkout counts, wait times and saturation figures
+        """
+        with self._lock:
+            metrics = dict(self._metrics)
+        checkouts = metrics["checkouts"] or 1
+        metrics["max_size"] = self.max_size
+        metrics["avg_wait_seconds"] = metrics["total_wait_seconds"] / checkouts
+        metrics["saturation"] = metrics["in_use"] / self.max_size
+        metrics["wait_ratio"] = metrics["waits"] / checkouts
+        return metrics
+
+    def closeall(self):
+        """Close every connection in the pool"""
+        self._pool.closeall()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(db_params):
+    """
+    Get the process-wide connection pool, creating it on first use
+
+    Args:
+        db_params (dict): psycopg2.connect keyword arguments
+
+    Returns:
+        ConnectionPool: The shared pool
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(db_params)
+    return _pool
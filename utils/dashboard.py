@@ -0,0 +1,93 @@
+"""
+Dashboard module for displaying document statistics
+Everything is read from the daily rollup, so the page costs the same for any
+archive size
+"""
+import streamlit as st
+from utils.database import get_document_stats
+from utils.localization import get_ui_text
+import pandas as pd
+from datetime import date, timedelta
+
+# Days shown when the page opens
+DEFAULT_STATS_DAYS = 90
+
+# Risk levels in display order
+RISK_LEVEL_ORDER = ["High", "Medium", "Low", "Unknown"]
+
+def display_stats_page(ui_language):
+    """
+    Display document statistics page
+
+    Args:
+        ui_language (str): Current UI language
+    """
+    st.title(get_ui_text("stats_title", ui_language))
+    st.write(get_ui_text("stats_description", ui_language))
+
+    today = date.today()
+    date_range = st.date_input(
+        get_ui_text("stats_period", ui_language),
+        value=(today - timedelta(days=DEFAULT_STATS_DAYS), today)
+    )
+    if len(date_range) != 2:
+        return
+    date_from, date_to = date_range
+
+    totals = get_document_stats(date_from=date_from, date_to=date_to)
+    if not totals:
+        st.info(get_ui_text("no_stats", ui_language))
+        return
+    total = totals[0]
+
+    metric_col1, metric_col2, metric_col3 = st.columns(3)
+    with metric_col1:
+        st.metric(get_ui_text("total_documents", ui_language), f"{total['documents']:,}")
+    with metric_col2:
+        st.metric(get_ui_text("total_size_mb", ui_language), f"{total['total_size_kb'] / 1024:,.1f}")
+    with metric_col3:
+        st.metric(
+            get_ui_text("average_length", ui_language),
+            f"{total['total_length'] / total['documents']:,.0f}"
+        )
+
+    # Documents per day, stacked by risk level
+    st.subheader(get_ui_text("documents_per_day", ui_language))
+    daily = pd.DataFrame(get_document_stats(
+        group_by=["risk_level"], by_day=True, date_from=date_from, date_to=date_to
+    ))
+    if not daily.empty:
+        per_day = daily.pivot_table(index="day", columns="risk_level", values="documents",
+                                    aggfunc="sum", fill_value=0)
+        per_day = per_day.reindex(pd.date_range(date_from, date_to).date, fill_value=0)
+        per_day = per_day[[level for level in RISK_LEVEL_ORDER if level in per_day.columns]]
+        st.bar_chart(per_day)
+
+    breakdowns = [
+        ("risk_level", "by_risk_level"),
+        ("document_language", "by_language"),
+        ("privacy_level", "by_privacy_level"),
+    ]
+    for column, (dimension, title_key) in zip(st.columns(len(breakdowns)), breakdowns):
+        with column:
+            st.subheader(get_ui_text(title_key, ui_language))
+            breakdown = pd.DataFrame(get_document_stats(
+                group_by=[dimension], date_from=date_from, date_to=date_to
+            ))
+            if breakdown.empty:
+                continue
+            breakdown = breakdown.sort_values("documents", ascending=False)
+            breakdown[dimension] = breakdown[dimension].str.capitalize()
+            st.dataframe(
+                breakdown[[dimension, "documents"]],
+                column_config={
+                    dimension: st.column_config.TextColumn(
+                        get_ui_text(dimension if dimension != "document_language" else "language", ui_language)
+                    ),
+                    "documents": st.column_config.NumberColumn(
+                        get_ui_text("total_documents", ui_language)
+                    )
+                },
+                hide_index=True,
+                use_container_width=True
+            )
@@ -4,10 +4,21 @@ with encryption support for enhanced privacy
 """
 import os
 import psycopg2
-from psycopg2 import sql
+from psycopg2 import sql, errors
 from psycopg2.extras import RealDictCursor
+import base64
+import contextlib
+import functools
+import hashlib
 import logging
-from utils.encryption import DocumentEncryption, anonymize_text, generate_document_token
+import re
+import threading
+from collections.abc import Mapping
+from utils.connection_pool import get_pool
+from utils.migrations import get_pending_versions
+from utils.encryption import DocumentEncryption, BlindIndex, anonymize_text, generate_document_token
+from utils import storage_codec
+from utils.risk_assessment import format_risk_factor, RISK_FACTOR_KINDS
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -16,6 +27,88 @@ logger = logging.getLogger(__name__)
 # Initialize encryption
 encryption = DocumentEncryption()
 
+# Keyed token digests that make encrypted documents searchable
+blind_index = BlindIndex()
+
+# Storage backend: "postgres" (default) or "sqlite" for single-node deployments
+# and tests
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "postgres").lower()
+
+# Functions a storage backend implements. The Postgres implementations are in
+# this module and utils/sqlite_store.py provides the SQLite ones; everything
+# else here is written on top of them and works with either.
+BACKEND_FUNCTIONS = [
+    "get_connection",
+    "release_connection",
+    "get_pool_stats",
+    "ensure_schema",
+    "save_document_history_batch",
+    "write_prepared_documents",
+    "allocate_ids",
+    "find_duplicate_document",
+    "get_saved_summary",
+    "save_document_summary",
+    "write_summaries",
+    "list_documents",
+    "get_document_with_risk_factors",
+    "load_document_details",
+    "get_document_text",
+    "open_document_text",
+    "get_document_summaries",
+    "get_privacy_settings",
+    "update_privacy_settings",
+    "delete_documents",
+    "find_documents_with_risk_factor",
+    "count_expired_documents",
+    "delete_expired_documents",
+    "create_future_partitions",
+    "drop_expired_partitions",
+    "record_retention_run",
+    "get_retention_runs",
+    "get_document_stats",
+    "iter_export_batches",
+    "copy_export_csv",
+    "search_documents",
+    "search_encrypted_documents",
+]
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def _storage_backend():
+    """Get the module implementing BACKEND_FUNCTIONS, or None for the Postgres implementations here"""
+    global _backend
+    if STORAGE_BACKEND != "sqlite":
+        return None
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                from utils import sqlite_store
+                missing = [name for name in BACKEND_FUNCTIONS if not callable(getattr(sqlite_store, name, None))]
+                if missing:
+                    raise RuntimeError(f"The {STORAGE_BACKEND} backend does not implement {', '.join(missing)}")
+                _backend = sqlite_store
+    return _backend
+
+def _backend_function(function):
+    """Run the selected backend's implementation of a function of BACKEND_FUNCTIONS"""
+    @functools.wraps(function)
+    def dispatch(*args, **kwargs):
+        backend = _storage_backend()
+        if backend is None:
+            return function(*args, **kwargs)
+        return getattr(backend, function.__name__)(*args, **kwargs)
+    return dispatch
+
+def _postgres_only(function):
+    """Refuse to run a Postgres maintenance function on another backend"""
+    @functools.wraps(function)
+    def check(*args, **kwargs):
+        if _storage_backend() is not None:
+            raise RuntimeError(f"{function.__name__} needs the Postgres storage backend (STORAGE_BACKEND={STORAGE_BACKEND})")
+        return function(*args, **kwargs)
+    return check
+
 # Database connection parameters from environment variables
 DB_PARAMS = {
     "dbname": os.environ.get("PGDATABASE"),
@@ -25,41 +118,591 @@ DB_PARAMS = {
     "port": os.environ.get("PGPORT")
 }
 
+@_backend_function
 def get_connection():
     """
-    Get a connection to the database
+    Borrow a connection from the process-wide pool
+    
+    The connection must be handed back with release_connection.
     
     Returns:
-        connection: psycopg2 connection object
+        connection: psycopg2 connection object or None if unavailable
     """
     try:
-        connection = psycopg2.connect(**DB_PARAMS)
-        return connection
+        return get_pool(DB_PARAMS).getconn()
     except Exception as e:
         logger.error(f"Database connection error: {e}")
         return None
 
+@_backend_function
+def release_connection(connection):
+    """
+    Return a borrowed connection to the pool
+    
+    Args:
+        connection: Connection obtained from get_connection
+    """
+    try:
+        get_pool(DB_PARAMS).putconn(connection)
+    except Exception as e:
+        logger.error(f"Error releasing database connection: {e}")
+
+@_backend_function
+def get_pool_stats():
+    """
+    Get connection pool metrics (wait times, saturation, checkouts)
+    
+    Returns:
+        dict: Pool metrics or an empty dict if the pool could not be created
+    """
+    try:
+        return get_pool(DB_PARAMS).stats()
+    except Exception as e:
+        logger.error(f"Error getting pool stats: {e}")
+        return {}
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+@_backend_function
+def ensure_schema():
+    """
+    Check that every schema migration has been applied
+    
+    Migrations are applied by the deploy step (python -m utils.migrations
+    migrate), never here: backfills would run under the pool's statement
+    timeout and hold up the first request. Succeeds once per process.
+    
+    Returns:
+        bool: True if the schema is up to date
+    """
+    global _schema_ready
+    if _schema_ready:
+        return True
+        
+    with _schema_lock:
+        if _schema_ready:
+            return True
+            
+        connection = get_connection()
+        if not connection:
+            return False
+            
+        try:
+            pending = get_pending_versions(connection)
+            if pending:
+                logger.error(
+                    f"Schema migrations {pending} are not applied; run python -m utils.migrations migrate"
+                )
+                return False
+            _schema_ready = True
+            return True
+        except Exception as e:
+            logger.error(f"Error checking schema migrations: {e}")
+            return False
+        finally:
+            release_connection(connection)
+
+def _risk_factor_row(factor, anonymize=False):
+    """
+    Build the column values of a risk_factors row from a risk factor record or legacy text
+    
+    Args:
+        factor (dict or str): Risk factor record from assess_risk_level or plain text
+        anonymize (bool): Whether to anonymize the display text
+        
+    Returns:
+        tuple: (risk_factor, category, term, occurrence_count, pattern_id, start_offset, end_offset)
+    """
+    text = format_risk_factor(factor)
+    if anonymize:
+        text = anonymize_text(text)
+        
+    if isinstance(factor, str):
+        return (text, None, None, None, None, None, None)
+        
+    return (
+        text, factor.get("kind"), factor.get("term"), factor.get("count"),
+        factor.get("pattern_id"), factor.get("start_offset"), factor.get("end_offset")
+    )
+
+def _content_key(document_text, is_encrypted, access_token):
+    """
+    Get the unique key of a document body in document_contents
+    
+    Unencrypted bodies are keyed by the SHA-256 of their text so identical uploads
+    share one row. Encrypted bodies are never deduplicated, since that would reveal
+    that two protected documents are equal; they are keyed by the access token.
+    
+    Returns:
+        str: Content key or None if there is no body
+    """
+    if not document_text:
+        return None
+    if is_encrypted:
+        return f"token:{access_token}"
+    return "sha256:" + hashlib.sha256(document_text.encode('utf-8')).hexdigest()
+
+def _encode_legacy_text(legacy_text, is_encrypted):
+    """
+    Convert a value of an older text column to the storage_codec format
+    
+    Args:
+        legacy_text (str): Plain text, or a base64 Fernet token if is_encrypted
+        is_encrypted (bool): Whether the text is encrypted
+        
+    Returns:
+        tuple: (plain text, encoded bytes)
+        
+    Raises:
+        cryptography.fernet.InvalidToken: If the text cannot be decrypted
+    """
+    if is_encrypted:
+        # DocumentEncryption.encrypt base64-encodes the Fernet token a second time
+        token = base64.urlsafe_b64decode(base64.urlsafe_b64decode(legacy_text))
+        text = encryption.decrypt_bytes(token).decode('utf-8')
+        return text, storage_codec.encode(text, encryption)
+    return legacy_text, storage_codec.encode(legacy_text)
+
+def _decode_stored_text(data, legacy_text, is_encrypted):
+    """
+    Decode a body or summary from either storage format
+    
+    Args:
+        data (bytes): Value of the bytea column written by storage_codec, if any
+        legacy_text (str): Value of the older text column
+        is_encrypted (bool): Whether the legacy text is a base64 Fernet token
+        
+    Returns:
+        str: Plain text or None
+    """
+    if data is not None:
+        return storage_codec.decode(data, encryption)
+    if legacy_text and is_encrypted:
+        return encryption.decrypt(legacy_text)
+    return legacy_text
+
+# Characters of a body or summary indexed for full-text search; tsvector values
+# are limited to 1 MB
+SEARCH_TEXT_LIMIT = 200000
+
+def _search_text(text):
+    """Get the part of a text that is indexed for full-text search"""
+    if not text:
+        return None
+    return text[:SEARCH_TEXT_LIMIT]
+
+def _prepare_document(filename, file_size_kb, document_language, risk_level, content_length,
+                      risk_factors=None, document_text=None, privacy_level='standard',
+                      content_hash=None, replace_duplicate=False, document_id=None):
+    """
+    Apply encryption and anonymization and derive privacy settings for one document
+    
+    Returns:
+        dict: Column values for document_history, risk_factors and privacy_settings
+    """
+    # Compress, and encrypt if the privacy level requires it
+    is_encrypted = bool(document_text) and privacy_level in ['enhanced', 'maximum']
+    stored_body = storage_codec.encode(document_text, encryption if is_encrypted else None)
+    
+    # Generate access token for document retrieval
+    access_token = generate_document_token()
+    
+    return {
+        "id": document_id,
+        "filename": filename,
+        "file_size_kb": file_size_kb,
+        "document_language": document_language,
+        "risk_level": risk_level,
+        "content_length": content_length,
+        "body": stored_body,
+        "is_encrypted": is_encrypted,
+        "content_key": _content_key(document_text, is_encrypted, access_token),
+        "access_token": access_token,
+        "privacy_level": privacy_level,
+        "content_hash": content_hash,
+        "replace_duplicate": bool(content_hash) and replace_duplicate,
+        # Apply text anonymization for maximum privacy level
+        "risk_factors": [
+            _risk_factor_row(factor, anonymize=privacy_level == 'maximum')
+            for factor in (risk_factors or [])
+        ],
+        "retention_days": 7 if privacy_level == 'maximum' else 30,
+        "anonymize_text": privacy_level == 'maximum',
+        "encrypt_storage": privacy_level in ['enhanced', 'maximum'],
+        # Only standard-privacy text is indexed for full-text search;
+        # encrypted text is searchable through the blind index
+        "search_text": _search_text(document_text) if not is_encrypted else None,
+        "blind_hashes": blind_index.text_hashes(document_text) if is_encrypted else [],
+    }
+
+# Inserts documents, their risk factors and privacy settings in one statement.
+# Rows are matched across the CTEs by their freshly generated access token.
+INSERT_DOCUMENTS_SQL = """
+    WITH input AS (
+        SELECT *
+        FROM unnest(%(filename)s::text[], %(file_size_kb)s::float8[], %(document_language)s::text[],
+                    %(risk_level)s::text[], %(content_length)s::int[], %(content_key)s::text[],
+                    %(is_encrypted)s::boolean[], %(access_token)s::text[], %(privacy_level)s::text[],
+                    %(retention_days)s::int[], %(anonymize_text)s::boolean[], %(encrypt_storage)s::boolean[],
+                    %(search_text)s::text[], %(content_hash)s::text[], %(id)s::int[])
+             WITH ORDINALITY AS t(filename, file_size_kb, document_language, risk_level, content_length,
+                                  content_key, is_encrypted, access_token, privacy_level,
+                                  retention_days, anonymize_text, encrypt_storage, search_text,
+                                  content_hash, id, ord)
+    ),
+    contents AS (
+        -- Bodies live in document_contents; the no-op update lets RETURNING
+        -- report the id of an existing identical body
+        INSERT INTO document_contents (content_key, body, is_encrypted)
+        SELECT *
+        FROM unnest(%(body_key)s::text[], %(body_data)s::bytea[], %(body_encrypted)s::boolean[])
+        ON CONFLICT (content_key) DO UPDATE SET content_key = EXCLUDED.content_key
+        RETURNING id, content_key
+    ),
+    doc AS (
+        INSERT INTO document_history
+        (id, filename, file_size_kb, document_language, risk_level, content_length,
+         content_id, is_encrypted, access_token, privacy_level, content_hash)
+        SELECT COALESCE(input.id, nextval(pg_get_serial_sequence('document_history', 'id'))),
+               input.filename, input.file_size_kb, input.document_language, input.risk_level,
+               input.content_length, contents.id, input.is_encrypted, input.access_token,
+               input.privacy_level, input.content_hash
+        FROM input
+        LEFT JOIN contents ON contents.content_key = input.content_key
+        -- A pre-allocated id that already exists was written by an earlier
+        -- attempt. Checked explicitly: a partitioned document_history has no
+        -- unique index on id alone for ON CONFLICT to use.
+        WHERE NOT EXISTS (SELECT 1 FROM document_history e WHERE e.id = input.id)
+        ORDER BY input.ord
+        RETURNING id, access_token
+    ),
+    factors AS (
+        INSERT INTO risk_factors
+        (document_id, risk_factor, category, term, occurrence_count, pattern_id, start_offset, end_offset)
+        SELECT doc.id, f.risk_factor, f.category, f.term, f.occurrence_count, f.pattern_id,
+               f.start_offset, f.end_offset
+        FROM unnest(%(factor_token)s::text[], %(factor_text)s::text[], %(factor_category)s::text[],
+                    %(factor_term)s::text[], %(factor_count)s::int[], %(factor_pattern_id)s::smallint[],
+                    %(factor_start)s::int[], %(factor_end)s::int[])
+             AS f(access_token, risk_factor, category, term, occurrence_count, pattern_id,
+                  start_offset, end_offset)
+        JOIN doc ON doc.access_token = f.access_token
+    ),
+    privacy AS (
+        INSERT INTO privacy_settings
+        (document_id, privacy_level, retention_days, anonymize_text, encrypt_storage, access_token)
+        SELECT doc.id, input.privacy_level, input.retention_days, input.anonymize_text,
+               input.encrypt_storage, input.access_token
+        FROM doc
+        JOIN input ON input.access_token = doc.access_token
+    ),
+    search AS (
+        -- Filename and risk factor vectors are added by triggers at the end of the statement
+        INSERT INTO document_search (document_id, config, content_vector)
+        SELECT doc.id, document_search_config(input.document_language),
+               to_tsvector(document_search_config(input.document_language), input.search_text)
+        FROM doc
+        JOIN input ON input.access_token = doc.access_token
+        WHERE input.search_text IS NOT NULL
+        ON CONFLICT (document_id) DO UPDATE SET content_vector = EXCLUDED.content_vector
+    ),
+    blind AS (
+        INSERT INTO document_blind_index (document_id, term_hash)
+        SELECT doc.id, b.term_hash
+        FROM unnest(%(blind_token)s::text[], %(blind_hash)s::bytea[]) AS b(access_token, term_hash)
+        JOIN doc ON doc.access_token = b.access_token
+    )
+    SELECT COALESCE(doc.id, input.id)
+    FROM input
+    LEFT JOIN doc ON doc.access_token = input.access_token
+    ORDER BY input.ord
+"""
+
+# Maximum number of documents written per statement by save_document_history_batch
+BATCH_INSERT_SIZE = 500
+
+def _insert_documents(cursor, documents):
+    """
+    Insert prepared documents with their risk factors and privacy settings in one round trip
+    
+    Documents with replace_duplicate first clear the content hash of the
+    earlier document in a separate statement, so the cursor must be in a
+    transaction when any are present (see _write_prepared).
+    
+    Args:
+        cursor: Database cursor
+        documents (list): Dicts from _prepare_document
+        
+    Returns:
+        list: Created document IDs in input order
+    """
+    columns = ["id", "filename", "file_size_kb", "document_language", "risk_level", "content_length",
+               "content_key", "is_encrypted", "access_token", "privacy_level",
+               "retention_days", "anonymize_text", "encrypt_storage", "search_text", "content_hash"]
+    params = {column: [document[column] for document in documents] for column in columns}
+    
+    # A forced reprocess takes over the content hash from the earlier document
+    replaced = [document for document in documents if document["replace_duplicate"]]
+    if replaced:
+        cursor.execute("""
+            UPDATE document_history d
+            SET content_hash = NULL
+            FROM unnest(%s::text[], %s::text[], %s::int[]) AS r(privacy_level, content_hash, id)
+            WHERE d.privacy_level = r.privacy_level AND d.content_hash = r.content_hash
+              AND d.id IS DISTINCT FROM r.id
+        """, ([document["privacy_level"] for document in replaced],
+              [document["content_hash"] for document in replaced],
+              [document["id"] for document in replaced]))
+    
+    # One document_contents row per distinct body in the batch
+    bodies = {}
+    for document in documents:
+        if document["content_key"] and document["content_key"] not in bodies:
+            bodies[document["content_key"]] = (document["body"], document["is_encrypted"])
+    params["body_key"] = list(bodies)
+    params["body_data"] = [body for body, _ in bodies.values()]
+    params["body_encrypted"] = [is_encrypted for _, is_encrypted in bodies.values()]
+    
+    factor_columns = ["factor_text", "factor_category", "factor_term", "factor_count",
+                      "factor_pattern_id", "factor_start", "factor_end"]
+    params["factor_token"] = []
+    for column in factor_columns:
+        params[column] = []
+    for document in documents:
+        for row in document["risk_factors"]:
+            params["factor_token"].append(document["access_token"])
+            for column, value in zip(factor_columns, row):
+                params[column].append(value)
+    
+    params["blind_token"] = []
+    params["blind_hash"] = []
+    for document in documents:
+        params["blind_token"].extend([document["access_token"]] * len(document["blind_hashes"]))
+        params["blind_hash"].extend(document["blind_hashes"])
+    
+    cursor.execute(INSERT_DOCUMENTS_SQL, params)
+    return [row[0] for row in cursor.fetchall()]
+
 def save_document_history(filename, file_size_kb, document_language, risk_level, content_length, 
-                         risk_factors=None, document_text=None, privacy_level='standard'):
+                         risk_factors=None, document_text=None, privacy_level='standard',
+                         content_hash=None, replace_duplicate=False):
     """
     Save document history to the database with encryption support
     
+    The document, its risk factors and privacy settings are written by a single
+    statement in one server round trip. With replace_duplicate the earlier
+    document's content hash is cleared first, in the same transaction.
+    
     Args:
         filename (str): Name of the uploaded file
         file_size_kb (float): Size of the file in KB
         document_language (str): Detected language of the document
         risk_level (str): Assessed risk level (Low, Medium, High)
         content_length (int): Number of characters in the document
-        risk_factors (list, optional): List of identified risk factors
+        risk_factors (list, optional): Risk factor records from assess_risk_level (or plain text)
         document_text (str, optional): The full document text (will be encrypted if privacy_level requires)
         privacy_level (str): Privacy level ('standard', 'enhanced', 'maximum')
+        content_hash (str, optional): compute_content_hash of the uploaded file
+        replace_duplicate (bool): Make this document the one reused for its content
+                                  hash instead of an earlier analysis
         
     Returns:
         int: ID of the created record or None if failed
     """
-    if risk_factors is None:
-        risk_factors = []
+    document_ids = save_document_history_batch([{
+        "filename": filename,
+        "file_size_kb": file_size_kb,
+        "document_language": document_language,
+        "risk_level": risk_level,
+        "content_length": content_length,
+        "risk_factors": risk_factors,
+        "document_text": document_text,
+        "privacy_level": privacy_level,
+        "content_hash": content_hash,
+        "replace_duplicate": replace_duplicate,
+    }])
+    return document_ids[0] if document_ids else None
+
+@_backend_function
+def save_document_history_batch(documents):
+    """
+    Save many analysed documents for bulk ingestion
+    
+    Each group of up to BATCH_INSERT_SIZE documents is written by one statement.
+    A single group runs in autocommit mode, since one statement is already atomic,
+    which saves the COMMIT round trip. Larger batches, and batches that take over
+    a content hash with replace_duplicate, run in one transaction so either every
+    change is saved or none is.
+    
+    Args:
+        documents (list): Dicts with the keyword arguments of save_document_history
+        
+    Returns:
+        list: Created document IDs in input order, or None if failed
+    """
+    if not documents:
+        return []
+        
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return None
+        
+    try:
+        return _write_prepared(connection, prepare_documents(documents))
+    except Exception as e:
+        logger.error(f"Error saving document history: {e}")
+        return None
+    finally:
+        release_connection(connection)
+
+def prepare_documents(documents):
+    """
+    Encrypt, compress and index documents ahead of writing them
+    
+    The result only holds what is stored, so it can be queued or journaled
+    without exposing the plain text of encrypted documents.
+    
+    Args:
+        documents (list): Dicts with the keyword arguments of save_document_history,
+                          optionally with a pre-allocated document_id
+        
+    Returns:
+        list: Prepared documents for write_prepared_documents
+    """
+    return [_prepare_document(**document) for document in documents]
+
+def _write_prepared(connection, prepared):
+    """Insert prepared documents on a borrowed connection"""
+    # Taking over a content hash needs a second statement, which must commit with the insert
+    replacing = any(document["replace_duplicate"] for document in prepared)
+    if len(prepared) <= BATCH_INSERT_SIZE and not replacing:
+        connection.autocommit = True
+        try:
+            with connection.cursor() as cursor:
+                return _insert_documents(cursor, prepared)
+        finally:
+            connection.autocommit = False
+    
+    document_ids = []
+    with connection:
+        with connection.cursor() as cursor:
+            for start in range(0, len(prepared), BATCH_INSERT_SIZE):
+                document_ids.extend(_insert_documents(cursor, prepared[start:start + BATCH_INSERT_SIZE]))
+    return document_ids
+
+@_backend_function
+def write_prepared_documents(prepared):
+    """
+    Write documents from prepare_documents, raising on failure
+    
+    Documents with a pre-allocated id that is already stored are skipped, so a
+    retried write is safe.
+    
+    Args:
+        prepared (list): Prepared documents
+        
+    Returns:
+        list: Document IDs in input order
+        
+    Raises:
+        psycopg2.Error: If the database is unavailable or the write fails
+    """
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        raise psycopg2.OperationalError("No database connection available")
+        
+    try:
+        return _write_prepared(connection, prepared)
+    finally:
+        release_connection(connection)
+
+def compute_content_hash(data):
+    """
+    Get the deduplication hash of an uploaded file
+    
+    Args:
+        data (bytes): File content
+        
+    Returns:
+        str: Keyed fingerprint (see BlindIndex.fingerprint)
+    """
+    return blind_index.fingerprint(data)
+
+@_backend_function
+def find_duplicate_document(content_hash, privacy_level='standard'):
+    """
+    Find the earlier analysis of an identical upload
+    
+    Args:
+        content_hash (str): compute_content_hash of the uploaded file
+        privacy_level (str): Privacy level of the new upload; analyses are only
+                             reused within the same privacy level
+        
+    Returns:
+        dict: id, document_language, risk_level and risk_factors (records as
+              returned by assess_risk_level) of the earlier document, or None
+    """
+    if not content_hash:
+        return None
+        
+    connection = get_connection()
+    if not connection:
+        return None
+        
+    try:
+        with connection:
+            with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute("""
+                    SELECT d.id, d.document_language, d.risk_level,
+                           COALESCE(
+                               (SELECT json_agg(json_build_object(
+                                           'risk_factor', r.risk_factor, 'kind', r.category,
+                                           'term', r.term, 'count', r.occurrence_count,
+                                           'pattern_id', r.pattern_id, 'start_offset', r.start_offset,
+                                           'end_offset', r.end_offset
+                                       ) ORDER BY r.id)
+                                FROM risk_factors r WHERE r.document_id = d.id),
+                               '[]'::json
+                           ) AS risk_factors
+                    FROM document_history d
+                    WHERE d.privacy_level = %s AND d.content_hash = %s
+                    ORDER BY d.id DESC
+                    LIMIT 1
+                """, (privacy_level, content_hash))
+                document = cursor.fetchone()
+    except Exception as e:
+        logger.error(f"Error finding duplicate document: {e}")
+        return None
+    finally:
+        release_connection(connection)
+        
+    if not document:
+        return None
+        
+    # Rows stored before risk factors were structured only have their text
+    factors = []
+    for factor in document['risk_factors']:
+        text = factor.pop('risk_factor')
+        factors.append(factor if factor['kind'] in RISK_FACTOR_KINDS else text)
+    document['risk_factors'] = factors
+    return document
+
+@_backend_function
+def get_saved_summary(document_id, detail_level, language="english"):
+    """
+    Get the latest stored summary of a document, decrypting if necessary
+    
+    Args:
+        document_id (int): ID of the document
+        detail_level (str): Level of detail (simple or detailed)
+        language (str): Language of the summary
         
+    Returns:
+        str: Summary text or None if there is none
+    """
     connection = get_connection()
     if not connection:
         return None
@@ -67,71 +710,91 @@ def save_document_history(filename, file_size_kb, document_language, risk_level,
     try:
         with connection:
             with connection.cursor() as cursor:
-                # Generate access token for document retrieval
-                access_token = generate_document_token()
-                is_encrypted = False
-            
-                # Encrypt document text if provided and privacy level requires it
-                encrypted_document_text = None
-                if document_text and privacy_level in ['enhanced', 'maximum']:
-                    encrypted_document_text = encryption.encrypt(document_text)
-                    is_encrypted = True
-                elif document_text:
-                    encrypted_document_text = document_text  # Store unencrypted
-                
-                # Apply text anonymization for maximum privacy level
-                anonymized_factors = risk_factors.copy()
-                if privacy_level == 'maximum' and risk_factors:
-                    anonymized_factors = []
-                    for factor in risk_factors:
-                        anonymized_factors.append(anonymize_text(factor))
-                
-                # Insert document history with encryption fields
-                cursor.execute(
-                    """
-                    INSERT INTO document_history 
-                    (filename, file_size_kb, document_language, risk_level, content_length, 
-                     document_text, is_encrypted, access_token, privacy_level)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id
-                    """,
-                    (filename, file_size_kb, document_language, risk_level, content_length,
-                     encrypted_document_text, is_encrypted, access_token, privacy_level)
-                )
-                document_id = cursor.fetchone()[0]
-                
-                # Insert risk factors if any
-                if anonymized_factors:
-                    for factor in anonymized_factors:
-                        cursor.execute(
-                            """
-                            INSERT INTO risk_factors (document_id, risk_factor)
-                            VALUES (%s, %s)
-                            """,
-                            (document_id, factor)
-                        )
-                
-                # Save privacy settings
-                retention_days = 7 if privacy_level == 'maximum' else 30
-                anonymize = True if privacy_level == 'maximum' else False
-                encrypt_storage = True if privacy_level in ['enhanced', 'maximum'] else False
-                
-                cursor.execute(
-                    """
-                    INSERT INTO privacy_settings
-                    (document_id, privacy_level, retention_days, anonymize_text, encrypt_storage, access_token)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    """, 
-                    (document_id, privacy_level, retention_days, anonymize, encrypt_storage, access_token)
-                )
-                
-                return document_id
+                cursor.execute("""
+                    SELECT summary_data, summary_text, is_encrypted
+                    FROM document_summaries
+                    WHERE document_id = %s AND detail_level = %s AND language = %s
+                    ORDER BY generation_date DESC
+                    LIMIT 1
+                """, (document_id, detail_level, language))
+                result = cursor.fetchone()
+                if not result:
+                    return None
+                return _decode_stored_text(*result)
     except Exception as e:
-        logger.error(f"Error saving document history: {e}")
+        logger.error(f"Error getting saved summary: {e}")
         return None
     finally:
-        connection.close()
+        release_connection(connection)
+
+def _write_summary(cursor, document_id, summary_text, detail_level, language, summary_id=None):
+    """
+    Insert one summary within the caller's transaction
+    
+    Writing the same summary_id twice is a no-op, so retried writes are safe.
+    
+    Returns:
+        int: ID of the summary or None if the document does not exist
+    """
+    # Check document's privacy level
+    cursor.execute(
+        """
+        SELECT privacy_level FROM document_history
+        WHERE id = %s
+        """,
+        (document_id,)
+    )
+    
+    result = cursor.fetchone()
+    if not result:
+        return None
+    
+    privacy_level = result[0] if result[0] else 'standard'
+    
+    # Compress, and encrypt if the privacy level requires it
+    is_encrypted = privacy_level in ['enhanced', 'maximum']
+    summary_data = storage_codec.encode(summary_text, encryption if is_encrypted else None)
+    
+    cursor.execute(
+        """
+        INSERT INTO document_summaries 
+        (id, document_id, summary_data, detail_level, language, is_encrypted)
+        VALUES (COALESCE(%s, nextval(pg_get_serial_sequence('document_summaries', 'id'))), %s, %s, %s, %s, %s)
+        ON CONFLICT (id) DO NOTHING
+        RETURNING id
+        """,
+        (summary_id, document_id, summary_data, detail_level, language, is_encrypted)
+    )
+    inserted = cursor.fetchone()
+    if not inserted:
+        # Already written by an earlier attempt
+        return summary_id
+    
+    # Standard-privacy summaries are searchable alongside the body,
+    # encrypted ones through the blind index
+    if is_encrypted:
+        cursor.execute(
+            """
+            INSERT INTO document_blind_index (document_id, term_hash)
+            SELECT %s, unnest(%s::bytea[])
+            ON CONFLICT DO NOTHING
+            """,
+            (document_id, blind_index.text_hashes(summary_text))
+        )
+    else:
+        cursor.execute(
+            """
+            UPDATE document_search
+            SET content_vector = COALESCE(content_vector, '') || to_tsvector(config, %s)
+            WHERE document_id = %s
+            """,
+            (_search_text(summary_text), document_id)
+        )
+    
+    return inserted[0]
 
-def save_document_summary(document_id, summary_text, detail_level, language="english"):
+@_backend_function
+def save_document_summary(document_id, summary_text, detail_level, language="english", summary_id=None):
     """
     Save document summary to the database with encryption if needed
     
@@ -140,6 +803,7 @@ def save_document_summary(document_id, summary_text, detail_level, language="eng
         summary_text (str): The generated summary text
         detail_level (str): Level of detail (simple or detailed)
         language (str): Language of the summary
+        summary_id (int, optional): Pre-allocated ID (see allocate_ids)
         
     Returns:
         int: ID of the created summary or None if failed
@@ -151,52 +815,1615 @@ def save_document_summary(document_id, summary_text, detail_level, language="eng
     try:
         with connection:
             with connection.cursor() as cursor:
-                # Check document's privacy level
+                return _write_summary(cursor, document_id, summary_text, detail_level, language, summary_id)
+    except Exception as e:
+        logger.error(f"Error saving document summary: {e}")
+        return None
+    finally:
+        release_connection(connection)
+
+@_backend_function
+def write_summaries(summaries):
+    """
+    Save several summaries in one transaction, raising on failure
+    
+    Used by the write-behind queue, which needs to tell failures apart.
+    
+    Args:
+        summaries (list): Dicts with the keyword arguments of save_document_summary
+        
+    Returns:
+        list: Summary IDs in input order; None for summaries whose document no longer exists
+        
+    Raises:
+        psycopg2.Error: If the database is unavailable or the write fails
+    """
+    connection = get_connection()
+    if not connection:
+        raise psycopg2.OperationalError("No database connection available")
+        
+    try:
+        with connection:
+            with connection.cursor() as cursor:
+                return [_write_summary(cursor, **summary) for summary in summaries]
+    finally:
+        release_connection(connection)
+
+@_backend_function
+def allocate_ids(table, count):
+    """
+    Reserve IDs from a table's sequence ahead of inserting rows
+    
+    Args:
+        table (str): document_history or document_summaries
+        count (int): Number of IDs to reserve
+        
+    Returns:
+        list: Reserved IDs, or an empty list if the database is unavailable
+    """
+    connection = get_connection()
+    if not connection:
+        return []
+        
+    try:
+        with connection:
+            with connection.cursor() as cursor:
                 cursor.execute(
-                    """
-                    SELECT privacy_level FROM document_history
-                    WHERE id = %s
-                    """,
-                    (document_id,)
+                    "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                    (table, count)
                 )
-                
-                result = cursor.fetchone()
-                if not result:
-                    return None
-                
-                privacy_level = result[0] if result[0] else 'standard'
-                is_encrypted = False
-                encrypted_summary = summary_text
-                
-                # Encrypt summary if privacy level requires it
-                if privacy_level in ['enhanced', 'maximum']:
-                    encrypted_summary = encryption.encrypt(summary_text)
-                    is_encrypted = True
-                
+                return [row[0] for row in cursor.fetchall()]
+    except Exception as e:
+        logger.error(f"Error allocating ids for {table}: {e}")
+        return []
+    finally:
+        release_connection(connection)
+
+# Metadata columns of document_history; document bodies live in document_contents
+DOCUMENT_METADATA_COLUMNS = """id, filename, file_size_kb, document_language, risk_level, content_length,
+    upload_date, is_encrypted, access_token, privacy_level, content_id"""
+
+# Columns needed to render the history list
+HISTORY_LIST_COLUMNS = "id, filename, upload_date, document_language, risk_level, privacy_level, file_size_kb"
+
+def get_recent_documents(limit=10):
+    """
+    Get recent document history
+    
+    Only the list columns are fetched; use get_document_text for the body.
+    
+    Args:
+        limit (int): Maximum number of records to return
+        
+    Returns:
+        list: List of recent document history records
+    """
+    documents, _ = list_documents(limit=limit)
+    return documents
+
+@_backend_function
+def list_documents(limit=20, cursor=None, risk_level=None, language=None, date_from=None, date_to=None):
+    """
+    Get one page of document history using keyset pagination
+    
+    Pages are ordered by (upload_date, id) descending. Pass the returned cursor to
+    get the next page; the cost of a page does not depend on how deep it is.
+    
+    Args:
+        limit (int): Maximum number of records per page
+        cursor (tuple, optional): (upload_date, id) of the last row of the previous page
+        risk_level (str, optional): Only documents with this risk level
+        language (str, optional): Only documents in this language
+        date_from (datetime, optional): Only documents uploaded at or after this time
+        date_to (datetime, optional): Only documents uploaded before this time
+        
+    Returns:
+        tuple: (documents, next_cursor) where next_cursor is None on the last page
+    """
+    connection = get_connection()
+    if not connection:
+        return [], None
+        
+    try:
+        conditions = []
+        params = []
+        
+        if cursor is not None:
+            conditions.append("(upload_date, id) < (%s, %s)")
+            params.extend(cursor)
+            
+        if risk_level is not None:
+            conditions.append("risk_level = %s")
+            params.append(risk_level)
+            
+        if language is not None:
+            conditions.append("document_language = %s")
+            params.append(language)
+            
+        if date_from is not None:
+            conditions.append("upload_date >= %s")
+            params.append(date_from)
+            
+        if date_to is not None:
+            conditions.append("upload_date < %s")
+            params.append(date_to)
+            
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        
+        # Fetch one extra row to know whether another page exists
+        params.append(limit + 1)
+        
+        with connection:
+            with connection.cursor(cursor_factory=RealDictCursor) as db_cursor:
+                db_cursor.execute(f"""
+                    SELECT {HISTORY_LIST_COLUMNS}
+                    FROM document_history
+                    {where_clause}
+                    ORDER BY upload_date DESC, id DESC
+                    LIMIT %s
+                """, tuple(params))
+                documents = db_cursor.fetchall()
+                
+        next_cursor = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            next_cursor = (documents[-1]["upload_date"], documents[-1]["id"])
+        return documents, next_cursor
+    except Exception as e:
+        logger.error(f"Error listing documents: {e}")
+        return [], None
+    finally:
+        release_connection(connection)
+
+@_backend_function
+def get_document_with_risk_factors(document_id):
+    """
+    Get document history with its risk factors
+    
+    The document body is not included; use get_document_text to fetch it.
+    
+    Args:
+        document_id (int): ID of the document
+        
+    Returns:
+        dict: Document record with risk factors list
+    """
+    connection = get_connection()
+    if not connection:
+        return None
+        
+    try:
+        with connection:
+            with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                # Get document
+                cursor.execute(
+                    f"""
+                    SELECT {DOCUMENT_METADATA_COLUMNS} FROM document_history
+                    WHERE id = %s
+                    """,
+                    (document_id,)
+                )
+                document = cursor.fetchone()
+                
+                if not document:
+                    return None
+                    
+                # Get risk factors
+                cursor.execute(
+                    """
+                    SELECT risk_factor FROM risk_factors
+                    WHERE document_id = %s
+                    """,
+                    (document_id,)
+                )
+                risk_factors = [row['risk_factor'] for row in cursor.fetchall()]
+                
+                document['risk_factors'] = risk_factors
+                
+                return document
+    except Exception as e:
+        logger.error(f"Error getting document with risk factors: {e}")
+        return None
+    finally:
+        release_connection(connection)
+        
+class LazyRecord(Mapping):
+    """
+    Read-only record whose lazy fields are computed on first access
+    
+    Lazy fields are present as keys from the start, but their values
+    (decrypted text) are only produced when read. Every way of reading a
+    value (get, values, items, dict(record), ==) goes through __getitem__,
+    so it never exposes an unloaded field; membership tests and len() do not
+    load anything.
+    """
+    def __init__(self, values, lazy_fields):
+        self._values = dict(values)
+        self._lazy_fields = dict(lazy_fields)
+        for key in self._lazy_fields:
+            self._values.setdefault(key, None)
+    
+    def __getitem__(self, key):
+        loader = self._lazy_fields.pop(key, None)
+        if loader is not None:
+            self._values[key] = loader()
+        return self._values[key]
+    
+    def __iter__(self):
+        return iter(self._values)
+    
+    def __len__(self):
+        return len(self._values)
+    
+    def __contains__(self, key):
+        return key in self._values
+    
+    def __repr__(self):
+        fields = ", ".join(
+            f"{key!r}: {'<not loaded>' if key in self._lazy_fields else repr(value)}"
+            for key, value in self._values.items()
+        )
+        return f"LazyRecord({{{fields}}})"
+    
+    def is_loaded(self, key):
+        """Check whether a lazy field has been computed"""
+        return key not in self._lazy_fields
+
+def _summary_loader(summary_data, summary_text, is_encrypted):
+    """Build the deferred decoder for one summary's text"""
+    def load():
+        try:
+            data = base64.b64decode(summary_data) if summary_data is not None else None
+            return _decode_stored_text(data, summary_text, is_encrypted)
+        except Exception as e:
+            logger.error(f"Error decrypting summary: {e}")
+            return "[Encrypted content - decryption failed]"
+    return load
+
+# Document metadata with its risk factors, summaries and privacy settings in one row.
+# Summary payloads travel as base64 inside the JSON and are decoded on access.
+DOCUMENT_DETAILS_SQL = f"""
+    SELECT {", ".join("d." + column.strip() for column in DOCUMENT_METADATA_COLUMNS.split(","))},
+           COALESCE(factors.items, '[]'::json) AS risk_factors,
+           COALESCE(summaries.items, '[]'::json) AS summaries,
+           CASE WHEN privacy.document_id IS NULL THEN NULL ELSE to_json(privacy) END AS privacy_settings
+    FROM document_history d
+    LEFT JOIN LATERAL (
+        SELECT json_agg(r.risk_factor ORDER BY r.id) AS items
+        FROM risk_factors r
+        WHERE r.document_id = d.id
+    ) factors ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT json_agg(json_build_object(
+                   'id', s.id,
+                   'detail_level', s.detail_level,
+                   'language', s.language,
+                   'is_encrypted', s.is_encrypted,
+                   'generation_date', s.generation_date,
+                   'summary_text', s.summary_text,
+                   'summary_data', encode(s.summary_data, 'base64')
+               ) ORDER BY s.generation_date DESC) AS items
+        FROM document_summaries s
+        WHERE s.document_id = d.id
+    ) summaries ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT * FROM privacy_settings p
+        WHERE p.document_id = d.id
+        ORDER BY p.id
+        LIMIT 1
+    ) privacy ON TRUE
+    WHERE d.id = %s
+"""
+
+@_backend_function
+def load_document_details(document_id):
+    """
+    Get a document with its risk factors, summaries and privacy settings in one query
+    
+    Summaries are LazyRecords: their summary_text is only decoded and decrypted
+    when it is read. The document body is not included; use get_document_text.
+    
+    Args:
+        document_id (int): ID of the document
+        
+    Returns:
+        dict: Document record with risk_factors (list), summaries (list of
+              LazyRecord, newest first) and privacy_settings (dict or None),
+              or None if not found
+    """
+    connection = get_connection()
+    if not connection:
+        return None
+        
+    try:
+        with connection:
+            with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(DOCUMENT_DETAILS_SQL, (document_id,))
+                document = cursor.fetchone()
+    except Exception as e:
+        logger.error(f"Error loading document details: {e}")
+        return None
+    finally:
+        release_connection(connection)
+        
+    if not document:
+        return None
+        
+    summaries = []
+    for summary in document['summaries']:
+        loader = _summary_loader(summary.pop('summary_data'), summary.pop('summary_text'), summary['is_encrypted'])
+        summaries.append(LazyRecord(summary, {'summary_text': loader}))
+    document['summaries'] = summaries
+    return document
+
+@_backend_function
+def get_document_text(document_id):
+    """
+    Get the full document text, decrypting if necessary
+    
+    Args:
+        document_id (int): ID of the document
+        
+    Returns:
+        str: Decrypted document text or None
+    """
+    connection = get_connection()
+    if not connection:
+        return None
+        
+    try:
+        with connection:
+            with connection.cursor() as cursor:
+                # Bodies not yet moved by migrate_document_bodies are still inline
+                cursor.execute(
+                    """
+                    SELECT c.body,
+                           COALESCE(c.document_text, d.document_text),
+                           COALESCE(c.is_encrypted, d.is_encrypted)
+                    FROM document_history d
+                    LEFT JOIN document_contents c ON c.id = d.content_id
+                    WHERE d.id = %s
+                    """,
+                    (document_id,)
+                )
+                
+                result = cursor.fetchone()
+                if not result or (result[0] is None and not result[1]):
+                    return None
+                    
+                body, document_text, is_encrypted = result
+                
+                # Decode and decrypt if encrypted
+                try:
+                    return _decode_stored_text(body, document_text, is_encrypted)
+                except Exception as e:
+                    logger.error(f"Error decrypting document text: {e}")
+                    return "[Encrypted content - decryption failed]"
+                
+    except Exception as e:
+        logger.error(f"Error getting document text: {e}")
+        return None
+    finally:
+        release_connection(connection)
+
+# Bytes of a stored body read per round trip when it is streamed
+TEXT_SLICE_SIZE = int(os.environ.get("TEXT_SLICE_SIZE", 1 << 20))
+
+# Characters per page of get_document_text_page
+TEXT_PAGE_SIZE = 20000
+
+@_backend_function
+@contextlib.contextmanager
+def open_document_text(document_id, slice_size=TEXT_SLICE_SIZE):
+    """
+    Open the text of a document as a stream of pieces, decrypting if necessary
+    
+    Use as ``with open_document_text(document_id) as pieces:``. The stored body
+    is read in slices through a server-side cursor and decoded as the slices
+    arrive (see storage_codec.iter_decode), so a large body is never held in
+    memory whole. The connection and its transaction are released when the
+    with block ends, however much of the text was read.
+    
+    Args:
+        document_id (int): ID of the document
+        slice_size (int): Bytes of the stored body read per round trip
+        
+    Yields:
+        iterator: Consecutive str pieces of the document text; empty if the
+                  document does not exist
+        
+    Raises:
+        psycopg2.OperationalError: If the database is unavailable
+        ValueError, cryptography.fernet.InvalidToken: If the stored body cannot be decoded
+    """
+    connection = get_connection()
+    if not connection:
+        raise psycopg2.OperationalError("Database unavailable")
+        
+    try:
+        with connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT c.id, octet_length(c.body),
+                           COALESCE(c.document_text, d.document_text),
+                           COALESCE(c.is_encrypted, d.is_encrypted)
+                    FROM document_history d
+                    LEFT JOIN document_contents c ON c.id = d.content_id
+                    WHERE d.id = %s
+                    """,
+                    (document_id,)
+                )
+                row = cursor.fetchone()
+            if not row:
+                yield iter(())
+                return
+            content_id, body_length, legacy_text, is_encrypted = row
+            
+            if body_length is None:
+                # Bodies not yet converted by compress_stored_text are read whole
+                text = _decode_stored_text(None, legacy_text, is_encrypted) or ""
+                yield (text[start:start + slice_size] for start in range(0, len(text), slice_size))
+                return
+            
+            # The scalar subquery runs once per fetched row, so the server
+            # reads each slice only when the cursor reaches it
+            with connection.cursor(name=f"document_text_{document_id}") as cursor:
+                cursor.itersize = 1
+                cursor.execute(
+                    """
+                    SELECT (SELECT substring(body FROM o FOR %(size)s)
+                            FROM document_contents WHERE id = %(content_id)s)
+                    FROM generate_series(1, %(length)s, %(size)s) AS o
+                    """,
+                    {"size": slice_size, "content_id": content_id, "length": body_length}
+                )
+                yield storage_codec.iter_decode((row[0] for row in cursor), encryption)
+    finally:
+        release_connection(connection)
+
+def get_document_text_page(document_id, page=0, page_size=TEXT_PAGE_SIZE):
+    """
+    Get one page of the text of a document
+    
+    The body is streamed up to the end of the page, so memory use is bounded
+    by the page and slice sizes. Later pages decode the body up to their
+    start.
+    
+    Args:
+        document_id (int): ID of the document
+        page (int): Zero-based page number
+        page_size (int): Characters per page
+        
+    Returns:
+        tuple: (text of the page, True if the text continues after it).
+               The text is None if it could not be read.
+    """
+    start = page * page_size
+    end = start + page_size
+    position = 0
+    parts = []
+    has_more = False
+    
+    try:
+        with open_document_text(document_id) as pieces:
+            for piece in pieces:
+                if position >= end:
+                    has_more = True
+                    break
+                if position + len(piece) > start:
+                    parts.append(piece[max(start - position, 0):end - position])
+                position += len(piece)
+                if position > end:
+                    has_more = True
+                    break
+    except Exception as e:
+        logger.error(f"Error reading document text: {e}")
+        return None, False
+        
+    return "".join(parts), has_more
+
+def write_document_text(document_id, output):
+    """
+    Write the text of a document to a binary stream as UTF-8
+    
+    Args:
+        document_id (int): ID of the document
+        output: Writable binary file or stream
+        
+    Returns:
+        int: Number of bytes written
+        
+    Raises:
+        psycopg2.OperationalError: If the database is unavailable
+        ValueError, cryptography.fernet.InvalidToken: If the stored body cannot be decoded
+    """
+    written = 0
+    with open_document_text(document_id) as pieces:
+        for piece in pieces:
+            data = piece.encode("utf-8")
+            output.write(data)
+            written += len(data)
+    return written
+
+@_backend_function
+def get_document_summaries(document_id):
+    """
+    Get all summaries for a document, decrypting if necessary
+    
+    Args:
+        document_id (int): ID of the document
+        
+    Returns:
+        list: List of summary records with decrypted content
+    """
+    connection = get_connection()
+    if not connection:
+        return []
+        
+    try:
+        with connection:
+            with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(
+                    """
+                    SELECT * FROM document_summaries
+                    WHERE document_id = %s
+                    ORDER BY generation_date DESC
+                    """,
+                    (document_id,)
+                )
+                summaries = cursor.fetchall()
+                
+                # Decode both storage formats and decrypt if needed
+                for summary in summaries:
+                    try:
+                        summary['summary_text'] = _decode_stored_text(
+                            summary.pop('summary_data', None), summary.get('summary_text'), summary.get('is_encrypted')
+                        )
+                    except Exception as e:
+                        logger.error(f"Error decrypting summary: {e}")
+                        summary['summary_text'] = "[Encrypted content - decryption failed]"
+                
+                return summaries
+    except Exception as e:
+        logger.error(f"Error getting document summaries: {e}")
+        return []
+    finally:
+        release_connection(connection)
+
+@_backend_function
+def get_privacy_settings(document_id):
+    """
+    Get privacy settings for a document
+    
+    Args:
+        document_id (int): ID of the document
+        
+    Returns:
+        dict: Privacy settings or None if not found
+    """
+    connection = get_connection()
+    if not connection:
+        return None
+        
+    try:
+        with connection:
+            with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(
+                    """
+                    SELECT * FROM privacy_settings
+                    WHERE document_id = %s
+                    """,
+                    (document_id,)
+                )
+                return cursor.fetchone()
+    except Exception as e:
+        logger.error(f"Error getting privacy settings: {e}")
+        return None
+    finally:
+        release_connection(connection)
+
+@_backend_function
+def update_privacy_settings(document_id, privacy_level=None, retention_days=None, 
+                          anonymize_text=None, encrypt_storage=None):
+    """
+    Update privacy settings for a document
+    
+    Args:
+        document_id (int): ID of the document
+        privacy_level (str, optional): Privacy level
+        retention_days (int, optional): Data retention period in days
+        anonymize_text (bool, optional): Whether to anonymize text
+        encrypt_storage (bool, optional): Whether to encrypt storage
+        
+    Returns:
+        bool: Success or failure
+    """
+    connection = get_connection()
+    if not connection:
+        return False
+        
+    try:
+        with connection:
+            with connection.cursor() as cursor:
+                # Only update provided fields
+                update_fields = []
+                params = []
+                
+                if privacy_level is not None:
+                    update_fields.append("privacy_level = %s")
+                    params.append(privacy_level)
+                    
+                if retention_days is not None:
+                    update_fields.append("retention_days = %s")
+                    params.append(retention_days)
+                    
+                if anonymize_text is not None:
+                    update_fields.append("anonymize_text = %s")
+                    params.append(anonymize_text)
+                    
+                if encrypt_storage is not None:
+                    update_fields.append("encrypt_storage = %s")
+                    params.append(encrypt_storage)
+                    
+                if not update_fields:
+                    return False
+                    
+                # Add document_id to params
+                params.append(document_id)
+                
+                cursor.execute(f"""
+                    UPDATE privacy_settings 
+                    SET {', '.join(update_fields)}
+                    WHERE document_id = %s
+                """, tuple(params))
+                
+                # Also update document_history privacy_level if provided
+                if privacy_level is not None:
+                    cursor.execute("""
+                        UPDATE document_history
+                        SET privacy_level = %s
+                        WHERE id = %s
+                    """, (privacy_level, document_id))
+                
+                return True
+    except Exception as e:
+        logger.error(f"Error updating privacy settings: {e}")
+        return False
+    finally:
+        release_connection(connection)
+
+def delete_document_by_token(access_token):
+    """
+    Delete a document and all related data using its access token
+    
+    Args:
+        access_token (str): Document access token
+        
+    Returns:
+        bool: Success or failure
+    """
+    counts = delete_documents(access_tokens=[access_token])
+    return bool(counts) and not counts["error"] and counts["document_history"] > 0
+
+# Tables holding rows that belong to a document, deleted before the document itself
+DOCUMENT_CHILD_TABLES = ["risk_factors", "document_summaries", "privacy_settings"]
+
+# Search indexes of a document, deleted after the document so the risk factor
+# trigger cannot index it again. Their foreign keys used to remove the rows;
+# a partitioned document_history cannot be referenced by foreign keys.
+DOCUMENT_INDEX_TABLES = ["document_search", "document_blind_index"]
+
+def _delete_documents(cursor, document_ids):
+    """
+    Delete documents by id within the caller's transaction
+    
+    Runs one set-based DELETE per table. Bodies no longer referenced by any
+    document are removed as well.
+    
+    Args:
+        cursor: Cursor of an open transaction
+        document_ids (list): IDs of the documents to delete
+        
+    Returns:
+        dict: Number of rows deleted per table
+    """
+    document_ids = list(document_ids)
+    counts = {}
+    for table in DOCUMENT_CHILD_TABLES:
+        cursor.execute(
+            sql.SQL("DELETE FROM {} WHERE document_id = ANY(%s)").format(sql.Identifier(table)),
+            (document_ids,)
+        )
+        counts[table] = cursor.rowcount
+    
+    cursor.execute("""
+        DELETE FROM document_history
+        WHERE id = ANY(%s)
+        RETURNING content_id
+    """, (document_ids,))
+    counts["document_history"] = cursor.rowcount
+    content_ids = list({row[0] for row in cursor.fetchall() if row[0] is not None})
+    
+    for table in DOCUMENT_INDEX_TABLES:
+        cursor.execute(
+            sql.SQL("DELETE FROM {} WHERE document_id = ANY(%s)").format(sql.Identifier(table)),
+            (document_ids,)
+        )
+    
+    cursor.execute("""
+        DELETE FROM document_contents c
+        WHERE c.id = ANY(%s)
+          AND NOT EXISTS (SELECT 1 FROM document_history d WHERE d.content_id = c.id)
+    """, (content_ids,))
+    counts["document_contents"] = cursor.rowcount
+    return counts
+
+@_backend_function
+def delete_documents(access_tokens=None, older_than_days=None, privacy_level=None, batch_size=1000):
+    """
+    Delete many documents and all related data
+    
+    Documents are selected by access token, by filter, or both (tokens that also
+    match the filter). Work is split into batches of batch_size documents, each
+    its own transaction, so locks are held only briefly. A failed batch stops the
+    deletion; batches before it stay committed.
+    
+    Args:
+        access_tokens (list, optional): Access tokens of the documents to delete
+        older_than_days (int, optional): Only documents uploaded more than this many days ago
+        privacy_level (str, optional): Only documents with this privacy level
+        batch_size (int): Documents deleted per transaction
+        
+    Returns:
+        dict: Rows deleted per table, plus "error" (None on success). None if the
+              database is unavailable.
+    """
+    if not access_tokens and older_than_days is None and privacy_level is None:
+        raise ValueError("delete_documents needs access tokens or a filter")
+    
+    conditions = []
+    params = []
+    if older_than_days is not None:
+        conditions.append(sql.SQL("upload_date < NOW() - make_interval(days => %s)"))
+        params.append(older_than_days)
+    if privacy_level is not None:
+        conditions.append(sql.SQL("privacy_level = %s"))
+        params.append(privacy_level)
+    
+    totals = dict.fromkeys(DOCUMENT_CHILD_TABLES + ["document_history", "document_contents"], 0)
+    totals["error"] = None
+    
+    def delete_batch(cursor, batch_conditions, batch_params):
+        cursor.execute(
+            sql.SQL("""
+                SELECT id FROM document_history
+                WHERE {}
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE
+            """).format(sql.SQL(" AND ").join(batch_conditions)),
+            batch_params + [batch_size]
+        )
+        document_ids = [row[0] for row in cursor.fetchall()]
+        if document_ids:
+            for table, count in _delete_documents(cursor, document_ids).items():
+                totals[table] += count
+        return len(document_ids)
+    
+    connection = get_connection()
+    if not connection:
+        return None
+        
+    try:
+        if access_tokens:
+            tokens = list(dict.fromkeys(access_tokens))
+            for start in range(0, len(tokens), batch_size):
+                with connection:
+                    with connection.cursor() as cursor:
+                        delete_batch(
+                            cursor,
+                            conditions + [sql.SQL("access_token = ANY(%s)")],
+                            params + [tokens[start:start + batch_size]]
+                        )
+        else:
+            while True:
+                with connection:
+                    with connection.cursor() as cursor:
+                        if not delete_batch(cursor, conditions, params):
+                            break
+        
+        logger.info(f"Deleted {totals['document_history']} documents")
+        return totals
+    except Exception as e:
+        logger.error(f"Error deleting documents: {e}")
+        totals["error"] = str(e)
+        return totals
+    finally:
+        release_connection(connection)
+
+@_backend_function
+def find_documents_with_risk_factor(category, term=None, pattern_id=None, since_days=None, limit=100):
+    """
+    Find documents with a given structured risk factor
+    
+    Example: all documents with an unlimited liability clause in the last 90 days
+    is find_documents_with_risk_factor('high_pattern', pattern_id=6, since_days=90).
+    
+    Args:
+        category (str): Risk factor kind ('high_term', 'medium_term', 'high_pattern')
+        term (str, optional): Risk term, lowercase as produced by assess_risk_level
+        pattern_id (int, optional): High-risk pattern id
+        since_days (int, optional): Only documents uploaded in the last N days
+        limit (int): Maximum number of documents to return
+        
+    Returns:
+        list: Document metadata records, most recent first
+    """
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return []
+        
+    try:
+        with connection:
+            with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                conditions = ["rf.category = %s"]
+                params = [category]
+                
+                if term is not None:
+                    conditions.append("rf.term = %s")
+                    params.append(term)
+                    
+                if pattern_id is not None:
+                    conditions.append("rf.pattern_id = %s")
+                    params.append(pattern_id)
+                    
+                if since_days is not None:
+                    conditions.append("d.upload_date >= NOW() - %s * INTERVAL '1 day'")
+                    params.append(since_days)
+                    
+                params.append(limit)
+                
+                cursor.execute(f"""
+                    SELECT d.id, d.filename, d.upload_date, d.document_language, d.risk_level,
+                           d.privacy_level, rf.occurrence_count, rf.start_offset, rf.end_offset
+                    FROM risk_factors rf
+                    JOIN document_history d ON d.id = rf.document_id
+                    WHERE {' AND '.join(conditions)}
+                    ORDER BY d.upload_date DESC
+                    LIMIT %s
+                """, tuple(params))
+                return cursor.fetchall()
+    except Exception as e:
+        logger.error(f"Error finding documents by risk factor: {e}")
+        return []
+    finally:
+        release_connection(connection)
+
+@_postgres_only
+def migrate_document_bodies(batch_size=500, max_batches=None):
+    """
+    Move inline document_text values from document_history into document_contents
+    
+    Bodies are converted to the compressed storage_codec format on the way.
+    Works in small batches, each its own short transaction, so it can run while
+    the application is serving traffic. Rows locked by other transactions are
+    skipped and picked up by a later batch. Readers fall back to the inline
+    column until a row has been moved. Rows that cannot be decrypted are left
+    in place, logged and skipped for the rest of the run.
+    
+    Args:
+        batch_size (int): Rows moved per transaction
+        max_batches (int, optional): Stop after this many batches
+        
+    Returns:
+        int: Number of rows moved
+    """
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return 0
+        
+    moved = 0
+    failed = set()
+    batches = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            with connection:
+                with connection.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT id, document_text, is_encrypted, access_token
+                        FROM document_history
+                        WHERE content_id IS NULL AND document_text IS NOT NULL
+                          AND NOT (id = ANY(%s))
+                        ORDER BY id
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    """, (list(failed), batch_size))
+                    rows = cursor.fetchall()
+                    if not rows:
+                        break
+                        
+                    bodies = {}
+                    row_keys = []
+                    for document_id, legacy_text, is_encrypted, access_token in rows:
+                        try:
+                            document_text, body = _encode_legacy_text(legacy_text, is_encrypted)
+                        except Exception as e:
+                            logger.error(f"Could not convert body of document {document_id}: {e}")
+                            failed.add(document_id)
+                            continue
+                        key = _content_key(document_text, is_encrypted, access_token or f"id:{document_id}")
+                        bodies.setdefault(key, (body, is_encrypted))
+                        row_keys.append((document_id, key))
+                    if row_keys:
+                        cursor.execute("""
+                            WITH contents AS (
+                                INSERT INTO document_contents (content_key, body, is_encrypted)
+                                SELECT * FROM unnest(%s::text[], %s::bytea[], %s::boolean[])
+                                ON CONFLICT (content_key) DO UPDATE SET content_key = EXCLUDED.content_key
+                                RETURNING id, content_key
+                            )
+                            UPDATE document_history d
+                            SET content_id = contents.id, document_text = NULL
+                            FROM unnest(%s::int[], %s::text[]) AS r(id, content_key)
+                            JOIN contents ON contents.content_key = r.content_key
+                            WHERE d.id = r.id
+                        """, (
+                            list(bodies),
+                            [body for body, _ in bodies.values()],
+                            [is_encrypted for _, is_encrypted in bodies.values()],
+                            [document_id for document_id, _ in row_keys],
+                            [key for _, key in row_keys],
+                        ))
+                        moved += len(row_keys)
+            batches += 1
+            logger.info(f"Moved {moved} document bodies to document_contents")
+        if failed:
+            logger.warning(f"Left {len(failed)} document bodies that could not be converted in document_history")
+        return moved
+    except Exception as e:
+        logger.error(f"Error moving document bodies: {e}")
+        return moved
+    finally:
+        release_connection(connection)
+
+# Tables whose text column predates storage_codec: (table, text column, bytea column)
+LEGACY_TEXT_COLUMNS = [
+    ("document_contents", "document_text", "body"),
+    ("document_summaries", "summary_text", "summary_data"),
+]
+
+@_postgres_only
+def compress_stored_text(batch_size=500, max_batches=None):
+    """
+    Convert document bodies and summaries still stored as text to the compressed format
+    
+    Runs in small SKIP LOCKED batches like migrate_document_bodies. Readers handle
+    both formats, so this can run at any time after the schema migration.
+    
+    Args:
+        batch_size (int): Rows converted per transaction
+        max_batches (int, optional): Stop after this many batches per table
+        
+    Returns:
+        dict: {table: number of rows converted}
+    """
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return {}
+        
+    converted = {}
+    try:
+        for table, text_column, data_column in LEGACY_TEXT_COLUMNS:
+            converted[table] = 0
+            failed = set()
+            batches = 0
+            while max_batches is None or batches < max_batches:
+                with connection:
+                    with connection.cursor() as cursor:
+                        cursor.execute(sql.SQL("""
+                            SELECT id, {text_column}, is_encrypted FROM {table}
+                            WHERE {data_column} IS NULL AND {text_column} IS NOT NULL
+                              AND NOT (id = ANY(%s))
+                            ORDER BY id
+                            LIMIT %s
+                            FOR UPDATE SKIP LOCKED
+                        """).format(
+                            table=sql.Identifier(table),
+                            text_column=sql.Identifier(text_column),
+                            data_column=sql.Identifier(data_column),
+                        ), (list(failed), batch_size))
+                        rows = cursor.fetchall()
+                        if not rows:
+                            break
+                        
+                        ids = []
+                        values = []
+                        for row_id, legacy_text, is_encrypted in rows:
+                            try:
+                                values.append(_encode_legacy_text(legacy_text, is_encrypted)[1])
+                                ids.append(row_id)
+                            except Exception as e:
+                                logger.error(f"Could not convert {table} row {row_id}: {e}")
+                                failed.add(row_id)
+                        
+                        cursor.execute(sql.SQL("""
+                            UPDATE {table} t
+                            SET {data_column} = v.data, {text_column} = NULL
+                            FROM unnest(%s::bigint[], %s::bytea[]) AS v(id, data)
+                            WHERE t.id = v.id
+                        """).format(
+                            table=sql.Identifier(table),
+                            text_column=sql.Identifier(text_column),
+                            data_column=sql.Identifier(data_column),
+                        ), (ids, values))
+                        converted[table] += len(ids)
+                batches += 1
+            logger.info(f"Converted {converted[table]} rows of {table} to compressed storage")
+        return converted
+    except Exception as e:
+        logger.error(f"Error converting stored text: {e}")
+        return converted
+    finally:
+        release_connection(connection)
+
+# Documents past their retention period, oldest first. The fixed upload_date
+# bound lets the planner use the upload_date index; retention is at least a day.
+EXPIRED_DOCUMENTS_SQL = """
+    SELECT d.id
+    FROM document_history d
+    LEFT JOIN privacy_settings p ON p.document_id = d.id
+    WHERE d.upload_date < NOW() - INTERVAL '1 day'
+      AND d.upload_date < NOW() - make_interval(days => COALESCE(p.retention_days, %(default_days)s))
+    ORDER BY d.upload_date, d.id
+    LIMIT %(limit)s
+"""
+
+@_backend_function
+def count_expired_documents(default_days=30):
+    """
+    Count the documents past their privacy_settings.retention_days
+    
+    Args:
+        default_days (int): Retention for documents without privacy settings
+        
+    Returns:
+        int: Number of expired documents or None if failed
+    """
+    connection = get_connection()
+    if not connection:
+        return None
+        
+    try:
+        with connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT count(*) FROM ({EXPIRED_DOCUMENTS_SQL}) expired",
+                    {"default_days": default_days, "limit": None}
+                )
+                return cursor.fetchone()[0]
+    except Exception as e:
+        logger.error(f"Error counting expired documents: {e}")
+        return None
+    finally:
+        release_connection(connection)
+
+@_backend_function
+def delete_expired_documents(batch_size=500, default_days=30, lock_timeout="2s"):
+    """
+    Delete one batch of documents past their retention period
+    
+    The batch is a single short transaction. Documents locked by other sessions
+    are skipped, so concurrent purges never wait on each other, and lock_timeout
+    bounds the wait on dependent rows.
+    
+    Args:
+        batch_size (int): Maximum number of documents to delete
+        default_days (int): Retention for documents without privacy settings
+        lock_timeout (str): Postgres lock_timeout for the batch
+        
+    Returns:
+        int: Number of documents deleted or None if failed
+        
+    Raises:
+        psycopg2.errors.LockNotAvailable: If the lock timeout expired
+    """
+    connection = get_connection()
+    if not connection:
+        return None
+        
+    try:
+        with connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL lock_timeout = %s", (lock_timeout,))
+                cursor.execute(
+                    EXPIRED_DOCUMENTS_SQL + " FOR UPDATE OF d SKIP LOCKED",
+                    {"default_days": default_days, "limit": batch_size}
+                )
+                document_ids = [row[0] for row in cursor.fetchall()]
+                if not document_ids:
+                    return 0
+                return _delete_documents(cursor, document_ids)["document_history"]
+    except errors.LockNotAvailable:
+        raise
+    except Exception as e:
+        logger.error(f"Error deleting expired documents: {e}")
+        return None
+    finally:
+        release_connection(connection)
+
+# Indexes of document_history, built on the partitioned replacement under a
+# temporary name. None is unique: unique indexes of a partitioned table must
+# include upload_date, so document_keys enforces uniqueness instead.
+PARTITIONED_INDEXES = [
+    ("idx_document_history_upload_date_id", "(upload_date DESC, id DESC)"),
+    ("idx_document_history_access_token", "(access_token)"),
+    ("idx_document_history_risk_level_upload_date", "(risk_level, upload_date DESC, id DESC)"),
+    ("idx_document_history_language_upload_date", "(document_language, upload_date DESC, id DESC)"),
+    ("idx_document_history_content_id", "(content_id)"),
+    ("idx_document_history_content_hash", "(privacy_level, content_hash) WHERE content_hash IS NOT NULL"),
+]
+
+# Triggers of document_history (see migrations 9 and 13), recreated on the
+# partitioned table. The copied rows are already counted in document_stats_daily.
+DOCUMENT_HISTORY_TRIGGERS_SQL = """
+    CREATE TRIGGER document_history_search_sync
+        AFTER INSERT OR UPDATE OF filename, document_language, privacy_level ON document_history
+        FOR EACH ROW EXECUTE FUNCTION document_history_search_sync();
+    CREATE TRIGGER document_stats_insert
+        AFTER INSERT ON document_history
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION document_stats_sync();
+    CREATE TRIGGER document_stats_update
+        AFTER UPDATE ON document_history
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION document_stats_sync();
+    CREATE TRIGGER document_stats_delete
+        AFTER DELETE ON document_history
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION document_stats_sync();
+"""
+
+def _is_partitioned(cursor):
+    cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('document_history')")
+    row = cursor.fetchone()
+    return bool(row and row[0])
+
+def _create_document_keys(cursor, table):
+    """
+    Create document_keys for a partitioned table and fill it from its rows
+    
+    The unique indexes of document_keys take over those document_history had
+    before it was partitioned, and the document_keys_sync trigger (migration
+    15) fails any insert or update that breaks them.
+    """
+    cursor.execute("""
+        CREATE TABLE document_keys (
+            id INTEGER PRIMARY KEY,
+            access_token VARCHAR(64) UNIQUE,
+            privacy_level VARCHAR(16) NOT NULL,
+            content_hash VARCHAR(64)
+        )
+    """)
+    cursor.execute("""
+        CREATE UNIQUE INDEX idx_document_keys_content_hash
+            ON document_keys (privacy_level, content_hash)
+            WHERE content_hash IS NOT NULL
+    """)
+    cursor.execute(sql.SQL("""
+        INSERT INTO document_keys (id, access_token, privacy_level, content_hash)
+        SELECT id, access_token, privacy_level, content_hash FROM {}
+    """).format(sql.Identifier(table)))
+    # A BEFORE trigger, so the key row exists before child rows of the same
+    # statement are checked against it
+    cursor.execute(sql.SQL("""
+        CREATE TRIGGER document_keys_sync
+            BEFORE INSERT OR UPDATE OF id, access_token, privacy_level, content_hash OR DELETE ON {}
+            FOR EACH ROW EXECUTE FUNCTION document_keys_sync()
+    """).format(sql.Identifier(table)))
+
+def _reference_document_keys(cursor):
+    """
+    Point the foreign keys of the child tables at document_keys
+    
+    The constraints are added NOT VALID; partition_document_history validates
+    them afterwards without blocking writes.
+    """
+    for table in DOCUMENT_CHILD_TABLES + DOCUMENT_INDEX_TABLES:
+        cursor.execute(
+            sql.SQL("ALTER TABLE {} DROP CONSTRAINT IF EXISTS {}").format(
+                sql.Identifier(table), sql.Identifier(f"{table}_document_id_fkey")
+            )
+        )
+        cursor.execute(
+            sql.SQL("""
+                ALTER TABLE {} ADD CONSTRAINT {} FOREIGN KEY (document_id)
+                    REFERENCES document_keys (id) ON DELETE CASCADE NOT VALID
+            """).format(sql.Identifier(table), sql.Identifier(f"{table}_document_id_fkey"))
+        )
+
+def _validate_document_key_references(connection):
+    for table in DOCUMENT_CHILD_TABLES + DOCUMENT_INDEX_TABLES:
+        with connection:
+            with connection.cursor() as cursor:
+                cursor.execute(sql.SQL("ALTER TABLE {} VALIDATE CONSTRAINT {}").format(
+                    sql.Identifier(table), sql.Identifier(f"{table}_document_id_fkey")
+                ))
+
+def _create_partitioned_table(cursor, months_ahead):
+    """Create document_history_partitioned and start tracking changes to document_history"""
+    cursor.execute("""
+        CREATE TABLE document_history_partitioned (
+            LIKE document_history INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+            PRIMARY KEY (id, upload_date),
+            FOREIGN KEY (content_id) REFERENCES document_contents (id)
+        ) PARTITION BY RANGE (upload_date)
+    """)
+    for name, definition in PARTITIONED_INDEXES:
+        cursor.execute(sql.SQL("CREATE INDEX {} ON document_history_partitioned " + definition).format(
+            sql.Identifier(name + "_p")
+        ))
+    
+    # Monthly partitions from the oldest document on; anything outside them
+    # lands in the default partition
+    cursor.execute("""
+        SELECT create_document_history_partitions(
+            'document_history_partitioned',
+            COALESCE((SELECT min(upload_date) FROM document_history), NOW()::timestamp),
+            %s
+        )
+    """, (months_ahead,))
+    cursor.execute("CREATE TABLE document_history_default PARTITION OF document_history_partitioned DEFAULT")
+    _create_document_keys(cursor, "document_history_partitioned")
+    
+    cursor.execute("CREATE TABLE document_history_changes (id INTEGER PRIMARY KEY)")
+    cursor.execute("""
+        CREATE TRIGGER document_history_track_change
+            AFTER INSERT OR UPDATE OR DELETE ON document_history
+            FOR EACH ROW EXECUTE FUNCTION document_history_track_change()
+    """)
+
+def _swap_partitioned_table(cursor, last_id, months_ahead):
+    """Copy the remaining changes and replace document_history by its partitioned copy"""
+    cursor.execute("LOCK TABLE document_history IN ACCESS EXCLUSIVE MODE")
+    
+    # Rows written since they were copied are copied again, with the rows
+    # added after the last batch
+    cursor.execute("""
+        DELETE FROM document_history_partitioned
+        WHERE id IN (SELECT id FROM document_history_changes)
+    """)
+    # Two arms rather than an OR, so each one uses the primary key
+    cursor.execute("""
+        INSERT INTO document_history_partitioned
+        SELECT * FROM document_history WHERE id > %s
+        UNION ALL
+        SELECT * FROM document_history
+        WHERE id IN (SELECT id FROM document_history_changes) AND id <= %s
+    """, (last_id, last_id))
+    
+    # Keep the id sequence when the old table is dropped
+    cursor.execute("SELECT pg_get_serial_sequence('document_history', 'id')")
+    sequence = cursor.fetchone()[0]
+    if sequence:
+        cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY document_history_partitioned.id")
+    
+    # Drops the foreign keys of the child tables, recreated against document_keys
+    cursor.execute("DROP TABLE document_history CASCADE")
+    cursor.execute("DROP TABLE document_history_changes")
+    cursor.execute("ALTER TABLE document_history_partitioned RENAME TO document_history")
+    cursor.execute(
+        "ALTER TABLE document_history RENAME CONSTRAINT document_history_partitioned_pkey TO document_history_pkey"
+    )
+    for name, _ in PARTITIONED_INDEXES:
+        cursor.execute(sql.SQL("ALTER INDEX {} RENAME TO {}").format(
+            sql.Identifier(name + "_p"), sql.Identifier(name)
+        ))
+    cursor.execute(DOCUMENT_HISTORY_TRIGGERS_SQL)
+    _reference_document_keys(cursor)
+    cursor.execute(
+        "SELECT create_document_history_partitions('document_history', NOW()::timestamp, %s)",
+        (months_ahead,)
+    )
+
+def _count_documents(connection):
+    with connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM document_history")
+            return cursor.fetchone()[0]
+
+@_postgres_only
+def partition_document_history(batch_size=5000, months_ahead=3):
+    """
+    Convert document_history into a table range-partitioned by month of upload_date
+    
+    The rows are copied in batches into a partitioned copy while the application
+    keeps running; a trigger records the rows written meanwhile. A final short
+    transaction copies those again and swaps the tables. An interrupted
+    conversion resumes after the last copied batch.
+    
+    Ids, access tokens and content hashes stay unique through document_keys,
+    which the child tables reference with cascading foreign keys. Running this
+    on a table partitioned before document_keys existed adds it.
+    
+    The statement timeout of the pool is lifted for the duration, since the
+    copy, the swap and the validation scan the whole table.
+    
+    Args:
+        batch_size (int): Documents copied per transaction
+        months_ahead (int): Months of future partitions to create
+        
+    Returns:
+        int: Number of documents in the partitioned table or None if failed
+    """
+    connection = get_connection()
+    if not connection:
+        return None
+        
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SET statement_timeout = 0")
+        connection.commit()
+        
+        with connection:
+            with connection.cursor() as cursor:
+                partitioned = _is_partitioned(cursor)
+                if partitioned:
+                    logger.info("document_history is already partitioned")
+                    cursor.execute("SELECT to_regclass('document_keys') IS NULL")
+                    add_keys = cursor.fetchone()[0]
+                    if add_keys:
+                        cursor.execute("LOCK TABLE document_history IN SHARE ROW EXCLUSIVE MODE")
+                        _create_document_keys(cursor, "document_history")
+                        _reference_document_keys(cursor)
+                else:
+                    cursor.execute("SELECT to_regclass('document_history_partitioned') IS NULL")
+                    if cursor.fetchone()[0]:
+                        _create_partitioned_table(cursor, months_ahead)
+                    cursor.execute("SELECT COALESCE(max(id), 0) FROM document_history_partitioned")
+                    last_id = cursor.fetchone()[0]
+        
+        if partitioned:
+            if add_keys:
+                _validate_document_key_references(connection)
+                logger.info("Added document_keys to the partitioned document_history")
+            return _count_documents(connection)
+        
+        while True:
+            with connection:
+                with connection.cursor() as cursor:
+                    cursor.execute("""
+                        WITH batch AS (
+                            INSERT INTO document_history_partitioned
+                            SELECT * FROM document_history
+                            WHERE id > %s
+                            ORDER BY id
+                            LIMIT %s
+                            RETURNING id
+                        )
+                        SELECT count(*), max(id) FROM batch
+                    """, (last_id, batch_size))
+                    copied, max_id = cursor.fetchone()
+            if not copied:
+                break
+            last_id = max_id
+            logger.info(f"Copied documents up to id {last_id} into document_history_partitioned")
+        
+        with connection:
+            with connection.cursor() as cursor:
+                _swap_partitioned_table(cursor, last_id, months_ahead)
+        _validate_document_key_references(connection)
+        total = _count_documents(connection)
+        logger.info(f"Partitioned document_history ({total} documents)")
+        return total
+    except Exception as e:
+        logger.error(f"Error partitioning document history: {e}")
+        return None
+    finally:
+        try:
+            connection.rollback()
+            with connection.cursor() as cursor:
+                cursor.execute("RESET statement_timeout")
+            connection.commit()
+        except Exception as e:
+            logger.error(f"Error resetting the statement timeout: {e}")
+        release_connection(connection)
+
+@_backend_function
+def create_future_partitions(months_ahead=3):
+    """
+    Create the monthly partitions of document_history for the coming months
+    
+    Does nothing while document_history is not partitioned.
+    
+    Args:
+        months_ahead (int): Months after the current one to create partitions for
+        
+    Returns:
+        int: Number of partitions created or None if failed
+    """
+    connection = get_connection()
+    if not connection:
+        return None
+        
+    try:
+        with connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT create_document_history_partitions('document_history', NOW()::timestamp, %s)",
+                    (months_ahead,)
+                )
+                return cursor.fetchone()[0]
+    except Exception as e:
+        logger.error(f"Error creating document history partitions: {e}")
+        return None
+    finally:
+        release_connection(connection)
+
+# Subtracts the rows of a detached partition from document_stats_daily, as the
+# delete trigger of migration 13 would
+DROPPED_STATS_SQL = """
+    INSERT INTO document_stats_daily AS s
+        (day, risk_level, document_language, privacy_level, documents, total_size_kb, total_length)
+    SELECT upload_date::date, COALESCE(risk_level, 'Unknown'), COALESCE(document_language, 'unknown'),
+           privacy_level, -count(*), -COALESCE(sum(file_size_kb), 0), -COALESCE(sum(content_length), 0)
+    FROM {}
+    GROUP BY 1, 2, 3, 4
+    ORDER BY 1, 2, 3, 4
+    ON CONFLICT (day, risk_level, document_language, privacy_level) DO UPDATE
+        SET documents = s.documents + EXCLUDED.documents,
+            total_size_kb = s.total_size_kb + EXCLUDED.total_size_kb,
+            total_length = s.total_length + EXCLUDED.total_length
+"""
+
+@_backend_function
+def drop_expired_partitions(default_days=30, lock_timeout="2s"):
+    """
+    Drop the monthly partitions of document_history whose documents have all expired
+    
+    Partitions are checked oldest first, up to the first one that still holds a
+    document within its retention period. Each partition is detached, its
+    dependent rows are deleted and it is dropped in one transaction. Documents
+    in partitions that cannot be dropped yet are left to delete_expired_documents.
+    
+    Args:
+        default_days (int): Retention for documents without privacy settings
+        lock_timeout (str): Postgres lock_timeout for each partition
+        
+    Returns:
+        int: Number of documents dropped or None if failed
+        
+    Raises:
+        psycopg2.errors.LockNotAvailable: If the lock timeout expired
+    """
+    connection = get_connection()
+    if not connection:
+        return None
+        
+    dropped = 0
+    try:
+        with connection:
+            with connection.cursor() as cursor:
+                if not _is_partitioned(cursor):
+                    return 0
+                cursor.execute("SELECT to_regclass('document_keys') IS NOT NULL")
+                has_keys = cursor.fetchone()[0]
+                cursor.execute("""
+                    SELECT c.relname
+                    FROM pg_inherits i
+                    JOIN pg_class c ON c.oid = i.inhrelid
+                    WHERE i.inhparent = 'document_history'::regclass
+                      AND c.relname ~ '^document_history_p[0-9]{6}$'
+                    ORDER BY c.relname
+                """)
+                partitions = [row[0] for row in cursor.fetchall()]
+        
+        for partition in partitions:
+            with connection:
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL lock_timeout = %s", (lock_timeout,))
+                    # The partition expires once its last possible upload date
+                    # is past the longest retention of its documents
+                    cursor.execute(
+                        sql.SQL("""
+                            SELECT to_date(%s, 'YYYYMM') + INTERVAL '1 month'
+                                   + make_interval(days => COALESCE(max(COALESCE(p.retention_days, %s)), %s))
+                                   <= NOW()
+                            FROM {} d
+                            LEFT JOIN privacy_settings p ON p.document_id = d.id
+                        """).format(sql.Identifier(partition)),
+                        (partition[-6:], default_days, default_days)
+                    )
+                    if not cursor.fetchone()[0]:
+                        break
+                    
+                    cursor.execute(sql.SQL("ALTER TABLE document_history DETACH PARTITION {}").format(
+                        sql.Identifier(partition)
+                    ))
+                    cursor.execute(
+                        sql.SQL("""
+                            CREATE TEMPORARY TABLE dropped_documents ON COMMIT DROP AS
+                            SELECT id, content_id FROM {}
+                        """).format(sql.Identifier(partition))
+                    )
+                    for table in DOCUMENT_CHILD_TABLES + DOCUMENT_INDEX_TABLES:
+                        cursor.execute(
+                            sql.SQL("DELETE FROM {} WHERE document_id IN (SELECT id FROM dropped_documents)").format(
+                                sql.Identifier(table)
+                            )
+                        )
+                    # Dropping a partition fires no delete triggers: remove the
+                    # keys and subtract the rows from the statistics. Rows of
+                    # the same days in the default partition stay counted.
+                    if has_keys:
+                        cursor.execute("DELETE FROM document_keys WHERE id IN (SELECT id FROM dropped_documents)")
+                    cursor.execute(sql.SQL(DROPPED_STATS_SQL).format(sql.Identifier(partition)))
+                    cursor.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(partition)))
+                    cursor.execute("""
+                        DELETE FROM document_contents c
+                        WHERE c.id IN (SELECT content_id FROM dropped_documents)
+                          AND NOT EXISTS (SELECT 1 FROM document_history d WHERE d.content_id = c.id)
+                    """)
+                    cursor.execute("SELECT count(*) FROM dropped_documents")
+                    count = cursor.fetchone()[0]
+            dropped += count
+            logger.info(f"Dropped partition {partition} ({count} documents)")
+        return dropped
+    except errors.LockNotAvailable:
+        raise
+    except Exception as e:
+        logger.error(f"Error dropping expired partitions: {e}")
+        return dropped or None
+    finally:
+        release_connection(connection)
+
+@_backend_function
+def record_retention_run(run):
+    """
+    Write a finished retention purge to the retention_runs log
+    
+    Args:
+        run (dict): Run summary from utils.retention.purge_expired_documents
+        
+    Returns:
+        bool: True if recorded
+    """
+    connection = get_connection()
+    if not connection:
+        return False
+        
+    try:
+        with connection:
+            with connection.cursor() as cursor:
                 cursor.execute(
                     """
-                    INSERT INTO document_summaries 
-                    (document_id, summary_text, detail_level, language, is_encrypted)
-                    VALUES (%s, %s, %s, %s, %s) RETURNING id
+                    INSERT INTO retention_runs
+                    (started_at, finished_at, dry_run, documents_deleted, batches, lock_timeouts, error)
+                    VALUES (to_timestamp(%s), to_timestamp(%s), %s, %s, %s, %s, %s)
                     """,
-                    (document_id, encrypted_summary, detail_level, language, is_encrypted)
+                    (run["started_at"], run["finished_at"], run["dry_run"], run["documents_deleted"],
+                     run["batches"], run["lock_timeouts"], run["error"])
                 )
-                return cursor.fetchone()[0]
+                return True
     except Exception as e:
-        logger.error(f"Error saving document summary: {e}")
-        return None
+        logger.error(f"Error recording retention run: {e}")
+        return False
     finally:
-        connection.close()
+        release_connection(connection)
 
-def get_recent_documents(limit=10):
+@_backend_function
+def get_retention_runs(limit=20):
     """
-    Get recent document history
+    Get recent retention purges from the run log
     
     Args:
-        limit (int): Maximum number of records to return
+        limit (int): Maximum number of runs to return
         
     Returns:
-        list: List of recent document history records
+        list: Run records, newest first
     """
     connection = get_connection()
     if not connection:
@@ -207,323 +2434,584 @@ def get_recent_documents(limit=10):
             with connection.cursor(cursor_factory=RealDictCursor) as cursor:
                 cursor.execute(
                     """
-                    SELECT * FROM document_history
-                    ORDER BY upload_date DESC
+                    SELECT * FROM retention_runs
+                    ORDER BY started_at DESC
                     LIMIT %s
                     """,
                     (limit,)
                 )
                 return cursor.fetchall()
     except Exception as e:
-        logger.error(f"Error getting recent documents: {e}")
+        logger.error(f"Error getting retention runs: {e}")
         return []
     finally:
-        connection.close()
+        release_connection(connection)
 
-def get_document_with_risk_factors(document_id):
+# Dimensions of document_stats_daily that statistics can be grouped by
+STATS_DIMENSIONS = ["risk_level", "document_language", "privacy_level"]
+
+def _stats_query(group_by, by_day):
+    """Check the grouping of get_document_stats and list its columns"""
+    unknown = [dimension for dimension in group_by if dimension not in STATS_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Cannot group statistics by {', '.join(unknown)}")
+    return (["day"] if by_day else []) + list(dict.fromkeys(group_by))
+
+@_backend_function
+def get_document_stats(group_by=(), by_day=False, date_from=None, date_to=None):
     """
-    Get document history with its risk factors
+    Aggregate document statistics from the daily rollup
+    
+    Reads document_stats_daily, which triggers keep current, so the cost
+    depends on the number of days in the range and not on the number of
+    stored documents.
     
     Args:
-        document_id (int): ID of the document
+        group_by (list): Dimensions from STATS_DIMENSIONS to group by
+        by_day (bool): Group by upload day as well
+        date_from (date, optional): First upload day to include
+        date_to (date, optional): Last upload day to include
         
     Returns:
-        dict: Document record with risk factors list
+        list: One dict per group with its dimensions (and day), documents,
+              total_size_kb and total_length, ordered by day and dimensions
     """
+    columns = _stats_query(group_by, by_day)
+    
     connection = get_connection()
     if not connection:
-        return None
+        return []
         
     try:
         with connection:
             with connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                # Get document
-                cursor.execute(
-                    """
-                    SELECT * FROM document_history
-                    WHERE id = %s
-                    """,
-                    (document_id,)
-                )
-                document = cursor.fetchone()
-                
-                if not document:
-                    return None
-                    
-                # Get risk factors
+                column_list = sql.SQL(", ").join(map(sql.Identifier, columns))
                 cursor.execute(
-                    """
-                    SELECT risk_factor FROM risk_factors
-                    WHERE document_id = %s
-                    """,
-                    (document_id,)
+                    sql.SQL("""
+                        SELECT {columns}{separator}
+                               sum(documents)::bigint AS documents,
+                               sum(total_size_kb)::float8 AS total_size_kb,
+                               sum(total_length)::bigint AS total_length
+                        FROM document_stats_daily
+                        WHERE (%(date_from)s::date IS NULL OR day >= %(date_from)s::date)
+                          AND (%(date_to)s::date IS NULL OR day <= %(date_to)s::date)
+                        {group_by}
+                        HAVING sum(documents) > 0
+                        {order_by}
+                    """).format(
+                        columns=column_list,
+                        separator=sql.SQL(",") if columns else sql.SQL(""),
+                        group_by=sql.SQL("GROUP BY {}").format(column_list) if columns else sql.SQL(""),
+                        order_by=sql.SQL("ORDER BY {}").format(column_list) if columns else sql.SQL("")
+                    ),
+                    {"date_from": date_from, "date_to": date_to}
                 )
-                risk_factors = [row['risk_factor'] for row in cursor.fetchall()]
-                
-                document['risk_factors'] = risk_factors
-                
-                # Decrypt document_text if it exists and is encrypted
-                if document.get('document_text') and document.get('is_encrypted'):
-                    try:
-                        document['document_text'] = encryption.decrypt(document['document_text'])
-                    except Exception as e:
-                        logger.error(f"Error decrypting document text: {e}")
-                        document['document_text'] = "[Encrypted content - decryption failed]"
-                
-                return document
+                return cursor.fetchall()
     except Exception as e:
-        logger.error(f"Error getting document with risk factors: {e}")
-        return None
+        logger.error(f"Error getting document statistics: {e}")
+        return []
     finally:
-        connection.close()
+        release_connection(connection)
+
+# Columns of the export tables. Access tokens are credentials and content
+# hashes keyed fingerprints, so neither is ever exported.
+EXPORT_COLUMNS = {
+    "documents": [
+        "id", "filename", "file_size_kb", "document_language", "risk_level", "content_length",
+        "upload_date", "privacy_level", "is_encrypted", "retention_days", "anonymize_text"
+    ],
+    "risk_factors": [
+        "id", "document_id", "category", "term", "occurrence_count", "pattern_id",
+        "start_offset", "end_offset", "risk_factor"
+    ],
+}
+
+EXPORT_SQL = {
+    "documents": """
+        SELECT d.id, d.filename, d.file_size_kb::float8 AS file_size_kb, d.document_language,
+               d.risk_level, d.content_length, d.upload_date, d.privacy_level, d.is_encrypted,
+               p.retention_days, p.anonymize_text{text_columns}
+        FROM document_history d
+        LEFT JOIN privacy_settings p ON p.document_id = d.id{text_join}
+        ORDER BY d.id
+    """,
+    "risk_factors": """
+        SELECT id, document_id, category, term, occurrence_count, pattern_id,
+               start_offset, end_offset, risk_factor
+        FROM risk_factors
+        ORDER BY id
+    """,
+}
+
+# Stored body columns added to the documents export by include_text
+EXPORT_TEXT_COLUMNS = """,
+               c.body, COALESCE(c.document_text, d.document_text) AS legacy_text,
+               COALESCE(c.is_encrypted, d.is_encrypted) AS body_encrypted"""
+EXPORT_TEXT_JOIN = """
+        LEFT JOIN document_contents c ON c.id = d.content_id"""
+
+def _export_sql(table, include_text=False):
+    """Get the export query of a table"""
+    if table not in EXPORT_SQL:
+        raise ValueError(f"Cannot export {table}; use one of {', '.join(EXPORT_SQL)}")
+    text = include_text and table == "documents"
+    return EXPORT_SQL[table].format(
+        text_columns=EXPORT_TEXT_COLUMNS if text else "",
+        text_join=EXPORT_TEXT_JOIN if text else ""
+    )
+
+def _export_text(row, decrypt):
+    """
+    Replace the stored body columns of an exported row by document_text
+    
+    Encrypted bodies stay None unless decrypt is set.
+    """
+    body, legacy_text, is_encrypted = row.pop("body"), row.pop("legacy_text"), row.pop("body_encrypted")
+    row["document_text"] = None
+    if is_encrypted and not decrypt:
+        return row
+    try:
+        row["document_text"] = _decode_stored_text(body, legacy_text, is_encrypted)
+    except Exception as e:
+        logger.error(f"Error decoding the text of document {row['id']} for export: {e}")
+    return row
+
+@_backend_function
+def iter_export_batches(table, batch_size=5000, include_text=False, decrypt=False):
+    """
+    Stream the rows of an export table in batches
+    
+    Rows are read through a server-side cursor in one read-only transaction, so
+    only one batch is held in memory at a time however large the table is.
+    
+    Args:
+        table (str): "documents" or "risk_factors"
+        batch_size (int): Rows fetched per round trip
+        include_text (bool): Add the document_text column to the documents export
+        decrypt (bool): Decrypt the text of encrypted documents; without it their
+                        document_text is None. Only set this when the export is
+                        explicitly authorized to contain protected text.
         
-def get_document_text(document_id):
+    Yields:
+        list: Up to batch_size dicts with the EXPORT_COLUMNS of the table, plus
+              document_text when include_text is set
+        
+    Raises:
+        ValueError: If the table cannot be exported
+        psycopg2.OperationalError: If the database is unavailable
     """
-    Get the full document text, decrypting if necessary
+    query = _export_sql(table, include_text)
+    text = include_text and table == "documents"
+    
+    connection = get_connection()
+    if not connection:
+        raise psycopg2.OperationalError("Database unavailable")
+        
+    try:
+        with connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION READ ONLY")
+            with connection.cursor(name=f"export_{table}", cursor_factory=RealDictCursor) as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(query)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    if text:
+                        rows = [_export_text(row, decrypt) for row in rows]
+                    yield rows
+    finally:
+        release_connection(connection)
+
+@_backend_function
+def copy_export_csv(table, output):
+    """
+    Write an export table as CSV with a header row using COPY
+    
+    The server formats the rows and they are streamed straight to output, so
+    nothing is decoded in Python. Document text is never included.
     
     Args:
-        document_id (int): ID of the document
+        table (str): "documents" or "risk_factors"
+        output: Writable text file
         
     Returns:
-        str: Decrypted document text or None
+        int: Number of rows written, or None if the driver did not report it
+        
+    Raises:
+        ValueError: If the table cannot be exported
+        psycopg2.OperationalError: If the database is unavailable
     """
+    query = _export_sql(table)
+    
     connection = get_connection()
     if not connection:
-        return None
+        raise psycopg2.OperationalError("Database unavailable")
         
     try:
         with connection:
             with connection.cursor() as cursor:
-                cursor.execute(
-                    """
-                    SELECT document_text, is_encrypted 
-                    FROM document_history
-                    WHERE id = %s
-                    """,
-                    (document_id,)
-                )
-                
-                result = cursor.fetchone()
-                if not result or not result[0]:
-                    return None
-                    
-                document_text, is_encrypted = result
-                
-                # Decrypt if encrypted
-                if is_encrypted:
-                    try:
-                        return encryption.decrypt(document_text)
-                    except Exception as e:
-                        logger.error(f"Error decrypting document text: {e}")
-                        return "[Encrypted content - decryption failed]"
-                else:
-                    return document_text
-                
-    except Exception as e:
-        logger.error(f"Error getting document text: {e}")
-        return None
+                cursor.execute("SET TRANSACTION READ ONLY")
+                cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", output)
+                # Read from the COPY command tag
+                return cursor.rowcount if cursor.rowcount >= 0 else None
     finally:
-        connection.close()
+        release_connection(connection)
 
-def get_document_summaries(document_id):
+# Ranked full-text matches. Candidates are ranked and limited before headlines
+# are built, so ts_headline only runs on the rows that are returned.
+SEARCH_DOCUMENTS_SQL = """
+    WITH q AS (
+        SELECT websearch_to_tsquery(document_search_config(%(language)s), %(query)s)
+               || websearch_to_tsquery('simple', %(query)s) AS query
+    ),
+    hits AS (
+        SELECT s.document_id, s.config, ts_rank_cd(s.search_vector, q.query) AS rank
+        FROM document_search s
+        CROSS JOIN q
+        JOIN document_history d ON d.id = s.document_id
+        WHERE s.search_vector @@ q.query
+          {filters}
+        ORDER BY rank DESC, s.document_id DESC
+        LIMIT %(limit)s
+    )
+    SELECT d.id, d.filename, d.upload_date, d.document_language, d.risk_level, d.privacy_level,
+           d.content_id, hits.rank,
+           ts_headline(
+               hits.config,
+               d.filename || E'\\n' || COALESCE(
+                   (SELECT string_agg(r.risk_factor, E'\\n') FROM risk_factors r WHERE r.document_id = d.id), ''
+               ),
+               q.query,
+               'StartSel=**, StopSel=**, MaxFragments=2, MinWords=4, MaxWords=14'
+           ) AS headline
+    FROM hits
+    CROSS JOIN q
+    JOIN document_history d ON d.id = hits.document_id
+    ORDER BY hits.rank DESC, d.id DESC
+"""
+
+# Characters of body text shown around a match
+SNIPPET_CONTEXT = 80
+
+def _text_snippet(text, query):
     """
-    Get all summaries for a document, decrypting if necessary
+    Get a short excerpt of text around the first word of the query it contains
+    
+    Returns:
+        str: Excerpt with the matched word in bold, or None if no word matches
+    """
+    lowered = text.lower()
+    for word in re.findall(r"\w{3,}", query.lower()):
+        position = lowered.find(word)
+        if position < 0:
+            continue
+        start = max(0, position - SNIPPET_CONTEXT)
+        end = min(len(text), position + len(word) + SNIPPET_CONTEXT)
+        excerpt = (
+            text[start:position] + "**" + text[position:position + len(word)] + "**"
+            + text[position + len(word):end]
+        )
+        return ("…" if start > 0 else "") + " ".join(excerpt.split()) + ("…" if end < len(text) else "")
+    return None
+
+@_backend_function
+def search_documents(query, language=None, limit=20, risk_level=None, snippets=True, include_encrypted=True):
+    """
+    Full-text search over filenames, risk factors and standard-privacy text
+    
+    The query accepts web search syntax (quoted phrases, OR, -word). It is parsed
+    with the text search configuration of the given language and with 'simple',
+    so both stemmed and exact word forms match. Filename matches rank above risk
+    factor matches, which rank above matches in the body or summaries.
     
     Args:
-        document_id (int): ID of the document
+        query (str): Search terms
+        language (str, optional): Language of the query (default english)
+        limit (int): Maximum number of results
+        risk_level (str, optional): Only documents with this risk level
+        snippets (bool): Add an excerpt of the body for standard-privacy documents
+        include_encrypted (bool): Append exact-term matches in encrypted documents
+                                  found through the blind index
         
     Returns:
-        list: List of summary records with decrypted content
+        list: Result records with rank, headline (filename and risk factors with
+              matches in bold) and snippet (body excerpt or None), best match first.
+              Blind index matches follow the ranked ones with rank None.
     """
+    if not query or not query.strip():
+        return []
+        
     connection = get_connection()
     if not connection:
         return []
         
+    params = {"query": query, "language": language or "english", "limit": limit}
+    filters = ""
+    if risk_level is not None:
+        filters = "AND d.risk_level = %(risk_level)s"
+        params["risk_level"] = risk_level
+        
     try:
         with connection:
             with connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute(
-                    """
-                    SELECT * FROM document_summaries
-                    WHERE document_id = %s
-                    ORDER BY generation_date DESC
-                    """,
-                    (document_id,)
-                )
-                summaries = cursor.fetchall()
-                
-                # Check for encryption and decrypt if needed
-                for summary in summaries:
-                    if summary.get('is_encrypted') and summary.get('summary_text'):
-                        try:
-                            summary['summary_text'] = encryption.decrypt(summary['summary_text'])
-                        except Exception as e:
-                            logger.error(f"Error decrypting summary: {e}")
-                            summary['summary_text'] = "[Encrypted content - decryption failed]"
+                cursor.execute(SEARCH_DOCUMENTS_SQL.format(filters=filters), params)
+                results = cursor.fetchall()
                 
-                return summaries
+                # Only standard-privacy bodies are readable without decryption
+                bodies = {}
+                content_ids = [
+                    result["content_id"] for result in results
+                    if snippets and result["privacy_level"] == "standard" and result["content_id"]
+                ]
+                if content_ids:
+                    cursor.execute(
+                        """
+                        SELECT id, body, document_text FROM document_contents
+                        WHERE id = ANY(%s) AND NOT is_encrypted
+                        """,
+                        (content_ids,)
+                    )
+                    bodies = {row["id"]: (row["body"], row["document_text"]) for row in cursor.fetchall()}
     except Exception as e:
-        logger.error(f"Error getting document summaries: {e}")
+        logger.error(f"Error searching documents: {e}")
         return []
     finally:
-        connection.close()
+        release_connection(connection)
+        
+    for result in results:
+        result["snippet"] = None
+        body = bodies.get(result.pop("content_id"))
+        if body:
+            try:
+                text = _decode_stored_text(body[0], body[1], False)
+                result["snippet"] = _text_snippet(text, query) if text else None
+            except Exception as e:
+                logger.error(f"Error building search snippet: {e}")
+    
+    if include_encrypted and len(results) < limit:
+        found = {result["id"] for result in results}
+        for document in search_encrypted_documents(query, limit=limit, risk_level=risk_level):
+            if document["id"] in found or len(results) >= limit:
+                continue
+            document.update(rank=None, headline=document["filename"], snippet=None)
+            results.append(document)
+    return results
 
-def get_privacy_settings(document_id):
+@_backend_function
+def search_encrypted_documents(query, limit=20, risk_level=None):
     """
-    Get privacy settings for a document
+    Find encrypted documents containing every word of a query
+    
+    Query words are normalized and hashed with the blind index key in this
+    process; only the digests are sent to the database, which answers with
+    primary key lookups. Matching is exact per word (no stemming or prefixes).
     
     Args:
-        document_id (int): ID of the document
+        query (str): Search terms
+        limit (int): Maximum number of results
+        risk_level (str, optional): Only documents with this risk level
         
     Returns:
-        dict: Privacy settings or None if not found
+        list: Document records (HISTORY_LIST_COLUMNS), newest first
     """
+    term_hashes = [blind_index.term_hash(token) for token in blind_index.tokenize(query)]
+    if not term_hashes:
+        return []
+        
     connection = get_connection()
     if not connection:
-        return None
+        return []
         
+    params = [term_hashes, len(term_hashes)]
+    risk_filter = ""
+    if risk_level is not None:
+        risk_filter = "AND d.risk_level = %s"
+        params.append(risk_level)
+    params.append(limit)
+    
     try:
         with connection:
             with connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute(
-                    """
-                    SELECT * FROM privacy_settings
-                    WHERE document_id = %s
-                    """,
-                    (document_id,)
-                )
-                return cursor.fetchone()
+                cursor.execute(f"""
+                    SELECT {", ".join("d." + column.strip() for column in HISTORY_LIST_COLUMNS.split(","))}
+                    FROM (
+                        SELECT document_id
+                        FROM document_blind_index
+                        WHERE term_hash = ANY(%s)
+                        GROUP BY document_id
+                        HAVING count(*) = %s
+                    ) matches
+                    JOIN document_history d ON d.id = matches.document_id
+                    WHERE TRUE {risk_filter}
+                    ORDER BY d.upload_date DESC, d.id DESC
+                    LIMIT %s
+                """, tuple(params))
+                return cursor.fetchall()
     except Exception as e:
-        logger.error(f"Error getting privacy settings: {e}")
-        return None
+        logger.error(f"Error searching encrypted documents: {e}")
+        return []
     finally:
-        connection.close()
+        release_connection(connection)
 
-def update_privacy_settings(document_id, privacy_level=None, retention_days=None, 
-                          anonymize_text=None, encrypt_storage=None):
+@_postgres_only
+def rebuild_search_content(batch_size=200):
     """
-    Update privacy settings for a document
+    Rebuild the full-text content vectors of standard-privacy documents
+    
+    Decodes each body and its summaries and indexes them, one batch per
+    transaction. Used to index documents stored before search existed.
     
     Args:
-        document_id (int): ID of the document
-        privacy_level (str, optional): Privacy level
-        retention_days (int, optional): Data retention period in days
-        anonymize_text (bool, optional): Whether to anonymize text
-        encrypt_storage (bool, optional): Whether to encrypt storage
+        batch_size (int): Documents indexed per transaction
         
     Returns:
-        bool: Success or failure
+        int: Number of documents indexed
     """
+    ensure_schema()
     connection = get_connection()
     if not connection:
-        return False
+        return 0
         
+    indexed = 0
+    last_id = 0
     try:
-        with connection:
-            with connection.cursor() as cursor:
-                # Only update provided fields
-                update_fields = []
-                params = []
-                
-                if privacy_level is not None:
-                    update_fields.append("privacy_level = %s")
-                    params.append(privacy_level)
-                    
-                if retention_days is not None:
-                    update_fields.append("retention_days = %s")
-                    params.append(retention_days)
-                    
-                if anonymize_text is not None:
-                    update_fields.append("anonymize_text = %s")
-                    params.append(anonymize_text)
-                    
-                if encrypt_storage is not None:
-                    update_fields.append("encrypt_storage = %s")
-                    params.append(encrypt_storage)
+        while True:
+            with connection:
+                with connection.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT d.id, c.body, COALESCE(c.document_text, d.document_text),
+                               COALESCE(
+                                   (SELECT array_agg(COALESCE(encode(s.summary_data, 'base64'), ''))
+                                    FROM document_summaries s WHERE s.document_id = d.id AND NOT s.is_encrypted),
+                                   '{}'
+                               ),
+                               COALESCE(
+                                   (SELECT array_agg(COALESCE(s.summary_text, ''))
+                                    FROM document_summaries s WHERE s.document_id = d.id AND NOT s.is_encrypted),
+                                   '{}'
+                               )
+                        FROM document_history d
+                        LEFT JOIN document_contents c ON c.id = d.content_id
+                        WHERE d.id > %s AND COALESCE(d.privacy_level, 'standard') = 'standard'
+                          AND NOT COALESCE(c.is_encrypted, d.is_encrypted, FALSE)
+                        ORDER BY d.id
+                        LIMIT %s
+                    """, (last_id, batch_size))
+                    rows = cursor.fetchall()
+                    if not rows:
+                        break
+                    last_id = rows[-1][0]
                     
-                if not update_fields:
-                    return False
+                    document_ids = []
+                    texts = []
+                    for document_id, body, legacy_text, summary_data, summary_texts in rows:
+                        try:
+                            parts = [_decode_stored_text(body, legacy_text, False)]
+                            for data, text in zip(summary_data, summary_texts):
+                                parts.append(_decode_stored_text(base64.b64decode(data) if data else None, text, False))
+                        except Exception as e:
+                            logger.error(f"Could not index document {document_id}: {e}")
+                            continue
+                        text = "\n".join(_search_text(part) for part in parts if part)
+                        if text:
+                            document_ids.append(document_id)
+                            texts.append(text)
                     
-                # Add document_id to params
-                params.append(document_id)
-                
-                cursor.execute(f"""
-                    UPDATE privacy_settings 
-                    SET {', '.join(update_fields)}
-                    WHERE document_id = %s
-                """, tuple(params))
-                
-                # Also update document_history privacy_level if provided
-                if privacy_level is not None:
                     cursor.execute("""
-                        UPDATE document_history
-                        SET privacy_level = %s
-                        WHERE id = %s
-                    """, (privacy_level, document_id))
-                
-                return True
+                        UPDATE document_search s
+                        SET content_vector = to_tsvector(s.config, v.text)
+                        FROM unnest(%s::int[], %s::text[]) AS v(document_id, text)
+                        WHERE s.document_id = v.document_id
+                    """, (document_ids, texts))
+                    indexed += cursor.rowcount
+            logger.info(f"Indexed the text of {indexed} documents")
+        return indexed
     except Exception as e:
-        logger.error(f"Error updating privacy settings: {e}")
-        return False
+        logger.error(f"Error rebuilding search index: {e}")
+        return indexed
     finally:
-        connection.close()
+        release_connection(connection)
 
-def delete_document_by_token(access_token):
+@_postgres_only
+def rebuild_blind_index(batch_size=200):
     """
-    Delete a document and all related data using its access token
+    Build the blind index of encrypted documents and summaries
+    
+    Decrypts each document in this process and stores only the token digests,
+    one batch per transaction. Used for documents stored before the blind index
+    existed; rerunning it is harmless.
     
     Args:
-        access_token (str): Document access token
+        batch_size (int): Documents indexed per transaction
         
     Returns:
-        bool: Success or failure
+        int: Number of documents indexed
     """
+    ensure_schema()
     connection = get_connection()
     if not connection:
-        return False
+        return 0
         
+    indexed = 0
+    last_id = 0
     try:
-        with connection:
-            with connection.cursor() as cursor:
-                # Find document_id by token
-                cursor.execute("""
-                    SELECT id FROM document_history
-                    WHERE access_token = %s
-                """, (access_token,))
-                
-                result = cursor.fetchone()
-                if not result:
-                    return False
+        while True:
+            with connection:
+                with connection.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT d.id, c.body, COALESCE(c.document_text, d.document_text),
+                               COALESCE(c.is_encrypted, d.is_encrypted, FALSE),
+                               COALESCE(
+                                   (SELECT array_agg(COALESCE(encode(s.summary_data, 'base64'), ''))
+                                    FROM document_summaries s WHERE s.document_id = d.id AND s.is_encrypted),
+                                   '{}'
+                               ),
+                               COALESCE(
+                                   (SELECT array_agg(COALESCE(s.summary_text, ''))
+                                    FROM document_summaries s WHERE s.document_id = d.id AND s.is_encrypted),
+                                   '{}'
+                               )
+                        FROM document_history d
+                        LEFT JOIN document_contents c ON c.id = d.content_id
+                        WHERE d.id > %s AND COALESCE(d.privacy_level, 'standard') <> 'standard'
+                        ORDER BY d.id
+                        LIMIT %s
+                    """, (last_id, batch_size))
+                    rows = cursor.fetchall()
+                    if not rows:
+                        break
+                    last_id = rows[-1][0]
                     
-                document_id = result[0]
-                
-                # Delete risk factors
-                cursor.execute("""
-                    DELETE FROM risk_factors
-                    WHERE document_id = %s
-                """, (document_id,))
-                
-                # Delete summaries
-                cursor.execute("""
-                    DELETE FROM document_summaries
-                    WHERE document_id = %s
-                """, (document_id,))
-                
-                # Delete privacy settings
-                cursor.execute("""
-                    DELETE FROM privacy_settings
-                    WHERE document_id = %s
-                """, (document_id,))
-                
-                # Delete document
-                cursor.execute("""
-                    DELETE FROM document_history
-                    WHERE id = %s
-                """, (document_id,))
-                
-                return True
+                    document_ids = []
+                    term_hashes = []
+                    for document_id, body, legacy_text, is_encrypted, summary_data, summary_texts in rows:
+                        try:
+                            parts = []
+                            if is_encrypted:
+                                parts.append(_decode_stored_text(body, legacy_text, True))
+                            for data, text in zip(summary_data, summary_texts):
+                                parts.append(_decode_stored_text(base64.b64decode(data) if data else None, text, True))
+                        except Exception as e:
+                            logger.error(f"Could not index document {document_id}: {e}")
+                            continue
+                        hashes = set()
+                        for part in parts:
+                            hashes.update(blind_index.text_hashes(part))
+                        document_ids.extend([document_id] * len(hashes))
+                        term_hashes.extend(hashes)
+                        indexed += 1
+                    
+                    cursor.execute("""
+                        INSERT INTO document_blind_index (document_id, term_hash)
+                        SELECT * FROM unnest(%s::int[], %s::bytea[])
+                        ON CONFLICT DO NOTHING
+                    """, (document_ids, term_hashes))
+            logger.info(f"Built the blind index of {indexed} documents")
+        return indexed
     except Exception as e:
-        logger.error(f"Error deleting document: {e}")
-        return False
+        logger.error(f"Error rebuilding blind index: {e}")
+        return indexed
     finally:
-        connection.close()
\ No newline at end of file
+        release_connection(connection)
@@ -99,6 +99,33 @@ class DocumentEncryption:
             # If decryption fails, return error message
             return f"[Decryption failed: {str(e)}]"
 
+    def encrypt_bytes(self, data):
+        """
+        Encrypt binary data for storage in a bytea column
+
+        Args:
+            data (bytes): Data to encrypt
+
+        Returns:
+            bytes: Raw Fernet token, without the base64 text encoding
+        """
+        return base64.urlsafe_b64decode(self.cipher.encrypt(data))
+
+    def decrypt_bytes(self, encrypted_data):
+        """
+        Decrypt data produced by encrypt_bytes
+
+        Args:
+            encrypted_data (bytes): Raw Fernet token
+
+        Returns:
+            bytes: Decrypted data
+
+        Raises:
+            cryptography.fernet.InvalidToken: If the data was tampered with or the key is wrong
+        """
+        return self.cipher.decrypt(base64.urlsafe_b64encode(bytes(encrypted_data)))
+
 def anonymize_text(text, patterns=None):
     """
     Anonymize sensitive information in text using pattern matching
@@ -184,4 +211,105 @@ def generate_document_token():
     Returns:
         str: Unique document access token
     """
-    return str(uuid.uuid4())
\ No newline at end of file
+    return str(uuid.uuid4())
+
+# Separate salt so the blind index key is independent of the encryption key
+BLIND_INDEX_SALT = b'lawzio_blind_index_salt'
+
+# Bytes of each HMAC kept in the index; 128 bits makes collisions negligible
+BLIND_INDEX_DIGEST_SIZE = 16
+
+# Tokens shorter than this are not indexed
+BLIND_INDEX_MIN_TOKEN_LENGTH = 2
+
+
+class BlindIndex:
+    """
+    Keyed-HMAC blind index for searching encrypted documents
+
+    Each normalized token of a text is turned into an HMAC-SHA256 digest under a
+    key derived from the master key. Only digests are stored, so the database
+    can match exact terms without seeing plaintext or the key.
+    """
+    def __init__(self, master_key=None):
+        """
+        Initialize the blind index with a master key
+
+        Args:
+            master_key (str, optional): Master key. Defaults to BLIND_INDEX_KEY,
+                                        then ENCRYPTION_KEY from the environment.
+        """
+        master_key = master_key or os.environ.get('BLIND_INDEX_KEY') or os.environ.get('ENCRYPTION_KEY')
+        if not master_key:
+            master_key = secrets.token_hex(16)
+
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=BLIND_INDEX_SALT,
+            iterations=100000,
+        )
+        self._key = kdf.derive(master_key.encode('utf-8'))
+
+    @staticmethod
+    def tokenize(text):
+        """
+        Split text into normalized index tokens
+
+        Args:
+            text (str): Text to tokenize
+
+        Returns:
+            set: Case-folded, NFKC-normalized word tokens
+        """
+        import re
+        import unicodedata
+
+        if not text:
+            return set()
+        normalized = unicodedata.normalize('NFKC', text).casefold()
+        # Indic vowel signs are combining marks that \w does not match;
+        # the danda punctuation marks share their block and are stripped
+        tokens = (token.strip('\u0964\u0965') for token in re.findall(r'[\w\u0900-\u0DFF]+', normalized))
+        return {token for token in tokens if len(token) >= BLIND_INDEX_MIN_TOKEN_LENGTH}
+
+    def term_hash(self, token):
+        """
+        Get the index digest of one normalized token
+
+        Args:
+            token (str): Token from tokenize
+
+        Returns:
+            bytes: Truncated HMAC-SHA256 digest
+        """
+        import hmac
+        return hmac.new(self._key, token.encode('utf-8'), hashlib.sha256).digest()[:BLIND_INDEX_DIGEST_SIZE]
+
+    def fingerprint(self, data):
+        """
+        Get a keyed fingerprint of binary content
+
+        Unlike a plain SHA-256, the fingerprint cannot be used to check whether a
+        known file is stored without the key.
+
+        Args:
+            data (bytes): Content to fingerprint
+
+        Returns:
+            str: Hex HMAC-SHA256 digest
+        """
+        import hmac
+        return hmac.new(self._key, b'content:' + data, hashlib.sha256).hexdigest()
+
+    def text_hashes(self, text):
+        """
+        Get the index digests of every token in a text
+
+        Args:
+            text (str): Plain text
+
+        Returns:
+            list: Distinct digests
+        """
+        return [self.term_hash(token) for token in self.tokenize(text)]
@@ -0,0 +1,225 @@
+"""
+Streaming export of document history for analysis tools
+Writes document metadata and risk factors to Parquet or CSV one batch at a
+time, so memory use stays flat whatever the size of the archive. Document text
+is only exported on request, and the text of encrypted documents only when
+decryption is explicitly authorized. Access tokens are never exported.
+
+Usage:
+    python -m utils.export exports/                      # Parquet files in exports/
+    python -m utils.export exports/ --format csv
+    python -m utils.export exports/ --tables documents --include-text
+    python -m utils.export exports/ --include-text --decrypt   # authorized exports only
+"""
+import argparse
+import csv
+import logging
+import os
+import sys
+import time
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from utils.database import ensure_schema, iter_export_batches, copy_export_csv, EXPORT_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Rows read and written per batch; each batch is one Parquet row group
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 5000))
+
+# Parquet compression codec
+PARQUET_COMPRESSION = os.environ.get("EXPORT_PARQUET_COMPRESSION", "zstd")
+
+EXPORT_FORMATS = ["parquet", "csv"]
+
+
+def _parquet_schema(table, include_text):
+    """
+    Get the fixed Parquet schema of an export table
+
+    A fixed schema keeps column types stable across batches, including
+    columns that happen to be empty in a batch.
+    """
+    if table == "documents":
+        fields = [
+            ("id", pyarrow.int64()),
+            ("filename", pyarrow.string()),
+            ("file_size_kb", pyarrow.float64()),
+            ("document_language", pyarrow.string()),
+            ("risk_level", pyarrow.string()),
+            ("content_length", pyarrow.int64()),
+            ("upload_date", pyarrow.timestamp("us")),
+            ("privacy_level", pyarrow.string()),
+            ("is_encrypted", pyarrow.bool_()),
+            ("retention_days", pyarrow.int32()),
+            ("anonymize_text", pyarrow.bool_()),
+        ]
+        if include_text:
+            fields.append(("document_text", pyarrow.large_string()))
+    else:
+        fields = [
+            ("id", pyarrow.int64()),
+            ("document_id", pyarrow.int64()),
+            ("category", pyarrow.string()),
+            ("term", pyarrow.string()),
+            ("occurrence_count", pyarrow.int32()),
+            ("pattern_id", pyarrow.int16()),
+            ("start_offset", pyarrow.int32()),
+            ("end_offset", pyarrow.int32()),
+            ("risk_factor", pyarrow.string()),
+        ]
+    return pyarrow.schema(fields)
+
+
+def _write_parquet(table, path, batches, include_text):
+    schema = _parquet_schema(table, include_text)
+    count = 0
+    with pyarrow.parquet.ParquetWriter(path, schema, compression=PARQUET_COMPRESSION) as writer:
+        for rows in batches:
+            writer.write_table(pyarrow.Table.from_pylist(rows, schema=schema))
+            count += len(rows)
+    return count
+
+
+def _write_csv(table, path, batches, include_text):
+    columns = EXPORT_COLUMNS[table] + (["document_text"] if include_text else [])
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as output:
+        writer = csv.writer(output)
+        writer.writerow(columns)
+        for rows in batches:
+            writer.writerows([row.get(column) for column in columns] for row in rows)
+            count += len(rows)
+    return count
+
+
+def export_table(table, path, file_format="parquet", batch_size=EXPORT_BATCH_SIZE,
+                 include_text=False, decrypt=False):
+    """
+    Export one table to a Parquet or CSV file
+
+    The file is written under a temporary name and renamed when complete, so
+    a failed export never leaves a truncated file at path.
+
+    Args:
+        table (str): "documents" or "risk_factors"
+        path (str): Output file
+        file_format (str): "parquet" or "csv"
+        batch_size (int): Rows per batch
+        include_text (bool): Add document_text to the documents export
+        decrypt (bool): Decrypt the text of encrypted documents. Only set this
+                        when the export is explicitly authorized to contain
+                        protected text; otherwise their document_text is empty.
+
+    Returns:
+        dict: table, path, rows, seconds and rows_per_second (rows is None if
+              the database did not report it)
+
+    Raises:
+        ValueError: If the table, format or options are not supported
+        RuntimeError: If Parquet is requested and pyarrow is not installed
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {file_format}; use {' or '.join(EXPORT_FORMATS)}")
+    if table not in EXPORT_COLUMNS:
+        raise ValueError(f"Cannot export {table}; use one of {', '.join(EXPORT_COLUMNS)}")
+    if decrypt and not include_text:
+        raise ValueError("decrypt only applies to exports that include document text")
+    if file_format == "parquet" and pyarrow is None:
+        raise RuntimeError("Parquet export needs the pyarrow package")
+
+    include_text = include_text and table == "documents"
+    if decrypt and include_text:
+        logger.warning(f"Exporting the decrypted text of encrypted documents to {path}")
+
+    temp_path = path + ".partial"
+    start = time.perf_counter()
+    try:
+        if file_format == "csv" and not include_text:
+            # Nothing to decode, so the server formats the CSV itself
+            with open(temp_path, "w", encoding="utf-8", newline="") as output:
+                rows = copy_export_csv(table, output)
+        else:
+            batches = iter_export_batches(table, batch_size, include_text=include_text, decrypt=decrypt)
+            writer = _write_parquet if file_format == "parquet" else _write_csv
+            rows = writer(table, temp_path, batches, include_text)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    seconds = time.perf_counter() - start
+    result = {
+        "table": table,
+        "path": path,
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if rows is not None and seconds else None,
+    }
+    logger.info(
+        f"Exported {rows if rows is not None else 'all'} rows of {table} to {path} in {seconds:.1f}s"
+        + (f" ({result['rows_per_second']:.0f} rows/s)" if result["rows_per_second"] else "")
+    )
+    return result
+
+
+def export_history(directory, file_format="parquet", tables=None, batch_size=EXPORT_BATCH_SIZE,
+                   include_text=False, decrypt=False):
+    """
+    Export document history tables into a directory, one file per table
+
+    Args:
+        directory (str): Output directory, created if missing
+        file_format (str): "parquet" or "csv"
+        tables (list, optional): Tables to export; all of EXPORT_COLUMNS by default
+        batch_size (int): Rows per batch
+        include_text (bool): Add document_text to the documents export
+        decrypt (bool): Decrypt the text of encrypted documents (see export_table)
+
+    Returns:
+        list: export_table results
+    """
+    os.makedirs(directory, exist_ok=True)
+    return [
+        export_table(table, os.path.join(directory, f"{table}.{file_format}"), file_format,
+                     batch_size, include_text=include_text, decrypt=decrypt)
+        for table in (tables or list(EXPORT_COLUMNS))
+    ]
+
+
+def main(argv=None):
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Export document history to Parquet or CSV")
+    parser.add_argument("directory", help="Output directory")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="parquet", help="File format")
+    parser.add_argument("--tables", nargs="+", choices=list(EXPORT_COLUMNS), help="Tables to export")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE, help="Rows per batch")
+    parser.add_argument("--include-text", action="store_true", help="Export document text")
+    parser.add_argument("--decrypt", action="store_true",
+                        help="Decrypt the text of encrypted documents; only for authorized exports")
+    args = parser.parse_args(argv)
+
+    if not ensure_schema():
+        print("Database unavailable")
+        return 1
+
+    try:
+        results = export_history(args.directory, args.format, args.tables, args.batch_size,
+                                 include_text=args.include_text, decrypt=args.decrypt)
+    except (ValueError, RuntimeError) as e:
+        print(f"Error: {e}")
+        return 1
+
+    for result in results:
+        rate = f" ({result['rows_per_second']:.0f} rows/s)" if result["rows_per_second"] else ""
+        rows = result["rows"] if result["rows"] is not None else "all"
+        print(f"Exported {rows} rows of {result['table']} to {result['path']} in {result['seconds']:.1f}s{rate}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,18 +3,30 @@ History module for displaying document history
 """
 import streamlit as st
 from utils.database import (
-    get_recent_documents, 
-    get_document_with_risk_factors, 
-    get_document_summaries,
-    get_privacy_settings,
+    list_documents, 
+    search_documents,
+    load_document_details,
     update_privacy_settings,
     delete_document_by_token,
-    get_document_text
+    get_document_text_page,
+    write_document_text
 )
 from utils.localization import get_ui_text
 from utils.risk_assessment import get_risk_color
 import pandas as pd
-from datetime import datetime
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+# Number of documents shown per history page
+HISTORY_PAGE_SIZE = 20
+
+# Filter choices for the history list
+RISK_LEVEL_FILTERS = ["High", "Medium", "Low"]
+LANGUAGE_FILTERS = [
+    "english", "hindi", "tamil", "bengali", "marathi", "telugu",
+    "gujarati", "kannada", "malayalam", "punjabi", "urdu", "odia"
+]
 
 def format_date(date_str):
     """Format database timestamp to readable date"""
@@ -34,8 +46,55 @@ def display_history_page(ui_language):
     st.title(get_ui_text("history_title", ui_language))
     st.write(get_ui_text("history_description", ui_language))
     
-    # Get recent documents from database
-    documents = get_recent_documents(limit=20)
+    # Full-text search replaces the paged list while a query is entered
+    search_query = st.text_input(
+        get_ui_text("search_documents", ui_language, "Search documents"),
+        placeholder=get_ui_text("search_placeholder", ui_language, "Filename, risk factor or text")
+    )
+    if search_query.strip():
+        display_search_results(search_query, ui_language)
+        return
+    
+    # Server-side filters
+    all_label = get_ui_text("all", ui_language, "All")
+    filter_col1, filter_col2, filter_col3 = st.columns(3)
+    with filter_col1:
+        risk_filter = st.selectbox(
+            get_ui_text("risk_level", ui_language),
+            [all_label] + RISK_LEVEL_FILTERS
+        )
+    with filter_col2:
+        language_filter = st.selectbox(
+            get_ui_text("language", ui_language),
+            [all_label] + LANGUAGE_FILTERS,
+            format_func=lambda x: x.capitalize()
+        )
+    with filter_col3:
+        date_range = st.date_input(get_ui_text("upload_date", ui_language), value=())
+    
+    date_from = date_to = None
+    if len(date_range) == 2:
+        date_from = datetime.combine(date_range[0], datetime.min.time())
+        date_to = datetime.combine(date_range[1], datetime.min.time()) + timedelta(days=1)
+    
+    filters = {
+        "risk_level": None if risk_filter == all_label else risk_filter,
+        "language": None if language_filter == all_label else language_filter,
+        "date_from": date_from,
+        "date_to": date_to,
+    }
+    
+    # Keyset pagination: keep the cursor of every page visited so far.
+    # Changing a filter starts again from the first page.
+    if st.session_state.get("history_filters") != filters:
+        st.session_state.history_filters = filters
+        st.session_state.history_cursors = [None]
+    
+    documents, next_cursor = list_documents(
+        limit=HISTORY_PAGE_SIZE,
+        cursor=st.session_state.history_cursors[-1],
+        **filters
+    )
     
     if not documents:
         st.info(get_ui_text("no_history", ui_language))
@@ -80,6 +139,17 @@ def display_history_page(ui_language):
         use_container_width=True
     )
     
+    # Page navigation
+    nav_col1, nav_col2 = st.columns(2)
+    with nav_col1:
+        if len(st.session_state.history_cursors) > 1 and st.button(get_ui_text("previous_page", ui_language, "⬅️ Newer")):
+            st.session_state.history_cursors.pop()
+            st.rerun()
+    with nav_col2:
+        if next_cursor is not None and st.button(get_ui_text("next_page", ui_language, "Older ➡️")):
+            st.session_state.history_cursors.append(next_cursor)
+            st.rerun()
+    
     # Allow selecting a document to view details
     if df_data:
         selected_doc_index = st.selectbox(
@@ -92,6 +162,106 @@ def display_history_page(ui_language):
             selected_doc_id = df_data[selected_doc_index]["id"]
             display_document_details(selected_doc_id, ui_language)
     
+def display_search_results(query, ui_language):
+    """
+    Display ranked full-text search results
+    
+    Args:
+        query (str): Search terms
+        ui_language (str): Current UI language
+    """
+    results = search_documents(query, language=ui_language, limit=HISTORY_PAGE_SIZE)
+    
+    if not results:
+        st.info(get_ui_text("no_search_results", ui_language, "No documents match your search"))
+        return
+        
+    for result in results:
+        # Encrypted documents match through the blind index and have no ranked headline
+        lock = "🔒 " if result['rank'] is None else ""
+        st.markdown(
+            f"{lock}**{result['filename']}** · {format_date(result['upload_date'])} · "
+            f"{get_ui_text('risk_level', ui_language)} {result['risk_level']}"
+        )
+        st.caption(result['headline'])
+        if result['snippet']:
+            st.markdown(f"> {result['snippet']}")
+    
+    selected_index = st.selectbox(
+        get_ui_text("select_document", ui_language),
+        range(len(results)),
+        format_func=lambda x: results[x]["filename"]
+    )
+    if selected_index is not None:
+        display_document_details(results[selected_index]["id"], ui_language)
+    
+def display_document_text(document_id, filename, ui_language):
+    """
+    Display the text of a document one page at a time, with a download
+    
+    Only the current page is read from the database, so large transcripts do
+    not have to fit in memory to be viewed.
+    
+    Args:
+        document_id (int): ID of the document
+        filename (str): Original filename, used to name the download
+        ui_language (str): Current UI language
+    """
+    page_key = f"document_text_page_{document_id}"
+    page = st.session_state.get(page_key, 0)
+    document_text, has_more = get_document_text_page(document_id, page)
+    if not document_text:
+        return
+        
+    label = get_ui_text("document_text", ui_language, "Document Text")
+    if page or has_more:
+        label += " · " + get_ui_text("text_page", ui_language, page + 1)
+    st.text_area(label, document_text, height=300, disabled=True)
+    
+    nav_col1, nav_col2, nav_col3 = st.columns(3)
+    with nav_col1:
+        if page > 0 and st.button(get_ui_text("previous_text_page", ui_language), key=f"{page_key}_previous"):
+            st.session_state[page_key] = page - 1
+            st.rerun()
+    with nav_col2:
+        if has_more and st.button(get_ui_text("next_text_page", ui_language), key=f"{page_key}_next"):
+            st.session_state[page_key] = page + 1
+            st.rerun()
+    with nav_col3:
+        # The text is written to a temporary file kept across reruns. Streamlit
+        # still reads the whole file into memory to serve the download.
+        download_key = f"{page_key}_download_path"
+        if download_key not in st.session_state:
+            if st.button(get_ui_text("prepare_text_download", ui_language), key=f"{page_key}_prepare"):
+                with tempfile.NamedTemporaryFile(prefix="lawzio-", suffix=".txt", delete=False) as download:
+                    try:
+                        write_document_text(document_id, download)
+                    except Exception:
+                        os.remove(download.name)
+                        raise
+                st.session_state[download_key] = download.name
+                st.rerun()
+        elif os.path.exists(st.session_state[download_key]):
+            with open(st.session_state[download_key], "rb") as download:
+                st.download_button(
+                    get_ui_text("download_text", ui_language),
+                    data=download,
+                    file_name=os.path.splitext(filename)[0] + ".txt",
+                    mime="text/plain",
+                    key=f"{page_key}_download",
+                    on_click=_discard_text_download,
+                    args=(download_key,)
+                )
+        else:
+            del st.session_state[download_key]
+            st.rerun()
+    
+def _discard_text_download(download_key):
+    """Remove a downloaded temporary file and forget it"""
+    path = st.session_state.pop(download_key, None)
+    if path and os.path.exists(path):
+        os.remove(path)
+
 def display_document_details(document_id, ui_language):
     """
     Display details for a specific document
@@ -100,15 +270,14 @@ def display_document_details(document_id, ui_language):
         document_id (int): ID of the document to display
         ui_language (str): Current UI language
     """
-    # Get document with risk factors
-    document = get_document_with_risk_factors(document_id)
+    # Get document with risk factors, summaries and privacy settings
+    document = load_document_details(document_id)
     
     if not document:
         st.error(get_ui_text("document_not_found", ui_language))
         return
         
-    # Get privacy settings
-    privacy_settings = get_privacy_settings(document_id)
+    privacy_settings = document['privacy_settings']
     
     # Display document info in an expander
     with st.expander(get_ui_text("document_details", ui_language), expanded=True):
@@ -156,6 +325,13 @@ def display_document_details(document_id, ui_language):
                     st.markdown(f"• {factor}")
             else:
                 st.markdown(f"**{get_ui_text('no_risk_factors', ui_language)}**")
+        
+        # The body is stored separately and only fetched on request
+        if document.get('content_length') and st.checkbox(
+            get_ui_text("show_document_text", ui_language, "Show document text"),
+            key=f"show_document_text_{document_id}"
+        ):
+            display_document_text(document_id, document['filename'], ui_language)
     
     # Privacy settings section
     if privacy_settings:
@@ -237,8 +413,8 @@ def display_document_details(document_id, ui_language):
                     else:
                         st.error(get_ui_text("delete_failed", ui_language, "Failed to delete document"))
     
-    # Get summaries for this document
-    summaries = get_document_summaries(document_id)
+    # Summaries are decrypted only when their text is shown
+    summaries = document['summaries']
     
     if summaries:
         st.subheader(get_ui_text("document_summaries", ui_language))
@@ -251,27 +427,33 @@ def display_document_details(document_id, ui_language):
                 summaries_by_language[language] = []
             summaries_by_language[language].append(summary)
         
-        # Create tabs for each language
+        # One language at a time; unlike tabs, a radio only renders the selected
+        # language, so summaries in other languages are never decrypted
         if summaries_by_language:
-            tabs = st.tabs(list(summaries_by_language.keys()))
-            for i, (language, language_summaries) in enumerate(summaries_by_language.items()):
-                with tabs[i]:
-                    # Sort by detail level (simple first, then detailed)
-                    language_summaries.sort(key=lambda x: 0 if x['detail_level'] == 'simple' else 1)
+            language = st.radio(
+                get_ui_text("summary_language", ui_language, "Summary language"),
+                list(summaries_by_language.keys()),
+                horizontal=True,
+                key=f"summary_language_{document_id}"
+            )
+            language_summaries = summaries_by_language[language]
+            
+            # Sort by detail level (simple first, then detailed)
+            language_summaries.sort(key=lambda x: 0 if x['detail_level'] == 'simple' else 1)
+            
+            for summary in language_summaries:
+                with st.expander(
+                    f"{get_ui_text(summary['detail_level'] + '_summary', ui_language)} ({format_date(summary['generation_date'])})",
+                    expanded=summary is language_summaries[0]
+                ):
+                    st.markdown(summary['summary_text'])
                     
-                    for summary in language_summaries:
-                        with st.expander(
-                            f"{get_ui_text(summary['detail_level'] + '_summary', ui_language)} ({format_date(summary['generation_date'])})",
-                            expanded=True if summary == language_summaries[0] else False
-                        ):
-                            st.markdown(summary['summary_text'])
-                            
-                            # Add download button for this summary
-                            st.download_button(
-                                label=get_ui_text('download_summary', ui_language),
-                                data=summary['summary_text'],
-                                file_name=f"legal_summary_{summary['detail_level']}_{summary['language']}.txt",
-                                mime="text/plain"
-                            )
+                    # Add download button for this summary
+                    st.download_button(
+                        label=get_ui_text('download_summary', ui_language),
+                        data=summary['summary_text'],
+                        file_name=f"legal_summary_{summary['detail_level']}_{summary['language']}.txt",
+                        mime="text/plain"
+                    )
     else:
         st.info(get_ui_text("no_summaries", ui_language))
\ No newline at end of file
@@ -0,0 +1,262 @@
+"""
+Fast language detection for English and Indian languages
+Uses a Unicode-block histogram to identify the script and only falls back
+to langdetect to tell apart languages that share a script
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langdetect import DetectorFactory, detect_langs, LangDetectException
+
+# Make langdetect deterministic between calls
+DetectorFactory.seed = 0
+
+# Maximum number of characters inspected per text
+SAMPLE_SIZE = 2000
+
+# Maximum number of memoized detection results
+CACHE_SIZE = 4096
+
+# Unicode blocks are 128 code points wide, so (code_point >> 7) identifies the block
+SCRIPT_BLOCKS = {
+    0x0600 >> 7: "arabic",
+    0x0680 >> 7: "arabic",
+    0x0900 >> 7: "devanagari",
+    0x0980 >> 7: "bengali",
+    0x0A00 >> 7: "gurmukhi",
+    0x0A80 >> 7: "gujarati",
+    0x0B00 >> 7: "oriya",
+    0x0B80 >> 7: "tamil",
+    0x0C00 >> 7: "telugu",
+    0x0C80 >> 7: "kannada",
+    0x0D00 >> 7: "malayalam",
+}
+
+# Languages written in each script, most likely first
+SCRIPT_LANGUAGES = {
+    "latin": ["english"],
+    "arabic": ["urdu"],
+    "devanagari": ["hindi", "marathi"],
+    "bengali": ["bengali"],
+    "gurmukhi": ["punjabi"],
+    "gujarati": ["gujarati"],
+    "oriya": ["odia"],
+    "tamil": ["tamil"],
+    "telugu": ["telugu"],
+    "kannada": ["kannada"],
+    "malayalam": ["malayalam"],
+}
+
+# langdetect codes for the languages that need disambiguation
+LANGDETECT_CODES = {
+    "hi": "hindi",
+    "mr": "marathi",
+}
+
+# Paragraph and sentence separators, captured so segments can be stitched back exactly
+PARAGRAPH_SEPARATOR = re.compile(r'(\n\s*\n)')
+SENTENCE_SEPARATOR = re.compile(r'((?<=[.!?।॥۔])\s+)')
+
+# A paragraph is split into sentences when its second script has at least this share of letters
+MIXED_SCRIPT_SHARE = 0.1
+
+# A document is only split by language when a second script has at least this
+# share of its letters; stray Latin citations do not make a Hindi text bilingual
+MULTI_SCRIPT_SHARE = 0.02
+
+_FIRST_BLOCK = min(SCRIPT_BLOCKS)
+_LAST_BLOCK = max(SCRIPT_BLOCKS)
+_BLOCK_SCRIPTS = np.array(
+    [SCRIPT_BLOCKS.get(block, "") for block in range(_FIRST_BLOCK, _LAST_BLOCK + 1)],
+    dtype=object
+)
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _sample_text(text, size=SAMPLE_SIZE):
+    """
+    Get a bounded sample of the text from its start, middle and end
+
+    Args:
+        text (str): Full text
+        size (int): Maximum sample length
+
+    Returns:
+        str: Sample of at most size characters
+    """
+    if len(text) <= size:
+        return text
+    part = size // 3
+    middle = len(text) // 2
+    return text[:part] + text[middle - part // 2:middle + part // 2] + text[-part:]
+
+
+def script_histogram(text):
+    """
+    Count letters per script in a text
+
+    Args:
+        text (str): Text to inspect
+
+    Returns:
+        dict: {script name: letter count} for every script present
+    """
+    code_points = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+
+    # ASCII letters
+    lowered = code_points | 0x20
+    histogram = {"latin": int(np.count_nonzero((lowered >= 0x61) & (lowered <= 0x7A)))}
+
+    # Indic and Arabic blocks
+    blocks = code_points >> 7
+    in_range = blocks[(blocks >= _FIRST_BLOCK) & (blocks <= _LAST_BLOCK)] - _FIRST_BLOCK
+    if in_range.size:
+        counts = np.bincount(in_range, minlength=len(_BLOCK_SCRIPTS))
+        for index in np.nonzero(counts)[0]:
+            script = _BLOCK_SCRIPTS[index]
+            if script:
+                histogram[script] = histogram.get(script, 0) + int(counts[index])
+
+    return {script: count for script, count in histogram.items() if count}
+
+
+def dominant_script(text):
+    """
+    Get the script with the most letters in a sample of the text
+
+    Args:
+        text (str): Text to inspect
+
+    Returns:
+        str: Script name or None if the text has no letters in a known script
+    """
+    histogram = script_histogram(_sample_text(text))
+    if not histogram:
+        return None
+    return max(histogram.items(), key=lambda item: item[1])[0]
+
+
+def _disambiguate(sample, candidates):
+    """Pick between languages that share a script using langdetect"""
+    try:
+        for result in detect_langs(sample):
+            language = LANGDETECT_CODES.get(result.lang)
+            if language in candidates:
+                return language
+    except LangDetectException:
+        pass
+    return candidates[0]
+
+
+def _detect_uncached(text):
+    sample = _sample_text(text)
+    histogram = script_histogram(sample)
+    if not histogram:
+        return "english"
+
+    script = max(histogram.items(), key=lambda item: item[1])[0]
+    candidates = SCRIPT_LANGUAGES[script]
+    if len(candidates) == 1:
+        return candidates[0]
+    return _disambiguate(sample, candidates)
+
+
+def detect_language(text):
+    """
+    Detect the language of a text
+
+    The script is identified from a Unicode-block histogram. langdetect is only
+    consulted when several supported languages share that script (Hindi and
+    Marathi). Results are memoized by a hash of the text.
+
+    Args:
+        text (str): Text to detect language of
+
+    Returns:
+        str: Language name (english, hindi, etc.). Defaults to english.
+    """
+    if not text or not text.strip():
+        return "english"
+
+    key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    language = _detect_uncached(text)
+
+    with _cache_lock:
+        _cache[key] = language
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+    return language
+
+
+def _is_mixed(paragraph):
+    """Check whether a paragraph has a significant share of letters in a second script"""
+    counts = sorted(script_histogram(_sample_text(paragraph)).values(), reverse=True)
+    return len(counts) > 1 and counts[1] >= MIXED_SCRIPT_SHARE * sum(counts)
+
+
+def split_by_language(text):
+    """
+    Split a text into runs of a single language
+
+    A text written in one script is returned as a single run. Otherwise it is
+    split into paragraphs, and paragraphs that mix scripts are split further
+    into sentences. Each script gets one language for the whole text, so
+    langdetect runs at most once per script that several languages share
+    rather than once per paragraph. Adjacent segments in the same language are
+    merged, and segments without letters (numbering, whitespace) join the
+    preceding run. Joining the chunks of the result gives back the original
+    text exactly.
+
+    Args:
+        text (str): Text to split
+
+    Returns:
+        list: List of (chunk, language) tuples in document order. language is
+              None for a leading run without any letters.
+    """
+    counts = script_histogram(text).values()
+    if sum(1 for count in counts if count >= MULTI_SCRIPT_SHARE * sum(counts)) < 2:
+        return [(text, detect_language(text) if dominant_script(text) else None)] if text else []
+
+    pieces = []
+    for paragraph in PARAGRAPH_SEPARATOR.split(text):
+        if not paragraph.strip():
+            pieces.append(paragraph)
+        elif _is_mixed(paragraph):
+            pieces.extend(SENTENCE_SEPARATOR.split(paragraph))
+        else:
+            pieces.append(paragraph)
+
+    pieces = [(piece, dominant_script(piece)) for piece in pieces if piece]
+    script_languages = {}
+    for script in {script for _, script in pieces if script}:
+        candidates = SCRIPT_LANGUAGES[script]
+        if len(candidates) == 1:
+            script_languages[script] = candidates[0]
+        else:
+            script_languages[script] = detect_language(
+                "".join(piece for piece, piece_script in pieces if piece_script == script)
+            )
+
+    runs = []
+    for piece, script in pieces:
+        language = script_languages.get(script)
+
+        if runs and (language is None or runs[-1][1] in (None, language)):
+            chunk, run_language = runs[-1]
+            runs[-1] = (chunk + piece, run_language if language is None else language)
+        else:
+            runs.append((piece, language))
+
+    return runs
@@ -2,6 +2,9 @@
 Localization module for translating the UI elements
 Uses language-specific dictionaries for UI translations
 """
+import threading
+
+from utils.risk_assessment import RISK_FACTOR_KINDS, format_risk_factor, get_risk_factor_name
 
 # Translation dictionaries for UI elements in different languages
 TRANSLATIONS = {
@@ -101,6 +104,9 @@ TRANSLATIONS = {
         "risk_level": "Risk Level:",
         "risk_factors_detected": "Risk Factors Detected:",
         "no_risk_factors": "No specific risk factors detected",
+        "risk_factor_high_term": "High-risk term: '{0}' found {1} times",
+        "risk_factor_high_pattern": "High-risk pattern: {0}",
+        "risk_factor_medium_term": "Medium-risk term: '{0}' found {1} times",
         
         # Document preview
         "document_preview": "Document Preview",
@@ -149,10 +155,38 @@ TRANSLATIONS = {
         "document_not_found": "Document not found in the database.",
         "document_summaries": "Document Summaries",
         "no_summaries": "No summaries found for this document.",
+        "all": "All",
+        "previous_page": "⬅️ Newer",
+        "next_page": "Older ➡️",
+        "show_document_text": "Show document text",
+        "document_text": "Document Text",
+        "text_page": "page {0}",
+        "previous_text_page": "⬅️ Previous page",
+        "next_text_page": "Next page ➡️",
+        "prepare_text_download": "Prepare text download",
+        "download_text": "Download text",
+        "summary_language": "Summary language",
+        "search_documents": "Search documents",
+        "search_placeholder": "Filename, risk factor or text",
+        "no_search_results": "No documents match your search",
+        
+        # Statistics page
+        "stats_title": "Document Statistics",
+        "stats_description": "Volumes of processed documents by risk level, language and privacy level.",
+        "stats_period": "Period",
+        "no_stats": "No documents were processed in this period.",
+        "total_documents": "Documents",
+        "total_size_mb": "Total size (MB)",
+        "average_length": "Average length (characters)",
+        "documents_per_day": "Documents per day",
+        "by_risk_level": "By risk level",
+        "by_language": "By language",
+        "by_privacy_level": "By privacy level",
         
         # Tab names
         "process_document_tab": "📄 Process Document",
         "document_history_tab": "📋 Document History",
+        "statistics_tab": "📊 Statistics",
         
         # Upload section
         "upload_title": "UPLOAD YOUR LEGAL DOCUMENT",
@@ -222,6 +256,9 @@ TRANSLATIONS = {
         "risk_level": "जोखिम स्तर:",
         "risk_factors_detected": "पहचाने गए जोखिम कारक:",
         "no_risk_factors": "कोई विशिष्ट जोखिम कारक नहीं मिला",
+        "risk_factor_high_term": "उच्च जोखिम शब्द: '{0}' {1} बार मिला",
+        "risk_factor_high_pattern": "उच्च जोखिम पैटर्न: {0}",
+        "risk_factor_medium_term": "मध्यम जोखिम शब्द: '{0}' {1} बार मिला",
         
         # Document preview
         "document_preview": "दस्तावेज़ पूर्वावलोकन",
@@ -331,6 +368,9 @@ TRANSLATIONS = {
         "risk_level": "ஆபத்து நிலை:",
         "risk_factors_detected": "கண்டறியப்பட்ட ஆபத்து காரணிகள்:",
         "no_risk_factors": "குறிப்பிட்ட ஆபத்து காரணிகள் எதுவும் கண்டறியப்படவில்லை",
+        "risk_factor_high_term": "அதிக ஆபத்து சொல்: '{0}' {1} முறை கண்டறியப்பட்டது",
+        "risk_factor_high_pattern": "அதிக ஆபத்து முறை: {0}",
+        "risk_factor_medium_term": "நடுத்தர ஆபத்து சொல்: '{0}' {1} முறை கண்டறியப்பட்டது",
         
         # Document preview
         "document_preview": "ஆவண முன்னோட்டம்",
@@ -752,4 +792,87 @@ def get_ui_text(key, language='english', *format_args):
             print(f"Error formatting text '{key}': {e}")
             return text
     
-    return text
\ No newline at end of file
+    return text
+
+
+# Per-language risk factor templates and term names, filled once per process
+_risk_templates = {}
+_risk_names = {}
+_risk_lock = threading.Lock()
+
+def _get_risk_templates(language, translator):
+    """
+    Get the risk factor templates for a language
+
+    Hand-written templates in TRANSLATIONS are used when present. Otherwise the
+    English template is machine-translated once; a translation that loses a
+    placeholder falls back to English.
+    """
+    with _risk_lock:
+        if language in _risk_templates:
+            return _risk_templates[language]
+
+    templates = {}
+    missing = []
+    texts = TRANSLATIONS.get(language, {})
+    for kind in RISK_FACTOR_KINDS:
+        key = f"risk_factor_{kind}"
+        if key in texts:
+            templates[kind] = texts[key]
+        else:
+            missing.append(kind)
+
+    if missing:
+        english = [RISK_FACTOR_KINDS[kind]["template"] for kind in missing]
+        for kind, english_template, translated in zip(missing, english, translator.translate_many(english, language)):
+            placeholders_kept = all(p in translated for p in ("{0}", "{1}") if p in english_template)
+            templates[kind] = translated if translated and placeholders_kept else english_template
+
+    with _risk_lock:
+        _risk_templates[language] = templates
+    return templates
+
+def localize_risk_factors(risk_factors, language='english', translator=None):
+    """
+    Get display text for risk factors in the given language
+
+    Templates and term names are translated once per language and cached;
+    counts are filled in locally, so repeated calls make no translation requests.
+
+    Args:
+        risk_factors (list): Risk factor records from assess_risk_level
+        language (str): Target language name
+        translator (TranslationHelper, optional): Used to translate templates and names
+            that have no hand-written translation
+
+    Returns:
+        list: Display strings in input order
+    """
+    if language == 'english' or translator is None:
+        return [format_risk_factor(factor) for factor in risk_factors]
+
+    records = [factor for factor in risk_factors if not isinstance(factor, str)]
+    templates = _get_risk_templates(language, translator)
+
+    # Translate any term or pattern names not seen before in one batch
+    names = list(dict.fromkeys(get_risk_factor_name(factor) for factor in records))
+    with _risk_lock:
+        missing = [name for name in names if (language, name) not in _risk_names]
+    if missing:
+        translated = translator.translate_many(missing, language)
+        with _risk_lock:
+            for name, translated_name in zip(missing, translated):
+                _risk_names[(language, name)] = translated_name or name
+
+    localized = []
+    for factor in risk_factors:
+        if isinstance(factor, str):
+            localized.append(factor)
+            continue
+        name = get_risk_factor_name(factor)
+        localized.append(format_risk_factor(
+            factor,
+            template=templates[factor["kind"]],
+            name=_risk_names.get((language, name), name)
+        ))
+    return localized
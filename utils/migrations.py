@@ -0,0 +1,854 @@
+"""
+Versioned schema migrations for the document history tables
+Creates document_history, risk_factors, document_summaries and privacy_settings
+with their indexes and constraints, and verifies the live schema
+
+Migrations are applied by the deploy step, never by the application; the
+migrate command runs without the pool's statement timeout.
+
+Usage:
+    python -m utils.migrations migrate   # apply pending migrations
+    python -m utils.migrations status    # show applied and pending migrations
+    python -m utils.migrations verify    # check the live schema matches
+    python -m utils.migrations move-bodies  # move document bodies to document_contents
+    python -m utils.migrations compress     # convert text bodies and summaries to compressed storage
+    python -m utils.migrations reindex-search  # index the text of existing standard-privacy documents
+    python -m utils.migrations reindex-blind   # build the blind index of existing encrypted documents
+    python -m utils.migrations partition       # convert document_history to monthly partitions
+"""
+import os
+import sys
+import logging
+from datetime import timedelta
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for the advisory lock that serializes concurrent migration runs
+MIGRATION_LOCK_ID = 7202504
+
+# Rows written per transaction by the backfill steps
+BACKFILL_BATCH_SIZE = int(os.environ.get("MIGRATION_BACKFILL_BATCH_SIZE", 5000))
+
+
+def _backfill_document_search(connection, batch_size=BACKFILL_BATCH_SIZE):
+    """Index the filenames and risk factors of existing documents, one batch per transaction"""
+    last_id = 0
+    while True:
+        with connection:
+            with connection.cursor() as cursor:
+                cursor.execute("""
+                    WITH batch AS (
+                        SELECT id, filename, document_language
+                        FROM document_history
+                        WHERE id > %s
+                        ORDER BY id
+                        LIMIT %s
+                        FOR KEY SHARE
+                    ),
+                    indexed AS (
+                        INSERT INTO document_search (document_id, config, filename_vector, factors_vector)
+                        SELECT d.id, c.cfg,
+                               to_tsvector(c.cfg, regexp_replace(COALESCE(d.filename, ''), '[._-]+', ' ', 'g')),
+                               to_tsvector(c.cfg, COALESCE(
+                                   (SELECT string_agg(r.risk_factor, ' ') FROM risk_factors r WHERE r.document_id = d.id), ''
+                               ))
+                        FROM batch d
+                        CROSS JOIN LATERAL (SELECT document_search_config(d.document_language) AS cfg) c
+                        ON CONFLICT (document_id) DO NOTHING
+                    )
+                    SELECT max(id) FROM batch
+                """, (last_id, batch_size))
+                last_id = cursor.fetchone()[0]
+        if last_id is None:
+            return
+
+
+def _backfill_document_stats(connection):
+    """
+    Count existing documents into document_stats_daily, one month per transaction
+
+    Each month is recounted from scratch while writes to document_history wait,
+    which replaces whatever the triggers added for it meanwhile, so the rollup
+    is exact however often this runs.
+    """
+    with connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT min(upload_date)::date, max(upload_date)::date FROM document_history")
+            first_day, last_day = cursor.fetchone()
+    if first_day is None:
+        return
+
+    month = first_day.replace(day=1)
+    while month <= last_day:
+        next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+        with connection:
+            with connection.cursor() as cursor:
+                cursor.execute("LOCK TABLE document_history IN SHARE MODE")
+                cursor.execute(
+                    "DELETE FROM document_stats_daily WHERE day >= %s AND day < %s",
+                    (month, next_month)
+                )
+                cursor.execute("""
+                    INSERT INTO document_stats_daily
+                        (day, risk_level, document_language, privacy_level, documents, total_size_kb, total_length)
+                    SELECT upload_date::date, COALESCE(risk_level, 'Unknown'), COALESCE(document_language, 'unknown'),
+                           privacy_level, count(*), COALESCE(sum(file_size_kb), 0), COALESCE(sum(content_length), 0)
+                    FROM document_history
+                    WHERE upload_date >= %s AND upload_date < %s
+                    GROUP BY 1, 2, 3, 4
+                """, (month, next_month))
+        month = next_month
+
+
+# Ordered list of (version, description, steps). Steps are an SQL string or a
+# list of SQL strings and functions taking the connection; each step commits
+# on its own and must be safe to run again if a later step fails. Never edit
+# an applied migration; append a new one instead.
+MIGRATIONS = [
+    (1, "Create document history tables", """
+        CREATE TABLE IF NOT EXISTS document_history (
+            id SERIAL PRIMARY KEY,
+            filename VARCHAR(255) NOT NULL,
+            file_size_kb NUMERIC(12, 2),
+            document_language VARCHAR(32),
+            risk_level VARCHAR(16),
+            content_length INTEGER,
+            upload_date TIMESTAMP NOT NULL DEFAULT NOW(),
+            document_text TEXT,
+            is_encrypted BOOLEAN NOT NULL DEFAULT FALSE,
+            access_token VARCHAR(64),
+            privacy_level VARCHAR(16) NOT NULL DEFAULT 'standard'
+        );
+
+        CREATE TABLE IF NOT EXISTS risk_factors (
+            id SERIAL PRIMARY KEY,
+            document_id INTEGER NOT NULL REFERENCES document_history (id) ON DELETE CASCADE,
+            risk_factor TEXT NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS document_summaries (
+            id SERIAL PRIMARY KEY,
+            document_id INTEGER NOT NULL REFERENCES document_history (id) ON DELETE CASCADE,
+            summary_text TEXT,
+            detail_level VARCHAR(16),
+            language VARCHAR(32),
+            is_encrypted BOOLEAN NOT NULL DEFAULT FALSE,
+            generation_date TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+
+        CREATE TABLE IF NOT EXISTS privacy_settings (
+            id SERIAL PRIMARY KEY,
+            document_id INTEGER NOT NULL REFERENCES document_history (id) ON DELETE CASCADE,
+            privacy_level VARCHAR(16) NOT NULL DEFAULT 'standard',
+            retention_days INTEGER NOT NULL DEFAULT 30,
+            anonymize_text BOOLEAN NOT NULL DEFAULT FALSE,
+            encrypt_storage BOOLEAN NOT NULL DEFAULT FALSE,
+            access_token VARCHAR(64),
+            created_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+    """),
+    (2, "Structured risk factor columns", """
+        ALTER TABLE risk_factors
+            ADD COLUMN IF NOT EXISTS category VARCHAR(32),
+            ADD COLUMN IF NOT EXISTS term VARCHAR(100),
+            ADD COLUMN IF NOT EXISTS occurrence_count INTEGER,
+            ADD COLUMN IF NOT EXISTS pattern_id SMALLINT,
+            ADD COLUMN IF NOT EXISTS start_offset INTEGER,
+            ADD COLUMN IF NOT EXISTS end_offset INTEGER;
+    """),
+    (3, "Indexes for history listing, token lookup and foreign keys", """
+        CREATE INDEX IF NOT EXISTS idx_document_history_upload_date_id
+            ON document_history (upload_date DESC, id DESC);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_document_history_access_token
+            ON document_history (access_token);
+        CREATE INDEX IF NOT EXISTS idx_risk_factors_document_id
+            ON risk_factors (document_id);
+        CREATE INDEX IF NOT EXISTS idx_risk_factors_category_term
+            ON risk_factors (category, term, document_id);
+        CREATE INDEX IF NOT EXISTS idx_risk_factors_category_pattern
+            ON risk_factors (category, pattern_id, document_id) WHERE pattern_id IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS idx_document_summaries_document_id
+            ON document_summaries (document_id, generation_date DESC);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_privacy_settings_document_id
+            ON privacy_settings (document_id);
+        CREATE INDEX IF NOT EXISTS idx_privacy_settings_access_token
+            ON privacy_settings (access_token);
+    """),
+    (4, "Cascading foreign keys and value constraints", ["""
+        -- Tables created before migrations shipped may have non-cascading foreign keys
+        DO $$
+        DECLARE
+            fk RECORD;
+        BEGIN
+            FOR fk IN
+                SELECT c.conname, c.conrelid::regclass AS table_name
+                FROM pg_constraint c
+                WHERE c.contype = 'f'
+                  AND c.confrelid = 'document_history'::regclass
+                  AND c.confdeltype <> 'c'
+            LOOP
+                EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', fk.table_name, fk.conname);
+            END LOOP;
+        END $$;
+
+        DO $$
+        DECLARE
+            child TEXT;
+        BEGIN
+            FOREACH child IN ARRAY ARRAY['risk_factors', 'document_summaries', 'privacy_settings']
+            LOOP
+                IF NOT EXISTS (
+                    SELECT 1 FROM pg_constraint
+                    WHERE contype = 'f'
+                      AND conrelid = child::regclass
+                      AND confrelid = 'document_history'::regclass
+                ) THEN
+                    EXECUTE format(
+                        'ALTER TABLE %I ADD CONSTRAINT %I FOREIGN KEY (document_id) '
+                        'REFERENCES document_history (id) ON DELETE CASCADE NOT VALID',
+                        child, child || '_document_id_fkey'
+                    );
+                END IF;
+            END LOOP;
+        END $$;
+
+        ALTER TABLE document_history DROP CONSTRAINT IF EXISTS document_history_privacy_level_check;
+        ALTER TABLE document_history ADD CONSTRAINT document_history_privacy_level_check
+            CHECK (privacy_level IN ('standard', 'enhanced', 'maximum')) NOT VALID;
+
+        ALTER TABLE document_history DROP CONSTRAINT IF EXISTS document_history_risk_level_check;
+        ALTER TABLE document_history ADD CONSTRAINT document_history_risk_level_check
+            CHECK (risk_level IS NULL OR risk_level IN ('Low', 'Medium', 'High', 'Unknown')) NOT VALID;
+
+        ALTER TABLE privacy_settings DROP CONSTRAINT IF EXISTS privacy_settings_privacy_level_check;
+        ALTER TABLE privacy_settings ADD CONSTRAINT privacy_settings_privacy_level_check
+            CHECK (privacy_level IN ('standard', 'enhanced', 'maximum')) NOT VALID;
+
+        ALTER TABLE privacy_settings DROP CONSTRAINT IF EXISTS privacy_settings_retention_days_check;
+        ALTER TABLE privacy_settings ADD CONSTRAINT privacy_settings_retention_days_check
+            CHECK (retention_days > 0) NOT VALID;
+
+        ALTER TABLE document_summaries DROP CONSTRAINT IF EXISTS document_summaries_detail_level_check;
+        ALTER TABLE document_summaries ADD CONSTRAINT document_summaries_detail_level_check
+            CHECK (detail_level IN ('simple', 'detailed')) NOT VALID;
+    """, """
+        -- Validated in a separate transaction, which only blocks schema changes
+        DO $$
+        DECLARE
+            c RECORD;
+        BEGIN
+            FOR c IN
+                SELECT conname, conrelid::regclass AS table_name
+                FROM pg_constraint
+                WHERE NOT convalidated
+                  AND conrelid = ANY (ARRAY['document_history', 'risk_factors',
+                                            'document_summaries', 'privacy_settings']::regclass[])
+            LOOP
+                EXECUTE format('ALTER TABLE %s VALIDATE CONSTRAINT %I', c.table_name, c.conname);
+            END LOOP;
+        END $$;
+    """]),
+    (5, "Indexes for filtered history pages", """
+        CREATE INDEX IF NOT EXISTS idx_document_history_risk_level_upload_date
+            ON document_history (risk_level, upload_date DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS idx_document_history_language_upload_date
+            ON document_history (document_language, upload_date DESC, id DESC);
+    """),
+    (6, "Separate table for document bodies", """
+        CREATE TABLE IF NOT EXISTS document_contents (
+            id BIGSERIAL PRIMARY KEY,
+            content_key VARCHAR(80) NOT NULL UNIQUE,
+            document_text TEXT,
+            is_encrypted BOOLEAN NOT NULL DEFAULT FALSE,
+            created_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+
+        -- Bodies are moved out of document_history in batches by
+        -- utils.database.migrate_document_bodies; the inline column stays
+        -- readable until every row has been moved
+        ALTER TABLE document_history
+            ADD COLUMN IF NOT EXISTS content_id BIGINT REFERENCES document_contents (id);
+        CREATE INDEX IF NOT EXISTS idx_document_history_content_id
+            ON document_history (content_id);
+    """),
+    (7, "Compressed binary storage of bodies and summaries", """
+        -- Values written by utils.storage_codec; the text columns remain for
+        -- rows written before this migration
+        ALTER TABLE document_contents ADD COLUMN IF NOT EXISTS body BYTEA;
+        ALTER TABLE document_summaries ADD COLUMN IF NOT EXISTS summary_data BYTEA;
+    """),
+    (8, "Retention purge run log", """
+        CREATE TABLE IF NOT EXISTS retention_runs (
+            id SERIAL PRIMARY KEY,
+            started_at TIMESTAMP NOT NULL,
+            finished_at TIMESTAMP NOT NULL,
+            dry_run BOOLEAN NOT NULL DEFAULT FALSE,
+            documents_deleted INTEGER NOT NULL DEFAULT 0,
+            batches INTEGER NOT NULL DEFAULT 0,
+            lock_timeouts INTEGER NOT NULL DEFAULT 0,
+            error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_retention_runs_started_at
+            ON retention_runs (started_at DESC);
+    """),
+    (9, "Full-text search index", ["""
+        -- Text search configuration for a document language, 'simple' when the
+        -- server has no configuration of that name
+        CREATE OR REPLACE FUNCTION document_search_config(language TEXT) RETURNS regconfig AS $$
+            SELECT COALESCE(
+                (SELECT oid::regconfig FROM pg_ts_config WHERE cfgname = lower(language) LIMIT 1),
+                'simple'::regconfig
+            )
+        $$ LANGUAGE sql STABLE;
+
+        -- Filename and risk factor vectors are kept up to date by triggers. The
+        -- content vector covers the body and summaries of standard-privacy
+        -- documents; bodies are stored compressed, so it is written by the
+        -- application when the text is saved.
+        CREATE TABLE IF NOT EXISTS document_search (
+            document_id INTEGER PRIMARY KEY REFERENCES document_history (id) ON DELETE CASCADE,
+            config REGCONFIG NOT NULL DEFAULT 'simple',
+            filename_vector TSVECTOR,
+            factors_vector TSVECTOR,
+            content_vector TSVECTOR,
+            search_vector TSVECTOR NOT NULL DEFAULT ''
+        );
+        CREATE INDEX IF NOT EXISTS idx_document_search_vector
+            ON document_search USING GIN (search_vector);
+
+        CREATE OR REPLACE FUNCTION document_search_combine() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector :=
+                setweight(COALESCE(NEW.filename_vector, ''), 'A') ||
+                setweight(COALESCE(NEW.factors_vector, ''), 'B') ||
+                setweight(COALESCE(NEW.content_vector, ''), 'C');
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS document_search_combine ON document_search;
+        CREATE TRIGGER document_search_combine
+            BEFORE INSERT OR UPDATE ON document_search
+            FOR EACH ROW EXECUTE FUNCTION document_search_combine();
+
+        -- Index the filename; drop the content vector once a document is no
+        -- longer standard privacy
+        CREATE OR REPLACE FUNCTION document_history_search_sync() RETURNS trigger AS $$
+        DECLARE
+            cfg regconfig := document_search_config(NEW.document_language);
+        BEGIN
+            INSERT INTO document_search (document_id, config, filename_vector)
+            VALUES (NEW.id, cfg, to_tsvector(cfg, regexp_replace(COALESCE(NEW.filename, ''), '[._-]+', ' ', 'g')))
+            ON CONFLICT (document_id) DO UPDATE
+                SET config = EXCLUDED.config,
+                    filename_vector = EXCLUDED.filename_vector,
+                    content_vector = CASE
+                        WHEN COALESCE(NEW.privacy_level, 'standard') = 'standard' THEN document_search.content_vector
+                    END;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS document_history_search_sync ON document_history;
+        CREATE TRIGGER document_history_search_sync
+            AFTER INSERT OR UPDATE OF filename, document_language, privacy_level ON document_history
+            FOR EACH ROW EXECUTE FUNCTION document_history_search_sync();
+
+        -- Rebuild the risk factor vector of every document touched by a statement
+        CREATE OR REPLACE FUNCTION risk_factors_search_sync() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO document_search (document_id, config, factors_vector)
+            SELECT d.id, document_search_config(d.document_language),
+                   to_tsvector(document_search_config(d.document_language), COALESCE(
+                       (SELECT string_agg(r.risk_factor, ' ') FROM risk_factors r WHERE r.document_id = d.id), ''
+                   ))
+            FROM document_history d
+            WHERE d.id IN (SELECT DISTINCT document_id FROM changed_rows)
+            ON CONFLICT (document_id) DO UPDATE SET factors_vector = EXCLUDED.factors_vector;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS risk_factors_search_insert ON risk_factors;
+        CREATE TRIGGER risk_factors_search_insert
+            AFTER INSERT ON risk_factors
+            REFERENCING NEW TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION risk_factors_search_sync();
+
+        DROP TRIGGER IF EXISTS risk_factors_search_delete ON risk_factors;
+        CREATE TRIGGER risk_factors_search_delete
+            AFTER DELETE ON risk_factors
+            REFERENCING OLD TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION risk_factors_search_sync();
+
+        -- Existing documents are indexed by the next step; content vectors
+        -- are filled in by python -m utils.migrations reindex-search
+    """, _backfill_document_search]),
+    (10, "Blind index for encrypted documents", """
+        -- Keyed HMAC digests of the tokens of encrypted bodies and summaries.
+        -- The primary key serves term lookups; the second index serves deletes.
+        CREATE TABLE IF NOT EXISTS document_blind_index (
+            term_hash BYTEA NOT NULL,
+            document_id INTEGER NOT NULL REFERENCES document_history (id) ON DELETE CASCADE,
+            PRIMARY KEY (term_hash, document_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_document_blind_index_document_id
+            ON document_blind_index (document_id);
+    """),
+    (11, "Content hash for upload deduplication", """
+        -- Keyed fingerprint of the uploaded file. One document per file and
+        -- privacy level carries it; analyses of that file are reused.
+        ALTER TABLE document_history ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_document_history_content_hash
+            ON document_history (privacy_level, content_hash)
+            WHERE content_hash IS NOT NULL;
+    """),
+    (12, "Functions for partitioning document_history by month", """
+        -- Create the monthly partitions of a table partitioned by upload_date,
+        -- from the month of from_date up to months_ahead months from now.
+        -- Partitions are named <table>_pYYYYMM. Does nothing for a table that
+        -- is not partitioned; python -m utils.migrations partition converts
+        -- document_history.
+        CREATE OR REPLACE FUNCTION create_document_history_partitions(
+            parent REGCLASS, from_date TIMESTAMP, months_ahead INTEGER
+        ) RETURNS INTEGER AS $$
+        DECLARE
+            month_start TIMESTAMP := date_trunc('month', from_date);
+            last_month TIMESTAMP := date_trunc('month', NOW()) + make_interval(months => months_ahead);
+            partition_name TEXT;
+            created INTEGER := 0;
+        BEGIN
+            IF (SELECT relkind FROM pg_class WHERE oid = parent) <> 'p' THEN
+                RETURN 0;
+            END IF;
+            WHILE month_start <= last_month LOOP
+                partition_name := 'document_history_p' || to_char(month_start, 'YYYYMM');
+                IF to_regclass(partition_name) IS NULL THEN
+                    BEGIN
+                        EXECUTE format(
+                            'CREATE TABLE %I PARTITION OF %s FOR VALUES FROM (%L) TO (%L)',
+                            partition_name, parent, month_start, month_start + INTERVAL '1 month'
+                        );
+                        created := created + 1;
+                    EXCEPTION WHEN check_violation THEN
+                        -- The default partition already holds rows of this month
+                        RAISE WARNING 'Partition % overlaps rows in the default partition', partition_name;
+                    END;
+                END IF;
+                month_start := month_start + INTERVAL '1 month';
+            END LOOP;
+            RETURN created;
+        END
+        $$ LANGUAGE plpgsql;
+
+        -- Records the ids of document_history rows written while the table is
+        -- copied into its partitioned replacement
+        CREATE OR REPLACE FUNCTION document_history_track_change() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO document_history_changes (id)
+            VALUES (CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END)
+            ON CONFLICT DO NOTHING;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+    """),
+    (13, "Daily document statistics rollup", ["""
+        -- Documents per upload day, risk level, language and privacy level,
+        -- kept current by statement triggers so dashboards never scan
+        -- document_history. Missing risk levels and languages are counted as
+        -- 'Unknown' and 'unknown'.
+        CREATE TABLE IF NOT EXISTS document_stats_daily (
+            day DATE NOT NULL,
+            risk_level VARCHAR(16) NOT NULL,
+            document_language VARCHAR(32) NOT NULL,
+            privacy_level VARCHAR(16) NOT NULL,
+            documents BIGINT NOT NULL DEFAULT 0,
+            total_size_kb NUMERIC(18, 2) NOT NULL DEFAULT 0,
+            total_length BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, risk_level, document_language, privacy_level)
+        );
+
+        -- Subtract the old rows and add the new rows of a statement, one
+        -- upsert per group rather than per document
+        CREATE OR REPLACE FUNCTION document_stats_sync() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                INSERT INTO document_stats_daily AS s
+                    (day, risk_level, document_language, privacy_level, documents, total_size_kb, total_length)
+                SELECT upload_date::date, COALESCE(risk_level, 'Unknown'), COALESCE(document_language, 'unknown'),
+                       privacy_level, -count(*), -COALESCE(sum(file_size_kb), 0), -COALESCE(sum(content_length), 0)
+                FROM old_rows
+                GROUP BY 1, 2, 3, 4
+                ORDER BY 1, 2, 3, 4
+                ON CONFLICT (day, risk_level, document_language, privacy_level) DO UPDATE
+                    SET documents = s.documents + EXCLUDED.documents,
+                        total_size_kb = s.total_size_kb + EXCLUDED.total_size_kb,
+                        total_length = s.total_length + EXCLUDED.total_length;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'INSERT') THEN
+                INSERT INTO document_stats_daily AS s
+                    (day, risk_level, document_language, privacy_level, documents, total_size_kb, total_length)
+                SELECT upload_date::date, COALESCE(risk_level, 'Unknown'), COALESCE(document_language, 'unknown'),
+                       privacy_level, count(*), COALESCE(sum(file_size_kb), 0), COALESCE(sum(content_length), 0)
+                FROM new_rows
+                GROUP BY 1, 2, 3, 4
+                ORDER BY 1, 2, 3, 4
+                ON CONFLICT (day, risk_level, document_language, privacy_level) DO UPDATE
+                    SET documents = s.documents + EXCLUDED.documents,
+                        total_size_kb = s.total_size_kb + EXCLUDED.total_size_kb,
+                        total_length = s.total_length + EXCLUDED.total_length;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        -- Triggers with transition tables take one event each
+        DROP TRIGGER IF EXISTS document_stats_insert ON document_history;
+        CREATE TRIGGER document_stats_insert
+            AFTER INSERT ON document_history
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION document_stats_sync();
+
+        DROP TRIGGER IF EXISTS document_stats_update ON document_history;
+        CREATE TRIGGER document_stats_update
+            AFTER UPDATE ON document_history
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION document_stats_sync();
+
+        DROP TRIGGER IF EXISTS document_stats_delete ON document_history;
+        CREATE TRIGGER document_stats_delete
+            AFTER DELETE ON document_history
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION document_stats_sync();
+
+        -- Existing documents are counted by the next step
+    """, _backfill_document_stats]),
+    (14, "Store document bodies without TOAST compression", """
+        -- Bodies are already compressed by utils.storage_codec. Stored
+        -- uncompressed, a slice of a body only reads the TOAST chunks it
+        -- covers, which lets utils.database.open_document_text stream large
+        -- bodies. Applies to bodies written from now on.
+        ALTER TABLE document_contents ALTER COLUMN body SET STORAGE EXTERNAL;
+    """),
+    (15, "Key table function for a partitioned document_history", """
+        -- A partitioned document_history cannot enforce unique ids, access
+        -- tokens or content hashes, nor be referenced by foreign keys.
+        -- python -m utils.migrations partition creates document_keys, which
+        -- holds them for every document, and keeps it current with this
+        -- trigger; the child tables reference it instead.
+        CREATE OR REPLACE FUNCTION document_keys_sync() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO document_keys (id, access_token, privacy_level, content_hash)
+                VALUES (NEW.id, NEW.access_token, NEW.privacy_level, NEW.content_hash);
+                RETURN NEW;
+            ELSIF TG_OP = 'UPDATE' THEN
+                UPDATE document_keys
+                SET id = NEW.id, access_token = NEW.access_token,
+                    privacy_level = NEW.privacy_level, content_hash = NEW.content_hash
+                WHERE id = OLD.id;
+                RETURN NEW;
+            END IF;
+            -- Cascades to the rows of the child tables
+            DELETE FROM document_keys WHERE id = OLD.id;
+            RETURN OLD;
+        END
+        $$ LANGUAGE plpgsql;
+    """),
+]
+
+# Columns every table must have for the database module to work
+EXPECTED_COLUMNS = {
+    "document_history": [
+        "id", "filename", "file_size_kb", "document_language", "risk_level", "content_length",
+        "upload_date", "document_text", "is_encrypted", "access_token", "privacy_level", "content_id",
+        "content_hash"
+    ],
+    "document_contents": [
+        "id", "content_key", "document_text", "body", "is_encrypted"
+    ],
+    "risk_factors": [
+        "id", "document_id", "risk_factor", "category", "term", "occurrence_count",
+        "pattern_id", "start_offset", "end_offset"
+    ],
+    "document_summaries": [
+        "id", "document_id", "summary_text", "summary_data", "detail_level", "language", "is_encrypted", "generation_date"
+    ],
+    "retention_runs": [
+        "id", "started_at", "finished_at", "dry_run", "documents_deleted", "batches", "lock_timeouts", "error"
+    ],
+    "document_search": [
+        "document_id", "config", "filename_vector", "factors_vector", "content_vector", "search_vector"
+    ],
+    "document_blind_index": [
+        "term_hash", "document_id"
+    ],
+    "privacy_settings": [
+        "id", "document_id", "privacy_level", "retention_days", "anonymize_text",
+        "encrypt_storage", "access_token"
+    ],
+    "document_stats_daily": [
+        "day", "risk_level", "document_language", "privacy_level", "documents", "total_size_kb", "total_length"
+    ],
+}
+
+EXPECTED_INDEXES = [
+    "idx_document_history_upload_date_id",
+    "idx_document_history_access_token",
+    "idx_risk_factors_document_id",
+    "idx_risk_factors_category_term",
+    "idx_risk_factors_category_pattern",
+    "idx_document_summaries_document_id",
+    "idx_privacy_settings_document_id",
+    "idx_privacy_settings_access_token",
+    "idx_document_history_risk_level_upload_date",
+    "idx_document_history_language_upload_date",
+    "idx_document_history_content_id",
+    "idx_retention_runs_started_at",
+    "idx_document_search_vector",
+    "idx_document_blind_index_document_id",
+    "idx_document_history_content_hash",
+]
+
+# Child tables whose document_id must cascade on delete
+CASCADING_CHILDREN = [
+    "risk_factors", "document_summaries", "privacy_settings", "document_search", "document_blind_index"
+]
+
+
+def _ensure_migrations_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+        )
+    """)
+
+
+def get_applied_versions(connection):
+    """
+    Get the migration versions already applied
+
+    Args:
+        connection: psycopg2 connection
+
+    Returns:
+        set: Applied version numbers
+    """
+    with connection:
+        with connection.cursor() as cursor:
+            _ensure_migrations_table(cursor)
+            cursor.execute("SELECT version FROM schema_migrations")
+            return {row[0] for row in cursor.fetchall()}
+
+
+def migrate(connection):
+    """
+    Apply pending migrations in order
+
+    Each step of a migration runs in its own transaction; the last one records
+    the schema_migrations row. An advisory lock keeps concurrent processes from
+    migrating at once, and the connection's statement timeout is lifted for
+    the duration, since backfills may run for a long time.
+
+    Args:
+        connection: psycopg2 connection
+
+    Returns:
+        list: Versions applied by this call
+    """
+    applied_now = []
+    with connection:
+        with connection.cursor() as cursor:
+            _ensure_migrations_table(cursor)
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        cursor.execute("SET statement_timeout = 0")
+    connection.commit()
+
+    try:
+        applied = get_applied_versions(connection)
+        for version, description, steps in MIGRATIONS:
+            if version in applied:
+                continue
+
+            logger.info(f"Applying migration {version}: {description}")
+            steps = [steps] if isinstance(steps, str) else steps
+            for step in steps:
+                if callable(step):
+                    step(connection)
+                    continue
+                with connection:
+                    with connection.cursor() as cursor:
+                        cursor.execute(step)
+            with connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                        (version, description)
+                    )
+            applied_now.append(version)
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("RESET statement_timeout")
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+        connection.commit()
+
+    return applied_now
+
+
+def get_pending_versions(connection):
+    """
+    Get the migration versions not applied yet, without changing the database
+
+    Args:
+        connection: psycopg2 connection
+
+    Returns:
+        list: Pending version numbers
+    """
+    with connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+            applied = set()
+            if cursor.fetchone()[0]:
+                cursor.execute("SELECT version FROM schema_migrations")
+                applied = {row[0] for row in cursor.fetchall()}
+    return [version for version, _, _ in MIGRATIONS if version not in applied]
+
+
+def verify_schema(connection):
+    """
+    Check that the live schema matches what the database module expects
+
+    Args:
+        connection: psycopg2 connection
+
+    Returns:
+        list: Descriptions of problems found; empty if the schema matches
+    """
+    problems = []
+    with connection:
+        with connection.cursor() as cursor:
+            applied = set()
+            cursor.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+            if cursor.fetchone()[0]:
+                cursor.execute("SELECT version FROM schema_migrations")
+                applied = {row[0] for row in cursor.fetchall()}
+            for version, description, _ in MIGRATIONS:
+                if version not in applied:
+                    problems.append(f"Migration {version} ({description}) not applied")
+
+            cursor.execute("""
+                SELECT table_name, column_name
+                FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = ANY(%s)
+            """, (list(EXPECTED_COLUMNS),))
+            live_columns = {}
+            for table_name, column_name in cursor.fetchall():
+                live_columns.setdefault(table_name, set()).add(column_name)
+
+            for table_name, columns in EXPECTED_COLUMNS.items():
+                if table_name not in live_columns:
+                    problems.append(f"Table {table_name} is missing")
+                    continue
+                for column in columns:
+                    if column not in live_columns[table_name]:
+                        problems.append(f"Column {table_name}.{column} is missing")
+
+            cursor.execute("""
+                SELECT indexname FROM pg_indexes
+                WHERE schemaname = current_schema() AND indexname = ANY(%s)
+            """, (EXPECTED_INDEXES,))
+            live_indexes = {row[0] for row in cursor.fetchall()}
+            for index in EXPECTED_INDEXES:
+                if index not in live_indexes:
+                    problems.append(f"Index {index} is missing")
+
+            # Children of a partitioned document_history reference document_keys
+            cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('document_history')")
+            row = cursor.fetchone()
+            parent = "document_keys" if row and row[0] else "document_history"
+            cursor.execute("""
+                SELECT c.conrelid::regclass::text, c.confdeltype
+                FROM pg_constraint c
+                WHERE c.contype = 'f' AND c.confrelid = to_regclass(%s)
+            """, (parent,))
+            cascading = {table for table, delete_type in cursor.fetchall() if delete_type == 'c'}
+            for table in CASCADING_CHILDREN:
+                if table in live_columns and table not in cascading:
+                    problems.append(f"Foreign key {table}.document_id to {parent} does not cascade on delete")
+
+    return problems
+
+
+def main(argv=None):
+    """Command-line entry point"""
+    from utils.database import (
+        get_connection, release_connection, migrate_document_bodies, compress_stored_text,
+        rebuild_search_content, rebuild_blind_index, partition_document_history, STORAGE_BACKEND, DB_PARAMS
+    )
+
+    command = (argv or sys.argv[1:] or ["migrate"])[0]
+    if STORAGE_BACKEND == "sqlite":
+        if command == "migrate":
+            print("Nothing to migrate: the SQLite backend creates its schema on first use")
+            return 0
+        print(f"{command} is a Postgres maintenance command and does not apply to the SQLite backend")
+        return 1
+    if command == "move-bodies":
+        print(f"Moved {migrate_document_bodies()} document bodies")
+        return 0
+    if command == "compress":
+        for table, count in compress_stored_text().items():
+            print(f"Converted {count} rows of {table}")
+        return 0
+    if command == "reindex-search":
+        print(f"Indexed the text of {rebuild_search_content()} documents")
+        return 0
+    if command == "reindex-blind":
+        print(f"Built the blind index of {rebuild_blind_index()} encrypted documents")
+        return 0
+    if command == "partition":
+        copied = partition_document_history()
+        if copied is None:
+            print("Partitioning failed; see the log")
+            return 1
+        print(f"Moved {copied} documents into monthly partitions")
+        return 0
+
+    if command == "migrate" and not (DB_PARAMS["dbname"] or DB_PARAMS["host"] or os.environ.get("DATABASE_URL")):
+        print("No database is configured; nothing to migrate")
+        return 0
+
+    connection = get_connection()
+    if not connection:
+        print("Could not connect to the database")
+        return 1
+
+    try:
+        if command == "migrate":
+            applied = migrate(connection)
+            print(f"Applied migrations: {applied}" if applied else "Schema is up to date")
+        elif command == "status":
+            applied = get_applied_versions(connection)
+            for version, description, _ in MIGRATIONS:
+                print(f"{'applied' if version in applied else 'pending':<8} {version:>3}  {description}")
+        elif command == "verify":
+            problems = verify_schema(connection)
+            for problem in problems:
+                print(problem)
+            print("Schema matches" if not problems else f"{len(problems)} problem(s) found")
+            return 1 if problems else 0
+        else:
+            print(f"Unknown command: {command}. Use migrate, status, verify, move-bodies, compress, reindex-search, reindex-blind or partition.")
+            return 1
+    finally:
+        release_connection(connection)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,9 +5,27 @@ Based on Meta's No Language Left Behind model
 
 import torch
 import os
+import re
 import numpy as np
 from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
 
+# Try to import CTranslate2 for the quantized inference engine
+try:
+    import ctranslate2
+    CTRANSLATE2_AVAILABLE = True
+except Exception as e:
+    print(f"CTranslate2 not available: {e}")
+    CTRANSLATE2_AVAILABLE = False
+
+# Use smaller distilled model for better performance
+NLLB_MODEL_NAME = "facebook/nllb-200-distilled-600M"
+
+# Converted CTranslate2 models are cached here, next to the IndicTrans2 models
+CT2_MODELS_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "nllb-ct2")
+
+# NLLB has a context length of 512 tokens, including the language tag and </s>
+MAX_INPUT_TOKENS = 512
+
 # NLLB language codes for our supported languages
 NLLB_LANGUAGE_CODES = {
     "english": "eng_Latn",
@@ -24,103 +42,278 @@ NLLB_LANGUAGE_CODES = {
     "odia": "ory_Orya"
 }
 
+# Sentence boundaries for English and Indic scripts (danda, double danda, Urdu full stop)
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?।॥۔])\s+')
+
+
+def chunk_by_tokens(tokenizer, text, max_tokens=MAX_INPUT_TOKENS):
+    """
+    Split text into chunks that fit within the model's token limit
+
+    Sentences are packed greedily into chunks. A single sentence longer than
+    the limit is split on token boundaries.
+
+    Args:
+        tokenizer: Hugging Face NLLB tokenizer
+        text (str): Text to split
+        max_tokens (int): Maximum number of tokens per chunk, including special tokens
+
+    Returns:
+        list: List of text chunks
+    """
+    # Leave room for the source language tag and </s>
+    budget = max_tokens - 2
+
+    chunks = []
+    current_chunk = []
+    current_length = 0
+
+    for sentence in SENTENCE_BOUNDARY.split(text.strip()):
+        if not sentence:
+            continue
+
+        token_ids = tokenizer(sentence, add_special_tokens=False).input_ids
+
+        # Very long sentence - flush and split it on token boundaries
+        if len(token_ids) > budget:
+            if current_chunk:
+                chunks.append(' '.join(current_chunk))
+                current_chunk = []
+                current_length = 0
+            for start in range(0, len(token_ids), budget):
+                chunks.append(tokenizer.decode(token_ids[start:start + budget]))
+            continue
+
+        if current_length + len(token_ids) > budget:
+            chunks.append(' '.join(current_chunk))
+            current_chunk = [sentence]
+            current_length = len(token_ids)
+        else:
+            current_chunk.append(sentence)
+            current_length += len(token_ids)
+
+    if current_chunk:
+        chunks.append(' '.join(current_chunk))
+
+    return chunks
+
+
 class NLLBTranslator:
-    def __init__(self):
-        """Initialize the NLLB-200 translator"""
+    def __init__(self, num_beams=5, batch_size=8):
+        """
+        Initialize the NLLB-200 translator
+
+        Args:
+            num_beams (int): Beam size used for generation
+            batch_size (int): Number of chunks generated together
+        """
         self.is_available = False
+        self.num_beams = num_beams
+        self.batch_size = batch_size
         try:
-            # Use smaller distilled model for better performance
-            model_name = "facebook/nllb-200-distilled-600M"
-            
+            model_name = NLLB_MODEL_NAME
+
             print(f"Loading NLLB-200 model: {model_name}")
             self.tokenizer = AutoTokenizer.from_pretrained(model_name)
             self.model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
-            
+
             # Set to CPU - our environment doesn't have a GPU
             self.device = "cpu"
             self.model.to(self.device)
-            
+            self.model.eval()
+
             self.is_available = True
             print("NLLB-200 model loaded successfully!")
         except Exception as e:
             print(f"Error initializing NLLB-200 translator: {str(e)}")
             self.is_available = False
-    
+
     def translate(self, text, source_language, target_language):
         """
         Translate text using NLLB-200
-        
+
         Args:
             text (str): Text to translate
             source_language (str): Source language name (english, hindi, etc.)
             target_language (str): Target language name (english, hindi, etc.)
-            
+
         Returns:
             str: Translated text
         """
         if not self.is_available:
             return None
-            
+
         if not text or len(text.strip()) == 0:
             return ""
-            
+
         try:
             # Convert to NLLB language codes
             source_lang_code = NLLB_LANGUAGE_CODES.get(source_language.lower(), "eng_Latn")
             target_lang_code = NLLB_LANGUAGE_CODES.get(target_language.lower(), "eng_Latn")
-            
-            # Handle longer texts by breaking into chunks
-            max_length = 512  # NLLB has a context length of around 512 tokens
-            words = text.split()
-            chunks = []
-            current_chunk = []
-            current_length = 0
-            
-            for word in words:
-                if current_length + len(word.split()) + 1 > max_length:
-                    chunks.append(' '.join(current_chunk))
-                    current_chunk = [word]
-                    current_length = len(word.split()) + 1
-                else:
-                    current_chunk.append(word)
-                    current_length += len(word.split()) + 1
-                    
-            if current_chunk:
-                chunks.append(' '.join(current_chunk))
-                
-            # If text is short enough, just use a single chunk
-            if not chunks:
-                chunks = [text]
-                
-            # Translate each chunk
+
+            # Set the source language before tokenizing so the right tag is prepended
+            self.tokenizer.src_lang = source_lang_code
+
+            # Handle longer texts by breaking into token-bounded chunks
+            chunks = chunk_by_tokens(self.tokenizer, text) or [text]
+
+            # Translate the chunks in batches
             translated_chunks = []
-            for chunk in chunks:
-                # Tokenize the text
-                inputs = self.tokenizer(chunk, return_tensors="pt").to(self.device)
-                
-                # Set the language for translation
-                self.tokenizer.src_lang = source_lang_code
-                
-                # Generate translation
-                translated_tokens = self.model.generate(
-                    **inputs, 
-                    forced_bos_token_id=self.tokenizer.lang_code_to_id[target_lang_code],
-                    max_length=512,
-                    num_beams=5,
-                    length_penalty=1.0
-                )
-                
+            for start in range(0, len(chunks), self.batch_size):
+                batch = chunks[start:start + self.batch_size]
+
+                inputs = self.tokenizer(
+                    batch,
+                    return_tensors="pt",
+                    padding=True,
+                    truncation=True,
+                    max_length=MAX_INPUT_TOKENS
+                ).to(self.device)
+
+                with torch.inference_mode():
+                    translated_tokens = self.model.generate(
+                        **inputs,
+                        forced_bos_token_id=self.tokenizer.convert_tokens_to_ids(target_lang_code),
+                        max_length=MAX_INPUT_TOKENS,
+                        num_beams=self.num_beams,
+                        length_penalty=1.0
+                    )
+
                 # Decode the generated tokens
-                translated_text = self.tokenizer.batch_decode(
-                    translated_tokens, 
+                translated_chunks.extend(self.tokenizer.batch_decode(
+                    translated_tokens,
                     skip_special_tokens=True
-                )[0]
-                
-                translated_chunks.append(translated_text)
-                
+                ))
+
             # Join the translated chunks
             return " ".join(translated_chunks)
-            
+
         except Exception as e:
             print(f"NLLB translation error: {str(e)}")
-            return None
\ No newline at end of file
+            return None
+
+
+class CTranslate2NLLBTranslator:
+    """
+    NLLB-200 translator running on the CTranslate2 inference engine
+
+    The model is converted once with int8 quantization and cached on disk.
+    It has the same translate() API as NLLBTranslator.
+    """
+    def __init__(self, model_dir=None, compute_type="int8", intra_threads=None,
+                 inter_threads=None, beam_size=2, max_batch_size=16):
+        """
+        Initialize the CTranslate2 NLLB-200 translator
+
+        Args:
+            model_dir (str, optional): Directory of a converted CTranslate2 model.
+                                       The model is converted there if it is missing.
+            compute_type (str): CTranslate2 compute type (int8, int8_float32, float32)
+            intra_threads (int, optional): Threads used per translation (NLLB_CT2_INTRA_THREADS)
+            inter_threads (int, optional): Number of translations run in parallel
+                                           (NLLB_CT2_INTER_THREADS, default 1)
+            beam_size (int): Beam size used for generation
+            max_batch_size (int): Maximum number of chunks decoded in one batch
+        """
+        self.is_available = False
+        self.beam_size = beam_size
+        self.max_batch_size = max_batch_size
+        self.model_dir = model_dir or os.path.join(
+            CT2_MODELS_CACHE_DIR, f"{NLLB_MODEL_NAME.split('/')[-1]}-{compute_type}"
+        )
+
+        # 0 lets CTranslate2 pick a default based on the number of cores
+        if intra_threads is None:
+            intra_threads = int(os.environ.get("NLLB_CT2_INTRA_THREADS", 0))
+        if inter_threads is None:
+            inter_threads = int(os.environ.get("NLLB_CT2_INTER_THREADS", 1))
+
+        if not CTRANSLATE2_AVAILABLE:
+            print("CTranslate2 NLLB translator disabled: ctranslate2 is not installed")
+            return
+
+        try:
+            print(f"Loading NLLB-200 tokenizer: {NLLB_MODEL_NAME}")
+            self.tokenizer = AutoTokenizer.from_pretrained(NLLB_MODEL_NAME)
+
+            if not os.path.exists(os.path.join(self.model_dir, "model.bin")):
+                self._convert_model(compute_type)
+
+            self.translator = ctranslate2.Translator(
+                self.model_dir,
+                device="cpu",
+                compute_type=compute_type,
+                intra_threads=intra_threads,
+                inter_threads=inter_threads
+            )
+
+            self.is_available = True
+            print(f"CTranslate2 NLLB-200 model loaded successfully ({compute_type})!")
+        except Exception as e:
+            print(f"Error initializing CTranslate2 NLLB-200 translator: {str(e)}")
+            self.is_available = False
+
+    def _convert_model(self, compute_type):
+        """Convert the Hugging Face checkpoint to a quantized CTranslate2 model"""
+        print(f"Converting {NLLB_MODEL_NAME} to CTranslate2 ({compute_type})...")
+        os.makedirs(os.path.dirname(self.model_dir), exist_ok=True)
+        converter = ctranslate2.converters.TransformersConverter(NLLB_MODEL_NAME)
+        converter.convert(self.model_dir, quantization=compute_type, force=True)
+        print(f"Converted model saved to {self.model_dir}")
+
+    def translate(self, text, source_language, target_language):
+        """
+        Translate text using the quantized NLLB-200 model
+
+        Args:
+            text (str): Text to translate
+            source_language (str): Source language name (english, hindi, etc.)
+            target_language (str): Target language name (english, hindi, etc.)
+
+        Returns:
+            str: Translated text
+        """
+        if not self.is_available:
+            return None
+
+        if not text or len(text.strip()) == 0:
+            return ""
+
+        try:
+            # Convert to NLLB language codes
+            source_lang_code = NLLB_LANGUAGE_CODES.get(source_language.lower(), "eng_Latn")
+            target_lang_code = NLLB_LANGUAGE_CODES.get(target_language.lower(), "eng_Latn")
+
+            self.tokenizer.src_lang = source_lang_code
+            chunks = chunk_by_tokens(self.tokenizer, text) or [text]
+
+            # CTranslate2 works on token strings rather than ids
+            source_tokens = [
+                self.tokenizer.convert_ids_to_tokens(self.tokenizer.encode(chunk))
+                for chunk in chunks
+            ]
+
+            # All chunks are decoded together; CTranslate2 sorts them by length
+            # and splits them into batches internally
+            results = self.translator.translate_batch(
+                source_tokens,
+                target_prefix=[[target_lang_code]] * len(source_tokens),
+                beam_size=self.beam_size,
+                max_batch_size=self.max_batch_size,
+                max_decoding_length=MAX_INPUT_TOKENS
+            )
+
+            translated_chunks = []
+            for result in results:
+                # Drop the target language tag
+                target_tokens = result.hypotheses[0][1:]
+                translated_chunks.append(self.tokenizer.decode(
+                    self.tokenizer.convert_tokens_to_ids(target_tokens),
+                    skip_special_tokens=True
+                ))
+
+            return " ".join(translated_chunks)
+
+        except Exception as e:
+            print(f"CTranslate2 NLLB translation error: {str(e)}")
+            return None
@@ -0,0 +1,231 @@
+"""
+Retention enforcement for stored documents
+Deletes documents older than their privacy_settings.retention_days in bounded
+batches, either from the command line or from a background thread. When
+document_history is partitioned by month, expired partitions are dropped whole
+first and the partitions of the coming months are created.
+
+Usage:
+    python -m utils.retention                  # purge once
+    python -m utils.retention --dry-run        # report what would be purged
+    python -m utils.retention --loop --interval 3600
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+from psycopg2 import errors
+
+from utils.database import (
+    ensure_schema,
+    count_expired_documents,
+    delete_expired_documents,
+    drop_expired_partitions,
+    create_future_partitions,
+    record_retention_run
+)
+
+logger = logging.getLogger(__name__)
+
+# Documents deleted per transaction
+PURGE_BATCH_SIZE = int(os.environ.get("RETENTION_BATCH_SIZE", 500))
+
+# Retention applied to documents without privacy settings
+DEFAULT_RETENTION_DAYS = int(os.environ.get("RETENTION_DEFAULT_DAYS", 30))
+
+# Seconds between purges when running as a background worker
+PURGE_INTERVAL_SECONDS = float(os.environ.get("RETENTION_INTERVAL_SECONDS", 3600))
+
+# How long a batch waits for row locks before it is retried
+PURGE_LOCK_TIMEOUT = os.environ.get("RETENTION_LOCK_TIMEOUT", "2s")
+
+# Months of document_history partitions kept ready ahead of the current one
+PARTITION_MONTHS_AHEAD = int(os.environ.get("RETENTION_PARTITION_MONTHS_AHEAD", 3))
+
+# Consecutive lock timeouts after which a run gives up until the next interval
+MAX_LOCK_TIMEOUTS = 5
+
+_last_run = None
+_last_run_lock = threading.Lock()
+
+
+def purge_expired_documents(batch_size=PURGE_BATCH_SIZE, max_batches=None, dry_run=False,
+                            default_days=DEFAULT_RETENTION_DAYS):
+    """
+    Delete documents past their retention period
+
+    Monthly partitions of document_history whose documents have all expired
+    are dropped first; the rest is deleted row by row. Every batch is its own
+    short transaction, so the purge never holds locks for long. Batches that
+    hit the lock timeout are retried with backoff. Every run is written to the
+    retention_runs log.
+
+    Args:
+        batch_size (int): Documents deleted per transaction
+        max_batches (int, optional): Stop after this many batches
+        dry_run (bool): Only count the expired documents
+        default_days (int): Retention for documents without privacy settings
+
+    Returns:
+        dict: Run summary with documents_deleted (documents_expired for a dry run),
+              batches, lock_timeouts, seconds, documents_per_second and error
+    """
+    global _last_run
+    run = {
+        "started_at": time.time(),
+        "dry_run": dry_run,
+        "documents_deleted": 0,
+        "batches": 0,
+        "lock_timeouts": 0,
+        "error": None,
+    }
+
+    if not ensure_schema():
+        run["error"] = "database unavailable"
+    elif dry_run:
+        run["documents_expired"] = count_expired_documents(default_days)
+        if run["documents_expired"] is None:
+            run["error"] = "could not count expired documents"
+    else:
+        try:
+            dropped = drop_expired_partitions(default_days, PURGE_LOCK_TIMEOUT)
+        except errors.LockNotAvailable:
+            # The partitions are dropped on a later run; delete their rows meanwhile
+            run["lock_timeouts"] += 1
+            dropped = 0
+        if dropped is None:
+            logger.warning("Could not drop expired partitions; deleting their documents instead")
+        else:
+            run["documents_deleted"] += dropped
+
+        consecutive_timeouts = 0
+        while max_batches is None or run["batches"] < max_batches:
+            try:
+                deleted = delete_expired_documents(batch_size, default_days, PURGE_LOCK_TIMEOUT)
+            except errors.LockNotAvailable:
+                # Dependent rows are locked by a user action; back off and retry
+                run["lock_timeouts"] += 1
+                consecutive_timeouts += 1
+                if consecutive_timeouts >= MAX_LOCK_TIMEOUTS:
+                    run["error"] = "gave up after repeated lock timeouts"
+                    break
+                time.sleep(min(2 ** consecutive_timeouts, 30))
+                continue
+
+            if deleted is None:
+                run["error"] = "batch failed"
+                break
+            if deleted == 0:
+                break
+            consecutive_timeouts = 0
+            run["documents_deleted"] += deleted
+            run["batches"] += 1
+
+    run["finished_at"] = time.time()
+    run["seconds"] = run["finished_at"] - run["started_at"]
+    run["documents_per_second"] = run["documents_deleted"] / run["seconds"] if run["seconds"] else 0.0
+    record_retention_run(run)
+
+    with _last_run_lock:
+        _last_run = dict(run)
+
+    if dry_run:
+        logger.info(f"Retention dry run: {run.get('documents_expired')} documents expired")
+    else:
+        logger.info(
+            f"Retention purge deleted {run['documents_deleted']} documents in {run['batches']} batches, "
+            f"{run['seconds']:.1f}s ({run['documents_per_second']:.0f} docs/s, "
+            f"{run['lock_timeouts']} lock timeouts)"
+        )
+    return run
+
+
+def get_last_run():
+    """
+    Get the summary of the last purge in this process
+
+    Returns:
+        dict: Run summary or None if no purge has run
+    """
+    with _last_run_lock:
+        return dict(_last_run) if _last_run else None
+
+
+class RetentionWorker(threading.Thread):
+    """
+    Daemon thread that purges expired documents at a fixed interval
+    """
+    def __init__(self, interval=PURGE_INTERVAL_SECONDS, batch_size=PURGE_BATCH_SIZE):
+        super().__init__(name="retention-worker", daemon=True)
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                purge_expired_documents(batch_size=self.batch_size)
+                create_future_partitions(PARTITION_MONTHS_AHEAD)
+            except Exception as e:
+                logger.error(f"Retention worker error: {e}")
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        """Stop after the current purge finishes"""
+        self._stop_event.set()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start_retention_worker(interval=PURGE_INTERVAL_SECONDS):
+    """
+    Start the process-wide retention worker if it is not already running
+
+    Args:
+        interval (float): Seconds between purges
+
+    Returns:
+        RetentionWorker: The running worker
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = RetentionWorker(interval=interval)
+            _worker.start()
+        return _worker
+
+
+def main(argv=None):
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Delete documents past their retention period")
+    parser.add_argument("--dry-run", action="store_true", help="Only count expired documents")
+    parser.add_argument("--batch-size", type=int, default=PURGE_BATCH_SIZE, help="Documents per transaction")
+    parser.add_argument("--max-batches", type=int, default=None, help="Stop after this many batches")
+    parser.add_argument("--loop", action="store_true", help="Keep purging at a fixed interval")
+    parser.add_argument("--interval", type=float, default=PURGE_INTERVAL_SECONDS, help="Seconds between purges")
+    args = parser.parse_args(argv)
+
+    while True:
+        if not args.dry_run and ensure_schema():
+            create_future_partitions(PARTITION_MONTHS_AHEAD)
+        run = purge_expired_documents(batch_size=args.batch_size, max_batches=args.max_batches,
+                                      dry_run=args.dry_run)
+        if args.dry_run:
+            print(f"{run.get('documents_expired')} documents are past their retention period")
+        else:
+            print(f"Deleted {run['documents_deleted']} documents in {run['batches']} batches "
+                  f"({run['documents_per_second']:.0f} docs/s, {run['lock_timeouts']} lock timeouts)")
+        if run["error"]:
+            print(f"Error: {run['error']}")
+        if not args.loop:
+            return 1 if run["error"] else 0
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,6 +4,37 @@ Uses pattern matching and keyword analysis to identify potential risk levels
 """
 import re
 
+# Descriptions of the high-risk patterns, indexed by pattern id
+HIGH_RISK_PATTERN_DESCRIPTIONS = [
+    "Immediate termination clause",
+    "Broad warranty disclaimer",
+    "Broad indemnification requirement",
+    "Perpetual confidentiality clause",
+    "Non-compliance penalties",
+    "Unlimited damages clause",
+    "Unlimited liability clause"
+]
+
+# Risk factor kinds with their English display templates and sort priority
+RISK_FACTOR_KINDS = {
+    "high_term": {"template": "High-risk term: '{0}' found {1} times", "priority": 2},
+    "high_pattern": {"template": "High-risk pattern: {0}", "priority": 2},
+    "medium_term": {"template": "Medium-risk term: '{0}' found {1} times", "priority": 1},
+}
+
+def _term_offsets(term, text):
+    """
+    Get the character offsets of the first case-insensitive match of a term
+
+    Matched on the original text: lower() may change the length of a string
+    (e.g. "İ"), so offsets into the lowercased text can point elsewhere.
+
+    Returns:
+        tuple: (start_offset, end_offset), or (None, None) if there is no match
+    """
+    match = re.search(re.escape(term), text, re.IGNORECASE)
+    return (match.start(), match.end()) if match else (None, None)
+
 def assess_risk_level(text):
     """
     Assess risk level of a legal document based on keyword and pattern analysis
@@ -14,7 +45,9 @@ def assess_risk_level(text):
     Returns:
         tuple: (risk_level, risk_factors) 
                where risk_level is 'Low', 'Medium', or 'High'
-               and risk_factors is a list of identified risk factors
+               and risk_factors is a list of identified risk factors.
+               Each risk factor is a dict with kind, term, count, pattern_id and the
+               character offsets of its first match; use format_risk_factor to display it.
     """
     if not text:
         return "Unknown", []
@@ -65,10 +98,12 @@ def assess_risk_level(text):
         r"liab.*\s.{0,30}(unlimit|not.{0,10}limit)",
     ]
     
-    high_risk_pattern_matches = [
-        bool(re.search(pattern, text_lower)) 
+    # Matched on the original text so match offsets index into it
+    high_risk_pattern_results = [
+        re.search(pattern, text, re.IGNORECASE)
         for pattern in high_risk_patterns
     ]
+    high_risk_pattern_matches = [bool(match) for match in high_risk_pattern_results]
     
     # Check for document length - longer documents typically contain more complex legal terms
     doc_length = len(text)
@@ -81,27 +116,23 @@ def assess_risk_level(text):
         if term in text_lower:
             occurrences = text_lower.count(term)
             if occurrences > 0:
-                risk_factors.append(f"High-risk term: '{term.capitalize()}' found {occurrences} times")
+                start, end = _term_offsets(term, text)
+                risk_factors.append({"kind": "high_term", "term": term, "count": occurrences, "pattern_id": None,
+                                     "start_offset": start, "end_offset": end})
     
     # Add medium-risk terms if they appear more than twice
     for term in medium_risk_terms:
         occurrences = text_lower.count(term)
         if occurrences > 2:
-            risk_factors.append(f"Medium-risk term: '{term.capitalize()}' found {occurrences} times")
+            start, end = _term_offsets(term, text)
+            risk_factors.append({"kind": "medium_term", "term": term, "count": occurrences, "pattern_id": None,
+                                 "start_offset": start, "end_offset": end})
     
     # Add pattern-based risks
-    for i, matched in enumerate(high_risk_pattern_matches):
-        if matched:
-            pattern_desc = {
-                0: "Immediate termination clause",
-                1: "Broad warranty disclaimer",
-                2: "Broad indemnification requirement",
-                3: "Perpetual confidentiality clause",
-                4: "Non-compliance penalties",
-                5: "Unlimited damages clause",
-                6: "Unlimited liability clause"
-            }.get(i, "Complex legal pattern")
-            risk_factors.append(f"High-risk pattern: {pattern_desc}")
+    for i, match in enumerate(high_risk_pattern_results):
+        if match:
+            risk_factors.append({"kind": "high_pattern", "term": None, "count": None, "pattern_id": i,
+                                 "start_offset": match.start(), "end_offset": match.end()})
     
     # Determine overall risk level based on multiple factors
     # Calculate risk score based on term frequency and patterns
@@ -122,12 +153,51 @@ def assess_risk_level(text):
         risk_level = "Low"
     
     # Limit risk factors to top 5 most significant
-    risk_factors = sorted(risk_factors, key=lambda x: "High-risk" in x and 2 or "Medium-risk" in x and 1 or 0, reverse=True)
+    risk_factors = sorted(risk_factors, key=lambda x: RISK_FACTOR_KINDS[x["kind"]]["priority"], reverse=True)
     risk_factors = risk_factors[:5] if len(risk_factors) > 5 else risk_factors
     
     return risk_level, risk_factors
 
 
+def get_risk_factor_name(factor):
+    """
+    Get the display name of the term or pattern behind a risk factor
+    
+    Args:
+        factor (dict): Risk factor record from assess_risk_level
+        
+    Returns:
+        str: Capitalized term or pattern description
+    """
+    if factor["kind"] == "high_pattern":
+        pattern_id = factor["pattern_id"]
+        if pattern_id is not None and 0 <= pattern_id < len(HIGH_RISK_PATTERN_DESCRIPTIONS):
+            return HIGH_RISK_PATTERN_DESCRIPTIONS[pattern_id]
+        return "Complex legal pattern"
+    return factor["term"].capitalize()
+
+
+def format_risk_factor(factor, template=None, name=None):
+    """
+    Format a risk factor record as display text
+    
+    Args:
+        factor (dict): Risk factor record from assess_risk_level
+        template (str, optional): Template with {0} for the name and {1} for the count.
+                                  Defaults to the English template for the kind.
+        name (str, optional): Display name. Defaults to the English term or pattern.
+        
+    Returns:
+        str: e.g. "High-risk term: 'Indemnity' found 4 times"
+    """
+    # Rows loaded from history are already plain text
+    if isinstance(factor, str):
+        return factor
+    template = template or RISK_FACTOR_KINDS[factor["kind"]]["template"]
+    name = name or get_risk_factor_name(factor)
+    return template.format(name, factor["count"])
+
+
 def get_risk_color(risk_level):
     """
     Get appropriate color for a risk level
@@ -0,0 +1,1629 @@
+"""
+Embedded SQLite storage backend for the database module
+Implements utils.database.BACKEND_FUNCTIONS on a local SQLite file (WAL
+mode, FTS5 full-text search), for single-node deployments and tests that
+should not need a Postgres server.
+
+Selected with STORAGE_BACKEND=sqlite; import utils.database rather than this
+module, which dispatches those functions here.
+"""
+import csv
+import json
+import logging
+import os
+import queue
+import contextlib
+import re
+import sqlite3
+import threading
+from datetime import date, datetime
+
+from utils import storage_codec
+from utils.database import (
+    encryption,
+    blind_index,
+    prepare_documents,
+    LazyRecord,
+    BACKEND_FUNCTIONS,
+    DOCUMENT_CHILD_TABLES,
+    BATCH_INSERT_SIZE,
+    RISK_FACTOR_KINDS,
+    _search_text,
+    _stats_query,
+    EXPORT_COLUMNS
+)
+
+logger = logging.getLogger(__name__)
+
+# Database file, created on first use
+SQLITE_PATH = os.environ.get("SQLITE_PATH", os.path.join(".lawzio", "lawzio.db"))
+
+# Idle connections kept open for reuse
+SQLITE_POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", 4))
+
+# Milliseconds a writer waits for the write lock before failing
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000))
+
+# Timestamp format of upload_date and the other TIMESTAMP columns; text
+# comparison orders them chronologically
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%f"
+
+def _stats_upsert(row, sign):
+    """Trigger statement adding (+) or subtracting (-) the NEW or OLD row in document_stats_daily"""
+    return f"""
+        INSERT INTO document_stats_daily
+            (day, risk_level, document_language, privacy_level, documents, total_size_kb, total_length)
+        VALUES (date({row}.upload_date), COALESCE({row}.risk_level, 'Unknown'),
+                COALESCE({row}.document_language, 'unknown'), {row}.privacy_level,
+                {sign}1, {sign}COALESCE({row}.file_size_kb, 0), {sign}COALESCE({row}.content_length, 0))
+        ON CONFLICT (day, risk_level, document_language, privacy_level) DO UPDATE
+            SET documents = documents + excluded.documents,
+                total_size_kb = total_size_kb + excluded.total_size_kb,
+                total_length = total_length + excluded.total_length;
+    """
+
+
+# Final schema of the Postgres migrations in utils/migrations.py, without the
+# legacy inline text columns. document_search is an FTS5 table keyed by the
+# document id; the BM25 column weights rank filename matches above risk factor
+# matches above body and summary matches.
+SCHEMA_SQL = f"""
+    CREATE TABLE IF NOT EXISTS sequences (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO sequences (name, value)
+    VALUES ('document_history', 0), ('document_summaries', 0);
+
+    CREATE TABLE IF NOT EXISTS document_contents (
+        id INTEGER PRIMARY KEY,
+        content_key TEXT NOT NULL UNIQUE,
+        body BLOB,
+        is_encrypted BOOLEAN NOT NULL DEFAULT 0,
+        created_at TIMESTAMP NOT NULL DEFAULT (strftime('{TIMESTAMP_FORMAT}', 'now'))
+    );
+
+    CREATE TABLE IF NOT EXISTS document_history (
+        id INTEGER PRIMARY KEY,
+        filename TEXT NOT NULL,
+        file_size_kb REAL,
+        document_language TEXT,
+        risk_level TEXT,
+        content_length INTEGER,
+        upload_date TIMESTAMP NOT NULL DEFAULT (strftime('{TIMESTAMP_FORMAT}', 'now')),
+        is_encrypted BOOLEAN NOT NULL DEFAULT 0,
+        access_token TEXT,
+        privacy_level TEXT NOT NULL DEFAULT 'standard',
+        content_id INTEGER REFERENCES document_contents (id),
+        content_hash TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_document_history_upload_date
+        ON document_history (upload_date DESC, id DESC);
+    CREATE INDEX IF NOT EXISTS idx_document_history_access_token
+        ON document_history (access_token);
+    CREATE INDEX IF NOT EXISTS idx_document_history_content_id
+        ON document_history (content_id);
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_document_history_content_hash
+        ON document_history (privacy_level, content_hash)
+        WHERE content_hash IS NOT NULL;
+
+    CREATE TABLE IF NOT EXISTS risk_factors (
+        id INTEGER PRIMARY KEY,
+        document_id INTEGER NOT NULL REFERENCES document_history (id) ON DELETE CASCADE,
+        risk_factor TEXT NOT NULL,
+        category TEXT,
+        term TEXT,
+        occurrence_count INTEGER,
+        pattern_id INTEGER,
+        start_offset INTEGER,
+        end_offset INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS idx_risk_factors_document_id
+        ON risk_factors (document_id);
+    CREATE INDEX IF NOT EXISTS idx_risk_factors_category_term
+        ON risk_factors (category, term);
+
+    CREATE TABLE IF NOT EXISTS document_summaries (
+        id INTEGER PRIMARY KEY,
+        document_id INTEGER NOT NULL REFERENCES document_history (id) ON DELETE CASCADE,
+        summary_data BLOB,
+        detail_level TEXT,
+        language TEXT,
+        is_encrypted BOOLEAN NOT NULL DEFAULT 0,
+        generation_date TIMESTAMP NOT NULL DEFAULT (strftime('{TIMESTAMP_FORMAT}', 'now'))
+    );
+    CREATE INDEX IF NOT EXISTS idx_document_summaries_document_id
+        ON document_summaries (document_id);
+
+    CREATE TABLE IF NOT EXISTS privacy_settings (
+        id INTEGER PRIMARY KEY,
+        document_id INTEGER NOT NULL REFERENCES document_history (id) ON DELETE CASCADE,
+        privacy_level TEXT NOT NULL DEFAULT 'standard',
+        retention_days INTEGER NOT NULL DEFAULT 30,
+        anonymize_text BOOLEAN NOT NULL DEFAULT 0,
+        encrypt_storage BOOLEAN NOT NULL DEFAULT 0,
+        access_token TEXT,
+        created_at TIMESTAMP NOT NULL DEFAULT (strftime('{TIMESTAMP_FORMAT}', 'now'))
+    );
+    CREATE INDEX IF NOT EXISTS idx_privacy_settings_document_id
+        ON privacy_settings (document_id);
+
+    CREATE TABLE IF NOT EXISTS retention_runs (
+        id INTEGER PRIMARY KEY,
+        started_at TIMESTAMP NOT NULL,
+        finished_at TIMESTAMP NOT NULL,
+        dry_run BOOLEAN NOT NULL DEFAULT 0,
+        documents_deleted INTEGER NOT NULL DEFAULT 0,
+        batches INTEGER NOT NULL DEFAULT 0,
+        lock_timeouts INTEGER NOT NULL DEFAULT 0,
+        error TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS document_blind_index (
+        term_hash BLOB NOT NULL,
+        document_id INTEGER NOT NULL REFERENCES document_history (id) ON DELETE CASCADE,
+        PRIMARY KEY (term_hash, document_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_document_blind_index_document_id
+        ON document_blind_index (document_id);
+
+    -- Combining marks are token characters so Indic words are indexed whole
+    CREATE VIRTUAL TABLE IF NOT EXISTS document_search USING fts5(
+        filename, factors, content,
+        tokenize = "porter unicode61 remove_diacritics 2 categories 'L* N* Co M*'"
+    );
+    CREATE TRIGGER IF NOT EXISTS document_history_search_delete
+    AFTER DELETE ON document_history BEGIN
+        DELETE FROM document_search WHERE rowid = OLD.id;
+    END;
+
+    -- Daily rollup for the statistics dashboard, maintained per row by triggers
+    CREATE TABLE IF NOT EXISTS document_stats_daily (
+        day TEXT NOT NULL,
+        risk_level TEXT NOT NULL,
+        document_language TEXT NOT NULL,
+        privacy_level TEXT NOT NULL,
+        documents INTEGER NOT NULL DEFAULT 0,
+        total_size_kb REAL NOT NULL DEFAULT 0,
+        total_length INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, risk_level, document_language, privacy_level)
+    ) WITHOUT ROWID;
+    CREATE TRIGGER IF NOT EXISTS document_stats_insert
+    AFTER INSERT ON document_history BEGIN
+        {_stats_upsert("NEW", "+")}
+    END;
+    CREATE TRIGGER IF NOT EXISTS document_stats_update
+    AFTER UPDATE OF upload_date, risk_level, document_language, privacy_level, file_size_kb, content_length
+    ON document_history BEGIN
+        {_stats_upsert("OLD", "-")}
+        {_stats_upsert("NEW", "+")}
+    END;
+    CREATE TRIGGER IF NOT EXISTS document_stats_delete
+    AFTER DELETE ON document_history BEGIN
+        {_stats_upsert("OLD", "-")}
+    END;
+"""
+
+# Counts documents that existed before the rollup table did
+STATS_BACKFILL_SQL = """
+    INSERT INTO document_stats_daily
+        (day, risk_level, document_language, privacy_level, documents, total_size_kb, total_length)
+    SELECT date(upload_date), COALESCE(risk_level, 'Unknown'), COALESCE(document_language, 'unknown'),
+           privacy_level, count(*), COALESCE(sum(file_size_kb), 0), COALESCE(sum(content_length), 0)
+    FROM document_history
+    WHERE NOT EXISTS (SELECT 1 FROM document_stats_daily)
+    GROUP BY 1, 2, 3, 4
+"""
+
+# BM25 weights of the filename, factors and content columns of document_search
+SEARCH_WEIGHTS = (10.0, 4.0, 1.0)
+
+
+def _format_timestamp(value):
+    """Format a datetime like the stored TIMESTAMP columns"""
+    return value.strftime("%Y-%m-%d %H:%M:%S.") + f"{value.microsecond // 1000:03d}"
+
+
+def _parse_timestamp(value):
+    return datetime.fromisoformat(value.decode("utf-8"))
+
+
+sqlite3.register_adapter(datetime, _format_timestamp)
+sqlite3.register_converter("TIMESTAMP", _parse_timestamp)
+sqlite3.register_converter("BOOLEAN", lambda value: value not in (b"0", b""))
+
+
+def _dict_factory(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+_idle_connections = queue.LifoQueue(maxsize=SQLITE_POOL_SIZE)
+_metrics = {"opened": 0, "checkouts": 0}
+_metrics_lock = threading.Lock()
+
+
+def _open_connection():
+    """Open a connection with the pragmas every connection needs"""
+    directory = os.path.dirname(SQLITE_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(
+        SQLITE_PATH,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        # Transactions are opened explicitly with BEGIN IMMEDIATE
+        isolation_level=None,
+        check_same_thread=False,
+    )
+    connection.row_factory = _dict_factory
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = NORMAL")
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    with _metrics_lock:
+        _metrics["opened"] += 1
+    return connection
+
+
+class _Transaction:
+    """
+    Context manager for a write transaction
+
+    BEGIN IMMEDIATE takes the write lock up front, so a transaction never fails
+    halfway through because another connection started writing first.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        return False
+
+
+def get_connection():
+    """
+    Borrow a connection to the SQLite database
+
+    The connection must be handed back with release_connection.
+
+    Returns:
+        connection: sqlite3 connection object or None if unavailable
+    """
+    with _metrics_lock:
+        _metrics["checkouts"] += 1
+    try:
+        return _idle_connections.get_nowait()
+    except queue.Empty:
+        pass
+    try:
+        return _open_connection()
+    except Exception as e:
+        logger.error(f"Database connection error: {e}")
+        return None
+
+
+def release_connection(connection):
+    """
+    Return a borrowed connection for reuse
+
+    Args:
+        connection: Connection obtained from get_connection
+    """
+    if connection is None:
+        return
+    if connection.in_transaction:
+        connection.rollback()
+    try:
+        _idle_connections.put_nowait(connection)
+    except queue.Full:
+        connection.close()
+
+
+def get_pool_stats():
+    """
+    Get connection reuse metrics
+
+    Returns:
+        dict: Connections opened, checkouts and idle connections
+    """
+    with _metrics_lock:
+        stats = dict(_metrics)
+    stats["idle"] = _idle_connections.qsize()
+    stats["path"] = SQLITE_PATH
+    return stats
+
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def ensure_schema():
+    """
+    Create the tables if they do not exist
+
+    Runs once per process.
+
+    Returns:
+        bool: True if the schema is up to date
+    """
+    global _schema_ready
+    if _schema_ready:
+        return True
+
+    with _schema_lock:
+        if _schema_ready:
+            return True
+
+        connection = get_connection()
+        if not connection:
+            return False
+
+        try:
+            connection.executescript(SCHEMA_SQL)
+            with _Transaction(connection):
+                connection.execute(STATS_BACKFILL_SQL)
+            _schema_ready = True
+            return True
+        except Exception as e:
+            logger.error(f"Error creating the SQLite schema: {e}")
+            return False
+        finally:
+            release_connection(connection)
+
+
+def _in_list(values):
+    """Pass a list of ids or text values as one parameter, for IN (SELECT value FROM json_each(?))"""
+    return json.dumps(list(values))
+
+
+def _next_ids(connection, table, count):
+    """Reserve IDs from the sequences table within the caller's transaction"""
+    row = connection.execute(
+        "UPDATE sequences SET value = value + ? WHERE name = ? RETURNING value",
+        (count, table)
+    ).fetchone()
+    return list(range(row["value"] - count + 1, row["value"] + 1))
+
+
+def _insert_documents(connection, documents):
+    """
+    Insert prepared documents with their risk factors, privacy settings and
+    search entries within the caller's transaction
+
+    Args:
+        connection: Connection with an open transaction
+        documents (list): Dicts from prepare_documents
+
+    Returns:
+        list: Document IDs in input order
+    """
+    missing = [document for document in documents if document["id"] is None]
+    for document, document_id in zip(missing, _next_ids(connection, "document_history", len(missing))):
+        document["id"] = document_id
+
+    # A pre-allocated id that already exists was written by an earlier attempt
+    existing = {
+        row["id"] for row in connection.execute(
+            "SELECT id FROM document_history WHERE id IN (SELECT value FROM json_each(?))",
+            (_in_list(document["id"] for document in documents),)
+        )
+    }
+    new_documents = [document for document in documents if document["id"] not in existing]
+
+    # A forced reprocess takes over the content hash from the earlier document
+    connection.executemany(
+        """
+        UPDATE document_history SET content_hash = NULL
+        WHERE privacy_level = ? AND content_hash = ? AND id <> ?
+        """,
+        [(document["privacy_level"], document["content_hash"], document["id"])
+         for document in new_documents if document["replace_duplicate"]]
+    )
+
+    # One document_contents row per distinct body; the no-op update reports
+    # the id of an existing identical body
+    content_ids = {}
+    for document in new_documents:
+        key = document["content_key"]
+        if key and key not in content_ids:
+            content_ids[key] = connection.execute(
+                """
+                INSERT INTO document_contents (content_key, body, is_encrypted)
+                VALUES (?, ?, ?)
+                ON CONFLICT (content_key) DO UPDATE SET content_key = excluded.content_key
+                RETURNING id
+                """,
+                (key, document["body"], document["is_encrypted"])
+            ).fetchone()["id"]
+
+    connection.executemany(
+        """
+        INSERT INTO document_history
+        (id, filename, file_size_kb, document_language, risk_level, content_length,
+         content_id, is_encrypted, access_token, privacy_level, content_hash)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [(document["id"], document["filename"], document["file_size_kb"], document["document_language"],
+          document["risk_level"], document["content_length"], content_ids.get(document["content_key"]),
+          document["is_encrypted"], document["access_token"], document["privacy_level"],
+          document["content_hash"])
+         for document in new_documents]
+    )
+    connection.executemany(
+        """
+        INSERT INTO risk_factors
+        (document_id, risk_factor, category, term, occurrence_count, pattern_id, start_offset, end_offset)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [(document["id"], *row) for document in new_documents for row in document["risk_factors"]]
+    )
+    connection.executemany(
+        """
+        INSERT INTO privacy_settings
+        (document_id, privacy_level, retention_days, anonymize_text, encrypt_storage, access_token)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        [(document["id"], document["privacy_level"], document["retention_days"], document["anonymize_text"],
+          document["encrypt_storage"], document["access_token"])
+         for document in new_documents]
+    )
+    connection.executemany(
+        "INSERT INTO document_search (rowid, filename, factors, content) VALUES (?, ?, ?, ?)",
+        [(document["id"], document["filename"], "\n".join(row[0] for row in document["risk_factors"]),
+          document["search_text"])
+         for document in new_documents]
+    )
+    connection.executemany(
+        "INSERT OR IGNORE INTO document_blind_index (term_hash, document_id) VALUES (?, ?)",
+        [(term_hash, document["id"]) for document in new_documents for term_hash in document["blind_hashes"]]
+    )
+    return [document["id"] for document in documents]
+
+
+def _write_prepared(connection, prepared):
+    """Insert prepared documents in one transaction"""
+    document_ids = []
+    with _Transaction(connection):
+        for start in range(0, len(prepared), BATCH_INSERT_SIZE):
+            document_ids.extend(_insert_documents(connection, prepared[start:start + BATCH_INSERT_SIZE]))
+    return document_ids
+
+
+def save_document_history_batch(documents):
+    """
+    Save many analysed documents in one transaction
+
+    Args:
+        documents (list): Dicts with the keyword arguments of save_document_history
+
+    Returns:
+        list: Created document IDs in input order, or None if failed
+    """
+    if not documents:
+        return []
+
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return None
+
+    try:
+        return _write_prepared(connection, prepare_documents(documents))
+    except Exception as e:
+        logger.error(f"Error saving document history: {e}")
+        return None
+    finally:
+        release_connection(connection)
+
+
+def write_prepared_documents(prepared):
+    """
+    Write documents from prepare_documents, raising on failure
+
+    Documents with a pre-allocated id that is already stored are skipped, so a
+    retried write is safe.
+
+    Args:
+        prepared (list): Prepared documents
+
+    Returns:
+        list: Document IDs in input order
+
+    Raises:
+        sqlite3.Error: If the write fails
+    """
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        raise sqlite3.OperationalError("Could not open the SQLite database")
+
+    try:
+        return _write_prepared(connection, prepared)
+    finally:
+        release_connection(connection)
+
+
+def allocate_ids(table, count):
+    """
+    Reserve IDs ahead of inserting rows
+
+    Args:
+        table (str): document_history or document_summaries
+        count (int): Number of IDs to reserve
+
+    Returns:
+        list: Reserved IDs, or an empty list if failed
+    """
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return []
+
+    try:
+        with _Transaction(connection):
+            return _next_ids(connection, table, count)
+    except Exception as e:
+        logger.error(f"Error allocating ids for {table}: {e}")
+        return []
+    finally:
+        release_connection(connection)
+
+
+def find_duplicate_document(content_hash, privacy_level='standard'):
+    """
+    Find the earlier analysis of an identical upload
+
+    Args:
+        content_hash (str): compute_content_hash of the uploaded file
+        privacy_level (str): Privacy level of the new upload
+
+    Returns:
+        dict: id, document_language, risk_level and risk_factors of the earlier
+              document, or None
+    """
+    if not content_hash:
+        return None
+
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return None
+
+    try:
+        document = connection.execute(
+            """
+            SELECT id, document_language, risk_level FROM document_history
+            WHERE privacy_level = ? AND content_hash = ?
+            """,
+            (privacy_level, content_hash)
+        ).fetchone()
+        if not document:
+            return None
+        rows = connection.execute(
+            """
+            SELECT risk_factor, category AS kind, term, occurrence_count AS count, pattern_id,
+                   start_offset, end_offset
+            FROM risk_factors WHERE document_id = ? ORDER BY id
+            """,
+            (document["id"],)
+        ).fetchall()
+    except Exception as e:
+        logger.error(f"Error finding duplicate document: {e}")
+        return None
+    finally:
+        release_connection(connection)
+
+    # Rows stored before risk factors were structured only have their text
+    factors = []
+    for factor in rows:
+        text = factor.pop("risk_factor")
+        factors.append(factor if factor["kind"] in RISK_FACTOR_KINDS else text)
+    document["risk_factors"] = factors
+    return document
+
+
+def get_saved_summary(document_id, detail_level, language="english"):
+    """
+    Get the latest stored summary of a document, decrypting if necessary
+
+    Returns:
+        str: Summary text or None if there is none
+    """
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return None
+
+    try:
+        row = connection.execute(
+            """
+            SELECT summary_data FROM document_summaries
+            WHERE document_id = ? AND detail_level = ? AND language = ?
+            ORDER BY generation_date DESC, id DESC
+            LIMIT 1
+            """,
+            (document_id, detail_level, language)
+        ).fetchone()
+        return storage_codec.decode(row["summary_data"], encryption) if row else None
+    except Exception as e:
+        logger.error(f"Error getting saved summary: {e}")
+        return None
+    finally:
+        release_connection(connection)
+
+
+def _write_summary(connection, document_id, summary_text, detail_level, language, summary_id=None):
+    """
+    Insert one summary within the caller's transaction
+
+    Returns:
+        int: ID of the summary or None if the document does not exist
+    """
+    document = connection.execute(
+        "SELECT privacy_level FROM document_history WHERE id = ?", (document_id,)
+    ).fetchone()
+    if not document:
+        return None
+
+    if summary_id is None:
+        summary_id = _next_ids(connection, "document_summaries", 1)[0]
+    elif connection.execute("SELECT 1 FROM document_summaries WHERE id = ?", (summary_id,)).fetchone():
+        # Already written by an earlier attempt
+        return summary_id
+
+    is_encrypted = document["privacy_level"] in ['enhanced', 'maximum']
+    connection.execute(
+        """
+        INSERT INTO document_summaries (id, document_id, summary_data, detail_level, language, is_encrypted)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (summary_id, document_id, storage_codec.encode(summary_text, encryption if is_encrypted else None),
+         detail_level, language, is_encrypted)
+    )
+
+    # Standard-privacy summaries are searchable alongside the body,
+    # encrypted ones through the blind index
+    if is_encrypted:
+        connection.executemany(
+            "INSERT OR IGNORE INTO document_blind_index (term_hash, document_id) VALUES (?, ?)",
+            [(term_hash, document_id) for term_hash in blind_index.text_hashes(summary_text)]
+        )
+    else:
+        connection.execute(
+            """
+            UPDATE document_search
+            SET content = COALESCE(content || char(10), '') || ?
+            WHERE rowid = ?
+            """,
+            (_search_text(summary_text), document_id)
+        )
+    return summary_id
+
+
+def save_document_summary(document_id, summary_text, detail_level, language="english", summary_id=None):
+    """
+    Save document summary with encryption if needed
+
+    Returns:
+        int: ID of the created summary or None if failed
+    """
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return None
+
+    try:
+        with _Transaction(connection):
+            return _write_summary(connection, document_id, summary_text, detail_level, language, summary_id)
+    except Exception as e:
+        logger.error(f"Error saving document summary: {e}")
+        return None
+    finally:
+        release_connection(connection)
+
+
+def write_summaries(summaries):
+    """
+    Save several summaries in one transaction, raising on failure
+
+    Returns:
+        list: Summary IDs in input order; None for summaries whose document no longer exists
+
+    Raises:
+        sqlite3.Error: If the write fails
+    """
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        raise sqlite3.OperationalError("Could not open the SQLite database")
+
+    try:
+        with _Transaction(connection):
+            return [_write_summary(connection, **summary) for summary in summaries]
+    finally:
+        release_connection(connection)
+
+
+# Columns needed to render the history list
+HISTORY_LIST_COLUMNS = "id, filename, upload_date, document_language, risk_level, privacy_level, file_size_kb"
+
+# Metadata columns of document_history
+DOCUMENT_METADATA_COLUMNS = """id, filename, file_size_kb, document_language, risk_level, content_length,
+    upload_date, is_encrypted, access_token, privacy_level, content_id"""
+
+
+def list_documents(limit=20, cursor=None, risk_level=None, language=None, date_from=None, date_to=None):
+    """
+    Get one page of document history using keyset pagination
+
+    Returns:
+        tuple: (documents, next_cursor) where next_cursor is None on the last page
+    """
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return [], None
+
+    conditions = []
+    params = []
+    if cursor is not None:
+        conditions.append("(upload_date, id) < (?, ?)")
+        params.extend(cursor)
+    if risk_level is not None:
+        conditions.append("risk_level = ?")
+        params.append(risk_level)
+    if language is not None:
+        conditions.append("document_language = ?")
+        params.append(language)
+    if date_from is not None:
+        conditions.append("upload_date >= ?")
+        params.append(date_from)
+    if date_to is not None:
+        conditions.append("upload_date < ?")
+        params.append(date_to)
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    # Fetch one extra row to know whether another page exists
+    params.append(limit + 1)
+
+    try:
+        documents = connection.execute(f"""
+            SELECT {HISTORY_LIST_COLUMNS}
+            FROM document_history
+            {where_clause}
+            ORDER BY upload_date DESC, id DESC
+            LIMIT ?
+        """, params).fetchall()
+    except Exception as e:
+        logger.error(f"Error listing documents: {e}")
+        return [], None
+    finally:
+        release_connection(connection)
+
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = (documents[-1]["upload_date"], documents[-1]["id"])
+    return documents, next_cursor
+
+
+def get_document_with_risk_factors(document_id):
+    """
+    Get document history with its risk factors
+
+    Returns:
+        dict: Document record with risk factors list
+    """
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return None
+
+    try:
+        document = connection.execute(
+            f"SELECT {DOCUMENT_METADATA_COLUMNS} FROM document_history WHERE id = ?", (document_id,)
+        ).fetchone()
+        if not document:
+            return None
+        document["risk_factors"] = [
+            row["risk_factor"] for row in connection.execute(
+                "SELECT risk_factor FROM risk_factors WHERE document_id = ? ORDER BY id", (document_id,)
+            )
+        ]
+        return document
+    except Exception as e:
+        logger.error(f"Error getting document with risk factors: {e}")
+        return None
+    finally:
+        release_connection(connection)
+
+
+def _summary_loader(summary_data):
+    """Build the deferred decoder for one summary's text"""
+    def load():
+        try:
+            return storage_codec.decode(summary_data, encryption)
+        except Exception as e:
+            logger.error(f"Error decrypting summary: {e}")
+            return "[Encrypted content - decryption failed]"
+    return load
+
+
+def load_document_details(document_id):
+    """
+    Get a document with its risk factors, summaries and privacy settings
+
+    Reads within one snapshot; the queries run in-process, so splitting them
+    costs no round trips. Summaries are LazyRecords whose summary_text is
+    decoded on first access.
+
+    Returns:
+        dict: Document record with risk_factors, summaries and privacy_settings,
+              or None if not found
+    """
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return None
+
+    try:
+        connection.execute("BEGIN")
+        document = connection.execute(
+            f"SELECT {DOCUMENT_METADATA_COLUMNS} FROM document_history WHERE id = ?", (document_id,)
+        ).fetchone()
+        if not document:
+            return None
+        document["risk_factors"] = [
+            row["risk_factor"] for row in connection.execute(
+                "SELECT risk_factor FROM risk_factors WHERE document_id = ? ORDER BY id", (document_id,)
+            )
+        ]
+        summaries = connection.execute(
+            """
+            SELECT id, detail_level, language, is_encrypted, generation_date, summary_data
+            FROM document_summaries WHERE document_id = ?
+            ORDER BY generation_date DESC, id DESC
+            """,
+            (document_id,)
+        ).fetchall()
+        document["privacy_settings"] = connection.execute(
+            "SELECT * FROM privacy_settings WHERE document_id = ? ORDER BY id LIMIT 1", (document_id,)
+        ).fetchone()
+        connection.execute("COMMIT")
+    except Exception as e:
+        logger.error(f"Error loading document details: {e}")
+        return None
+    finally:
+        release_connection(connection)
+
+    document["summaries"] = [
+        LazyRecord(summary, {"summary_text": _summary_loader(summary.pop("summary_data"))})
+        for summary in summaries
+    ]
+    return document
+
+
+def get_document_text(document_id):
+    """
+    Get the full document text, decrypting if necessary
+
+    Returns:
+        str: Decrypted document text or None
+    """
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return None
+
+    try:
+        row = connection.execute(
+            """
+            SELECT c.body FROM document_history d
+            JOIN document_contents c ON c.id = d.content_id
+            WHERE d.id = ?
+            """,
+            (document_id,)
+        ).fetchone()
+    except Exception as e:
+        logger.error(f"Error getting document text: {e}")
+        return None
+    finally:
+        release_connection(connection)
+
+    if not row or row["body"] is None:
+        return None
+    try:
+        return storage_codec.decode(row["body"], encryption)
+    except Exception as e:
+        logger.error(f"Error decrypting document text: {e}")
+        return "[Encrypted content - decryption failed]"
+
+
+@contextlib.contextmanager
+def open_document_text(document_id, slice_size=1 << 20):
+    """
+    Open the text of a document as a stream of pieces, decrypting if necessary
+
+    The body is read through incremental blob I/O, so a large body is never
+    held in memory whole. The connection is released when the with block ends.
+
+    Yields:
+        iterator: Consecutive str pieces of the document text
+    """
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        raise sqlite3.OperationalError("Database unavailable")
+
+    try:
+        row = connection.execute(
+            """
+            SELECT c.id FROM document_history d
+            JOIN document_contents c ON c.id = d.content_id
+            WHERE d.id = ? AND c.body IS NOT NULL
+            """,
+            (document_id,)
+        ).fetchone()
+        if not row:
+            yield iter(())
+            return
+        with connection.blobopen("document_contents", "body", row["id"], readonly=True) as blob:
+            yield storage_codec.iter_decode(iter(lambda: blob.read(slice_size), b""), encryption)
+    finally:
+        release_connection(connection)
+
+def get_document_summaries(document_id):
+    """
+    Get all summaries for a document, decrypting if necessary
+
+    Returns:
+        list: List of summary records with decrypted content
+    """
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return []
+
+    try:
+        summaries = connection.execute(
+            """
+            SELECT * FROM document_summaries WHERE document_id = ?
+            ORDER BY generation_date DESC, id DESC
+            """,
+            (document_id,)
+        ).fetchall()
+    except Exception as e:
+        logger.error(f"Error getting document summaries: {e}")
+        return []
+    finally:
+        release_connection(connection)
+
+    for summary in summaries:
+        summary["summary_text"] = _summary_loader(summary.pop("summary_data"))()
+    return summaries
+
+
+def get_privacy_settings(document_id):
+    """
+    Get privacy settings for a document
+
+    Returns:
+        dict: Privacy settings or None if not found
+    """
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return None
+
+    try:
+        return connection.execute(
+            "SELECT * FROM privacy_settings WHERE document_id = ? ORDER BY id LIMIT 1", (document_id,)
+        ).fetchone()
+    except Exception as e:
+        logger.error(f"Error getting privacy settings: {e}")
+        return None
+    finally:
+        release_connection(connection)
+
+
+def update_privacy_settings(document_id, privacy_level=None, retention_days=None,
+                            anonymize_text=None, encrypt_storage=None):
+    """
+    Update privacy settings for a document
+
+    Returns:
+        bool: Success or failure
+    """
+    fields = {
+        "privacy_level": privacy_level,
+        "retention_days": retention_days,
+        "anonymize_text": anonymize_text,
+        "encrypt_storage": encrypt_storage,
+    }
+    fields = {column: value for column, value in fields.items() if value is not None}
+    if not fields:
+        return False
+
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return False
+
+    try:
+        with _Transaction(connection):
+            connection.execute(
+                f"UPDATE privacy_settings SET {', '.join(column + ' = ?' for column in fields)} WHERE document_id = ?",
+                (*fields.values(), document_id)
+            )
+            if privacy_level is not None:
+                connection.execute(
+                    "UPDATE document_history SET privacy_level = ? WHERE id = ?", (privacy_level, document_id)
+                )
+                # Text is only searchable while the document has standard privacy
+                if privacy_level != 'standard':
+                    connection.execute("UPDATE document_search SET content = NULL WHERE rowid = ?", (document_id,))
+        return True
+    except Exception as e:
+        logger.error(f"Error updating privacy settings: {e}")
+        return False
+    finally:
+        release_connection(connection)
+
+
+def _delete_documents(connection, document_ids):
+    """
+    Delete documents by id within the caller's transaction
+
+    Returns:
+        dict: Number of rows deleted per table
+    """
+    ids = _in_list(document_ids)
+    counts = {}
+    for table in DOCUMENT_CHILD_TABLES:
+        counts[table] = connection.execute(
+            f"DELETE FROM {table} WHERE document_id IN (SELECT value FROM json_each(?))", (ids,)
+        ).rowcount
+
+    deleted = connection.execute(
+        "DELETE FROM document_history WHERE id IN (SELECT value FROM json_each(?)) RETURNING content_id",
+        (ids,)
+    ).fetchall()
+    counts["document_history"] = len(deleted)
+    content_ids = {row["content_id"] for row in deleted if row["content_id"] is not None}
+    counts["document_contents"] = connection.execute(
+        """
+        DELETE FROM document_contents
+        WHERE id IN (SELECT value FROM json_each(?))
+          AND NOT EXISTS (SELECT 1 FROM document_history d WHERE d.content_id = document_contents.id)
+        """,
+        (_in_list(content_ids),)
+    ).rowcount
+    return counts
+
+
+def delete_documents(access_tokens=None, older_than_days=None, privacy_level=None, batch_size=1000):
+    """
+    Delete many documents and all related data in batches of batch_size
+
+    Returns:
+        dict: Rows deleted per table, plus "error" (None on success). None if the
+              database is unavailable.
+    """
+    if not access_tokens and older_than_days is None and privacy_level is None:
+        raise ValueError("delete_documents needs access tokens or a filter")
+
+    conditions = []
+    params = []
+    if older_than_days is not None:
+        conditions.append(f"upload_date < strftime('{TIMESTAMP_FORMAT}', 'now', ?)")
+        params.append(f"-{int(older_than_days)} days")
+    if privacy_level is not None:
+        conditions.append("privacy_level = ?")
+        params.append(privacy_level)
+
+    totals = dict.fromkeys(DOCUMENT_CHILD_TABLES + ["document_history", "document_contents"], 0)
+    totals["error"] = None
+
+    def delete_batch(batch_conditions, batch_params):
+        with _Transaction(connection):
+            document_ids = [
+                row["id"] for row in connection.execute(f"""
+                    SELECT id FROM document_history
+                    WHERE {' AND '.join(batch_conditions)}
+                    ORDER BY id
+                    LIMIT ?
+                """, batch_params + [batch_size])
+            ]
+            if document_ids:
+                for table, count in _delete_documents(connection, document_ids).items():
+                    totals[table] += count
+        return len(document_ids)
+
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return None
+
+    try:
+        if access_tokens:
+            tokens = list(dict.fromkeys(access_tokens))
+            for start in range(0, len(tokens), batch_size):
+                delete_batch(
+                    conditions + ["access_token IN (SELECT value FROM json_each(?))"],
+                    params + [_in_list(tokens[start:start + batch_size])]
+                )
+        else:
+            while delete_batch(conditions, params):
+                pass
+
+        logger.info(f"Deleted {totals['document_history']} documents")
+        return totals
+    except Exception as e:
+        logger.error(f"Error deleting documents: {e}")
+        totals["error"] = str(e)
+        return totals
+    finally:
+        release_connection(connection)
+
+
+def find_documents_with_risk_factor(category, term=None, pattern_id=None, since_days=None, limit=100):
+    """
+    Find documents with a given structured risk factor
+
+    Returns:
+        list: Document metadata records, most recent first
+    """
+    conditions = ["rf.category = ?"]
+    params = [category]
+    if term is not None:
+        conditions.append("rf.term = ?")
+        params.append(term)
+    if pattern_id is not None:
+        conditions.append("rf.pattern_id = ?")
+        params.append(pattern_id)
+    if since_days is not None:
+        conditions.append(f"d.upload_date >= strftime('{TIMESTAMP_FORMAT}', 'now', ?)")
+        params.append(f"-{int(since_days)} days")
+    params.append(limit)
+
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return []
+
+    try:
+        return connection.execute(f"""
+            SELECT d.id, d.filename, d.upload_date, d.document_language, d.risk_level,
+                   d.privacy_level, rf.occurrence_count, rf.start_offset, rf.end_offset
+            FROM risk_factors rf
+            JOIN document_history d ON d.id = rf.document_id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY d.upload_date DESC
+            LIMIT ?
+        """, params).fetchall()
+    except Exception as e:
+        logger.error(f"Error finding documents by risk factor: {e}")
+        return []
+    finally:
+        release_connection(connection)
+
+
+# Documents past their retention period, oldest first
+EXPIRED_DOCUMENTS_SQL = f"""
+    SELECT d.id
+    FROM document_history d
+    LEFT JOIN privacy_settings p ON p.document_id = d.id
+    WHERE d.upload_date < strftime('{TIMESTAMP_FORMAT}', 'now',
+                                   '-' || COALESCE(p.retention_days, :default_days) || ' days')
+    ORDER BY d.upload_date, d.id
+    LIMIT :limit
+"""
+
+
+def count_expired_documents(default_days=30):
+    """
+    Count the documents past their privacy_settings.retention_days
+
+    Returns:
+        int: Number of expired documents or None if failed
+    """
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return None
+
+    try:
+        return connection.execute(
+            f"SELECT count(*) AS expired FROM ({EXPIRED_DOCUMENTS_SQL}) expired",
+            {"default_days": default_days, "limit": -1}
+        ).fetchone()["expired"]
+    except Exception as e:
+        logger.error(f"Error counting expired documents: {e}")
+        return None
+    finally:
+        release_connection(connection)
+
+
+def delete_expired_documents(batch_size=500, default_days=30, lock_timeout="2s"):
+    """
+    Delete one batch of documents past their retention period
+
+    SQLite has a single writer, so there are no row locks to skip; lock_timeout
+    is accepted for compatibility and the busy timeout bounds the wait instead.
+
+    Returns:
+        int: Number of documents deleted or None if failed
+    """
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return None
+
+    try:
+        with _Transaction(connection):
+            document_ids = [
+                row["id"] for row in connection.execute(
+                    EXPIRED_DOCUMENTS_SQL, {"default_days": default_days, "limit": batch_size}
+                )
+            ]
+            if not document_ids:
+                return 0
+            return _delete_documents(connection, document_ids)["document_history"]
+    except Exception as e:
+        logger.error(f"Error deleting expired documents: {e}")
+        return None
+    finally:
+        release_connection(connection)
+
+
+
+def create_future_partitions(months_ahead=3):
+    """
+    SQLite tables are not partitioned; kept for compatibility
+
+    Returns:
+        int: Always 0
+    """
+    return 0
+
+
+def drop_expired_partitions(default_days=30, lock_timeout="2s"):
+    """
+    SQLite tables are not partitioned, so expired documents are always deleted
+    by delete_expired_documents; kept for compatibility
+
+    Returns:
+        int: Always 0
+    """
+    return 0
+
+def record_retention_run(run):
+    """
+    Write a finished retention purge to the retention_runs log
+
+    Returns:
+        bool: True if recorded
+    """
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return False
+
+    try:
+        with _Transaction(connection):
+            connection.execute(
+                f"""
+                INSERT INTO retention_runs
+                (started_at, finished_at, dry_run, documents_deleted, batches, lock_timeouts, error)
+                VALUES (strftime('{TIMESTAMP_FORMAT}', ?, 'unixepoch'), strftime('{TIMESTAMP_FORMAT}', ?, 'unixepoch'),
+                        ?, ?, ?, ?, ?)
+                """,
+                (run["started_at"], run["finished_at"], run["dry_run"], run["documents_deleted"],
+                 run["batches"], run["lock_timeouts"], run["error"])
+            )
+        return True
+    except Exception as e:
+        logger.error(f"Error recording retention run: {e}")
+        return False
+    finally:
+        release_connection(connection)
+
+
+def get_retention_runs(limit=20):
+    """
+    Get recent retention purges from the run log
+
+    Returns:
+        list: Run records, newest first
+    """
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return []
+
+    try:
+        return connection.execute(
+            "SELECT * FROM retention_runs ORDER BY started_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+    except Exception as e:
+        logger.error(f"Error getting retention runs: {e}")
+        return []
+    finally:
+        release_connection(connection)
+
+
+def get_document_stats(group_by=(), by_day=False, date_from=None, date_to=None):
+    """
+    Aggregate document statistics from the daily rollup
+
+    Returns:
+        list: One dict per group with its dimensions (and day), documents,
+              total_size_kb and total_length, ordered by day and dimensions
+    """
+    columns = _stats_query(group_by, by_day)
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return []
+
+    column_list = ", ".join(columns)
+    try:
+        rows = connection.execute(
+            f"""
+            SELECT {column_list + "," if columns else ""}
+                   sum(documents) AS documents,
+                   sum(total_size_kb) AS total_size_kb,
+                   sum(total_length) AS total_length
+            FROM document_stats_daily
+            WHERE (:date_from IS NULL OR day >= :date_from)
+              AND (:date_to IS NULL OR day <= :date_to)
+            {"GROUP BY " + column_list if columns else ""}
+            HAVING sum(documents) > 0
+            {"ORDER BY " + column_list if columns else ""}
+            """,
+            {
+                "date_from": date_from.isoformat() if date_from else None,
+                "date_to": date_to.isoformat() if date_to else None,
+            }
+        ).fetchall()
+    except Exception as e:
+        logger.error(f"Error getting document statistics: {e}")
+        return []
+    finally:
+        release_connection(connection)
+
+    for row in rows:
+        if "day" in row:
+            row["day"] = date.fromisoformat(row["day"])
+    return rows
+
+
+# Export queries in the column order of EXPORT_COLUMNS
+EXPORT_SQL = {
+    "documents": """
+        SELECT d.id, d.filename, d.file_size_kb, d.document_language, d.risk_level, d.content_length,
+               d.upload_date, d.privacy_level, d.is_encrypted, p.retention_days, p.anonymize_text{text_columns}
+        FROM document_history d
+        LEFT JOIN privacy_settings p ON p.document_id = d.id{text_join}
+        ORDER BY d.id
+    """,
+    "risk_factors": f"""
+        SELECT {", ".join(EXPORT_COLUMNS["risk_factors"])}
+        FROM risk_factors
+        ORDER BY id
+    """,
+}
+
+
+def iter_export_batches(table, batch_size=5000, include_text=False, decrypt=False):
+    """
+    Stream the rows of an export table in batches
+
+    Encrypted bodies are only decrypted with decrypt set; see
+    utils.database.iter_export_batches.
+
+    Yields:
+        list: Up to batch_size dicts with the EXPORT_COLUMNS of the table, plus
+              document_text when include_text is set
+    """
+    if table not in EXPORT_SQL:
+        raise ValueError(f"Cannot export {table}; use one of {', '.join(EXPORT_SQL)}")
+    text = include_text and table == "documents"
+    query = EXPORT_SQL[table].format(
+        text_columns=", c.body" if text else "",
+        text_join=" LEFT JOIN document_contents c ON c.id = d.content_id" if text else ""
+    )
+
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        raise sqlite3.OperationalError("Database unavailable")
+
+    try:
+        cursor = connection.execute(query)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            if text:
+                for row in rows:
+                    body = row.pop("body")
+                    row["document_text"] = None
+                    if storage_codec.is_encrypted(body) and not decrypt:
+                        continue
+                    try:
+                        row["document_text"] = storage_codec.decode(body, encryption)
+                    except Exception as e:
+                        logger.error(f"Error decoding the text of document {row['id']} for export: {e}")
+            yield rows
+        cursor.close()
+    finally:
+        release_connection(connection)
+
+
+def copy_export_csv(table, output):
+    """
+    Write an export table as CSV with a header row
+
+    Returns:
+        int: Number of rows written
+    """
+    if table not in EXPORT_SQL:
+        raise ValueError(f"Cannot export {table}; use one of {', '.join(EXPORT_SQL)}")
+    writer = csv.writer(output)
+    writer.writerow(EXPORT_COLUMNS[table])
+    count = 0
+    for rows in iter_export_batches(table):
+        writer.writerows(row.values() for row in rows)
+        count += len(rows)
+    return count
+
+
+def _fts_query(query):
+    """
+    Translate web search syntax into an FTS5 query
+
+    Supports quoted phrases, OR and -word like websearch_to_tsquery. Every term
+    is quoted, so punctuation in the query cannot break FTS5's syntax.
+
+    Returns:
+        str: FTS5 query or None if the query has no terms
+    """
+    include = []
+    exclude = []
+    for negated, phrase, word in re.findall(r'(-?)(?:"([^"]*)"|(\S+))', query):
+        if not negated and word.upper() == "OR":
+            if include and include[-1] != "OR":
+                include.append("OR")
+            continue
+        term = phrase.strip() if phrase else word
+        if term:
+            (exclude if negated else include).append('"' + term.replace('"', '""') + '"')
+
+    # OR needs a term on both sides
+    if include and include[-1] == "OR":
+        include.pop()
+    if not include:
+        return None
+    fts_query = " ".join(include)
+    if exclude:
+        fts_query = f"({fts_query}) NOT ({' OR '.join(exclude)})"
+    return fts_query
+
+
+def search_documents(query, language=None, limit=20, risk_level=None, snippets=True, include_encrypted=True):
+    """
+    Full-text search over filenames, risk factors and standard-privacy text
+
+    Uses the FTS5 index with BM25 ranking. The porter stemmer covers English;
+    other languages match on whole words. language is accepted for
+    compatibility.
+
+    Returns:
+        list: Result records with rank, headline and snippet, best match first.
+              Blind index matches follow the ranked ones with rank None.
+    """
+    if not query or not query.strip():
+        return []
+
+    results = []
+    fts_query = _fts_query(query)
+    if fts_query:
+        ensure_schema()
+        connection = get_connection()
+        if not connection:
+            return []
+
+        params = {"query": fts_query, "limit": limit}
+        risk_filter = ""
+        if risk_level is not None:
+            risk_filter = "AND d.risk_level = :risk_level"
+            params["risk_level"] = risk_level
+        weights = ", ".join(str(weight) for weight in SEARCH_WEIGHTS)
+        snippet = (
+            "snippet(document_search, 2, '**', '**', '…', 16)" if snippets else "NULL"
+        )
+
+        try:
+            results = connection.execute(f"""
+                SELECT d.id, d.filename, d.upload_date, d.document_language, d.risk_level, d.privacy_level,
+                       -bm25(document_search, {weights}) AS rank,
+                       highlight(document_search, 0, '**', '**')
+                           || char(10) || COALESCE(highlight(document_search, 1, '**', '**'), '') AS headline,
+                       {snippet} AS snippet
+                FROM document_search
+                JOIN document_history d ON d.id = document_search.rowid
+                WHERE document_search MATCH :query {risk_filter}
+                ORDER BY bm25(document_search, {weights}), d.id DESC
+                LIMIT :limit
+            """, params).fetchall()
+        except sqlite3.OperationalError as e:
+            logger.error(f"Error searching documents: {e}")
+            return []
+        finally:
+            release_connection(connection)
+
+        for result in results:
+            # snippet() returns the column start when only the filename or factors matched
+            if not result["snippet"] or "**" not in result["snippet"]:
+                result["snippet"] = None
+
+    if include_encrypted and len(results) < limit:
+        found = {result["id"] for result in results}
+        for document in search_encrypted_documents(query, limit=limit, risk_level=risk_level):
+            if document["id"] in found or len(results) >= limit:
+                continue
+            document.update(rank=None, headline=document["filename"], snippet=None)
+            results.append(document)
+    return results
+
+
+def search_encrypted_documents(query, limit=20, risk_level=None):
+    """
+    Find encrypted documents containing every word of a query through the blind index
+
+    Returns:
+        list: Document records (HISTORY_LIST_COLUMNS), newest first
+    """
+    term_hashes = [blind_index.term_hash(token) for token in blind_index.tokenize(query)]
+    if not term_hashes:
+        return []
+
+    ensure_schema()
+    connection = get_connection()
+    if not connection:
+        return []
+
+    params = [*term_hashes, len(term_hashes)]
+    risk_filter = ""
+    if risk_level is not None:
+        risk_filter = "AND d.risk_level = ?"
+        params.append(risk_level)
+    params.append(limit)
+
+    try:
+        return connection.execute(f"""
+            SELECT {", ".join("d." + column.strip() for column in HISTORY_LIST_COLUMNS.split(","))}
+            FROM (
+                SELECT document_id
+                FROM document_blind_index
+                WHERE term_hash IN ({", ".join("?" * len(term_hashes))})
+                GROUP BY document_id
+                HAVING count(*) = ?
+            ) matches
+            JOIN document_history d ON d.id = matches.document_id
+            WHERE 1 {risk_filter}
+            ORDER BY d.upload_date DESC, d.id DESC
+            LIMIT ?
+        """, params).fetchall()
+    except Exception as e:
+        logger.error(f"Error searching encrypted documents: {e}")
+        return []
+    finally:
+        release_connection(connection)
+
+
+__all__ = list(BACKEND_FUNCTIONS)
@@ -0,0 +1,276 @@
+"""
+Binary storage codec for document bodies and summaries
+Compresses text before optional encryption and prefixes a small versioned
+header so stored values can be decoded regardless of how they were written
+
+Texts longer than CHUNK_SIZE bytes are stored in the chunked format: a
+sequence of length-prefixed frames, each compressed and encrypted on its own,
+so iter_decode can decode a value piece by piece while it is being read.
+"""
+import codecs
+import os
+import struct
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Header layout: format version, compression codec, flags
+FORMAT_VERSION = 1
+HEADER_SIZE = 3
+
+# Chunked values: the header codec is unused and every frame names its own
+CHUNKED_FORMAT_VERSION = 2
+
+# Frame layout: payload length, then the payload (encrypted if the value is).
+# The payload starts with the frame index, a last-frame flag and the codec;
+# they are encrypted with the data, so frames cannot be reordered or dropped.
+FRAME_LENGTH = struct.Struct(">I")
+FRAME_HEADER = struct.Struct(">IBB")
+
+# Text bytes per frame of a chunked value
+CHUNK_SIZE = int(os.environ.get("STORAGE_CHUNK_SIZE", 1 << 20))
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+FLAG_ENCRYPTED = 0x01
+
+# Texts shorter than this are stored uncompressed
+MIN_COMPRESS_SIZE = 256
+
+# Compression levels, overridable through environment variables
+ZSTD_LEVEL = int(os.environ.get("STORAGE_ZSTD_LEVEL", 9))
+ZLIB_LEVEL = int(os.environ.get("STORAGE_ZLIB_LEVEL", 6))
+
+
+def _compress(data):
+    """
+    Compress data with the best available codec
+
+    Returns:
+        tuple: (codec, payload). Falls back to CODEC_NONE when compression does not help.
+    """
+    if len(data) < MIN_COMPRESS_SIZE:
+        return CODEC_NONE, data
+    if zstandard is not None:
+        codec, payload = CODEC_ZSTD, zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    else:
+        codec, payload = CODEC_ZLIB, zlib.compress(data, ZLIB_LEVEL)
+    if len(payload) >= len(data):
+        return CODEC_NONE, data
+    return codec, payload
+
+
+def _decompress(codec, payload):
+    """Reverse _compress"""
+    if codec == CODEC_NONE:
+        return payload
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(payload)
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("Value is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    raise ValueError(f"Unknown compression codec {codec}")
+
+
+def _decompressor(codec):
+    """Get a function that decompresses a value of the given codec piece by piece"""
+    if codec == CODEC_NONE:
+        return lambda piece: piece
+    if codec == CODEC_ZLIB:
+        return zlib.decompressobj().decompress
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("Value is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompressobj().decompress
+    raise ValueError(f"Unknown compression codec {codec}")
+
+
+def _encode_chunked(data, encryption):
+    """Encode UTF-8 bytes as a chunked value"""
+    flags = FLAG_ENCRYPTED if encryption is not None else 0
+    parts = [bytes((CHUNKED_FORMAT_VERSION, CODEC_NONE, flags))]
+    last_start = (len(data) - 1) // CHUNK_SIZE * CHUNK_SIZE
+    for index, start in enumerate(range(0, len(data), CHUNK_SIZE)):
+        codec, payload = _compress(data[start:start + CHUNK_SIZE])
+        frame = FRAME_HEADER.pack(index, start == last_start, codec) + payload
+        if encryption is not None:
+            frame = encryption.encrypt_bytes(frame)
+        parts.append(FRAME_LENGTH.pack(len(frame)) + frame)
+    return b"".join(parts)
+
+
+def encode(text, encryption=None):
+    """
+    Encode text for storage in a bytea column
+
+    The text is compressed first, since ciphertext does not compress, and then
+    encrypted if an encryption instance is given. Texts longer than CHUNK_SIZE
+    bytes are encoded in the chunked format.
+
+    Args:
+        text (str): Text to store
+        encryption (DocumentEncryption, optional): Encrypts the compressed payload
+
+    Returns:
+        bytes: Encoded value or None if there is no text
+    """
+    if not text:
+        return None
+
+    data = text.encode("utf-8")
+    if len(data) > CHUNK_SIZE:
+        return _encode_chunked(data, encryption)
+
+    codec, payload = _compress(data)
+    flags = 0
+    if encryption is not None:
+        payload = encryption.encrypt_bytes(payload)
+        flags |= FLAG_ENCRYPTED
+    return bytes((FORMAT_VERSION, codec, flags)) + payload
+
+
+def decode(data, encryption=None):
+    """
+    Decode a value written by encode
+
+    Args:
+        data (bytes): Stored value (bytes or the memoryview psycopg2 returns for bytea)
+        encryption (DocumentEncryption, optional): Required for encrypted values
+
+    Returns:
+        str: Original text or None if there is no value
+    """
+    if data is None:
+        return None
+
+    data = bytes(data)
+    if len(data) < HEADER_SIZE:
+        raise ValueError("Stored value is too short to carry a header")
+
+    version, codec, flags = data[0], data[1], data[2]
+    if version == CHUNKED_FORMAT_VERSION:
+        return "".join(iter_decode((data,), encryption))
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported storage format version {version}")
+
+    payload = data[HEADER_SIZE:]
+    if flags & FLAG_ENCRYPTED:
+        if encryption is None:
+            raise ValueError("Value is encrypted but no encryption was provided")
+        payload = encryption.decrypt_bytes(payload)
+    return _decompress(codec, payload).decode("utf-8")
+
+
+class _SliceReader:
+    """Read exact byte counts from an iterable of byte slices"""
+    def __init__(self, slices):
+        self._slices = iter(slices)
+        self._buffer = bytearray()
+
+    def read(self, size):
+        """Read size bytes, or fewer at the end of the value"""
+        while len(self._buffer) < size:
+            piece = next(self._slices, None)
+            if piece is None:
+                break
+            self._buffer += piece
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def pieces(self):
+        """Yield the rest of the value as it arrives"""
+        if self._buffer:
+            yield bytes(self._buffer)
+            self._buffer.clear()
+        for piece in self._slices:
+            yield bytes(piece)
+
+
+def iter_decode(slices, encryption=None):
+    """
+    Decode a value written by encode from consecutive slices of it
+
+    Chunked values are decrypted and decompressed one frame at a time and
+    unencrypted version 1 values are decompressed as they arrive, so only a
+    slice and a frame are held in memory. An encrypted version 1 value is a
+    single token that can only be authenticated whole; it is collected first.
+
+    Args:
+        slices (iterable): Consecutive byte slices of the stored value
+        encryption (DocumentEncryption, optional): Required for encrypted values
+
+    Yields:
+        str: Consecutive pieces of the original text
+
+    Raises:
+        ValueError: If the value is malformed or truncated
+        cryptography.fernet.InvalidToken: If an encrypted value cannot be decrypted
+    """
+    reader = _SliceReader(slices)
+    header = reader.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE:
+        raise ValueError("Stored value is too short to carry a header")
+
+    version, codec, flags = header
+    if flags & FLAG_ENCRYPTED and encryption is None:
+        raise ValueError("Value is encrypted but no encryption was provided")
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+
+    if version == FORMAT_VERSION:
+        if flags & FLAG_ENCRYPTED:
+            payload = encryption.decrypt_bytes(b"".join(reader.pieces()))
+            yield _decompress(codec, payload).decode("utf-8")
+            return
+        decompress = _decompressor(codec)
+        for piece in reader.pieces():
+            text = text_decoder.decode(decompress(piece))
+            if text:
+                yield text
+        text = text_decoder.decode(b"", final=True)
+        if text:
+            yield text
+        return
+
+    if version != CHUNKED_FORMAT_VERSION:
+        raise ValueError(f"Unsupported storage format version {version}")
+
+    expected_index = 0
+    while True:
+        length = reader.read(FRAME_LENGTH.size)
+        if len(length) < FRAME_LENGTH.size:
+            raise ValueError("Chunked value is truncated")
+        frame_length = FRAME_LENGTH.unpack(length)[0]
+        frame = reader.read(frame_length)
+        if len(frame) < frame_length:
+            raise ValueError("Chunked value is truncated")
+        if flags & FLAG_ENCRYPTED:
+            frame = encryption.decrypt_bytes(frame)
+        index, last, frame_codec = FRAME_HEADER.unpack_from(frame)
+        if index != expected_index:
+            raise ValueError(f"Chunked value has frame {index} where {expected_index} was expected")
+        text = text_decoder.decode(_decompress(frame_codec, frame[FRAME_HEADER.size:]), final=bool(last))
+        if text:
+            yield text
+        if last:
+            return
+        expected_index += 1
+
+
+def is_encrypted(data):
+    """
+    Check whether an encoded value is encrypted
+
+    Args:
+        data (bytes): Stored value
+
+    Returns:
+        bool: True if the value carries the encrypted flag
+    """
+    return data is not None and len(data) >= HEADER_SIZE and bool(data[2] & FLAG_ENCRYPTED)
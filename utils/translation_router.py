@@ -0,0 +1,271 @@
+"""
+Latency- and health-aware routing across translation backends
+Tracks rolling latency and error rates per backend and language pair,
+picks the fastest healthy engine and optionally hedges slow requests
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+# Number of recent calls kept per backend and language pair
+DEFAULT_WINDOW = 50
+
+# A backend is unhealthy when more than this fraction of recent calls failed
+DEFAULT_MAX_ERROR_RATE = 0.5
+
+# Minimum number of recent calls before the error rate is trusted
+MIN_SAMPLES_FOR_HEALTH = 5
+
+# How long an unhealthy backend is skipped before it is probed again
+DEFAULT_COOLDOWN_SECONDS = 30.0
+
+# Seconds a probe may stay unanswered before another request may probe instead
+PROBE_TIMEOUT_SECONDS = 60.0
+
+
+class BackendStats:
+    """
+    Rolling latency and error statistics for one backend and language pair
+    """
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.unhealthy_since = None
+        # When a request was last sent to probe an unhealthy backend (half-open)
+        self.probe_started = None
+
+    def record(self, latency, success):
+        """Record one call"""
+        if success:
+            self.latencies.append(latency)
+        self.outcomes.append(success)
+
+    def reset(self):
+        """Forget the calls in the window, after a backend recovered"""
+        self.latencies.clear()
+        self.outcomes.clear()
+        self.unhealthy_since = None
+        self.probe_started = None
+
+    def percentile(self, fraction):
+        """
+        Get a latency percentile over the successful calls in the window
+
+        Args:
+            fraction (float): Percentile as a fraction (0.5 for p50, 0.95 for p95)
+
+        Returns:
+            float: Latency in seconds or None if there are no samples
+        """
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+        return ordered[index]
+
+    @property
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return 1.0 - (sum(self.outcomes) / len(self.outcomes))
+
+    def snapshot(self):
+        """Get the statistics as a plain dict"""
+        return {
+            "calls": len(self.outcomes),
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "error_rate": self.error_rate,
+            "healthy": self.unhealthy_since is None,
+        }
+
+
+class TranslationRouter:
+    """
+    Routes translation requests to the fastest healthy backend
+
+    Backends are callables taking (text, source_language, target_language) and
+    returning the translated text. A backend signals failure by raising or by
+    returning an empty result.
+    """
+    def __init__(self, hedge_budget=None, window=DEFAULT_WINDOW,
+                 max_error_rate=DEFAULT_MAX_ERROR_RATE, cooldown=DEFAULT_COOLDOWN_SECONDS,
+                 max_workers=16):
+        """
+        Initialize the router
+
+        Args:
+            hedge_budget (float, optional): Seconds to wait on the first backend before
+                                            firing a hedged request to the next one.
+                                            None disables hedging.
+            window (int): Number of recent calls kept per backend and language pair
+            max_error_rate (float): Error rate above which a backend is marked unhealthy
+            cooldown (float): Seconds an unhealthy backend is skipped before being probed again
+            max_workers (int): Size of the thread pool used for backend calls
+        """
+        self.hedge_budget = hedge_budget
+        self.window = window
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self.backends = {}
+        self.semaphores = {}
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="translation-router")
+
+    def register(self, name, backend, languages=None, max_concurrency=None):
+        """
+        Register a translation backend
+
+        Args:
+            name (str): Backend name used in statistics
+            backend (callable): Function (text, source_language, target_language) -> str
+            languages (set, optional): Language names the backend supports. None means all.
+            max_concurrency (int, optional): Maximum number of concurrent calls to the backend
+        """
+        self.backends[name] = (backend, set(languages) if languages else None)
+        if max_concurrency:
+            self.semaphores[name] = threading.BoundedSemaphore(max_concurrency)
+
+    def _get_stats(self, name, source_language, target_language):
+        key = (name, source_language, target_language)
+        if key not in self.stats:
+            self.stats[key] = BackendStats(self.window)
+        return self.stats[key]
+
+    def _record(self, name, source_language, target_language, latency, success):
+        with self._lock:
+            stats = self._get_stats(name, source_language, target_language)
+
+            # A probe decides alone: the failures in the window predate it
+            if stats.unhealthy_since is not None:
+                if success:
+                    stats.reset()
+                    stats.record(latency, success)
+                    logger.info(f"Translation backend {name} recovered for {source_language}->{target_language}")
+                else:
+                    stats.record(latency, success)
+                    stats.unhealthy_since = time.monotonic()
+                    stats.probe_started = None
+                return
+
+            stats.record(latency, success)
+            if len(stats.outcomes) >= MIN_SAMPLES_FOR_HEALTH and stats.error_rate > self.max_error_rate:
+                logger.warning(f"Translation backend {name} marked unhealthy for {source_language}->{target_language}")
+                stats.unhealthy_since = time.monotonic()
+
+    def rank_backends(self, source_language, target_language):
+        """
+        Get the backends ordered by preference for a language pair
+
+        Healthy backends come first, fastest p95 first. Backends with no samples
+        yet keep their registration order ahead of measured ones so they get probed.
+        An unhealthy backend whose cooldown expired is put first for a single
+        request at a time (half-open); its outcome decides whether it recovers,
+        and hedging bounds the cost of a slow probe. Other unhealthy backends
+        are skipped.
+
+        Returns:
+            list: Backend names
+        """
+        healthy = []
+        probing = []
+        now = time.monotonic()
+
+        with self._lock:
+            for order, (name, (_, languages)) in enumerate(self.backends.items()):
+                if languages is not None and (source_language not in languages or target_language not in languages):
+                    continue
+
+                stats = self._get_stats(name, source_language, target_language)
+                if stats.unhealthy_since is not None:
+                    probe_free = stats.probe_started is None or now - stats.probe_started >= PROBE_TIMEOUT_SECONDS
+                    if now - stats.unhealthy_since >= self.cooldown and probe_free:
+                        stats.probe_started = now
+                        probing.append(name)
+                    continue
+
+                p95 = stats.percentile(0.95)
+                healthy.append((p95 is not None, p95 or 0.0, order, name))
+
+        healthy.sort()
+        return probing + [name for _, _, _, name in healthy]
+
+    def _call(self, name, text, source_language, target_language):
+        """Call one backend and record its latency and outcome"""
+        backend, _ = self.backends[name]
+        semaphore = self.semaphores.get(name)
+        if semaphore:
+            semaphore.acquire()
+        start = time.perf_counter()
+        try:
+            result = backend(text, source_language, target_language)
+        except Exception as e:
+            self._record(name, source_language, target_language, time.perf_counter() - start, False)
+            raise
+        finally:
+            if semaphore:
+                semaphore.release()
+
+        success = bool(result)
+        self._record(name, source_language, target_language, time.perf_counter() - start, success)
+        if not success:
+            raise Exception(f"{name} returned an empty translation")
+        return result
+
+    def translate(self, text, source_language, target_language):
+        """
+        Translate text with the best available backend
+
+        Args:
+            text (str): Text to translate
+            source_language (str): Source language name
+            target_language (str): Target language name
+
+        Returns:
+            tuple: (translated_text, backend_name) or (None, None) if every backend failed
+        """
+        candidates = self.rank_backends(source_language, target_language)
+        pending = {}
+
+        while candidates or pending:
+            # Keep one request in flight, plus a hedge once the budget is exceeded
+            if not pending and candidates:
+                name = candidates.pop(0)
+                pending[self._executor.submit(self._call, name, text, source_language, target_language)] = name
+
+            timeout = self.hedge_budget if (self.hedge_budget is not None and candidates and len(pending) == 1) else None
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                name = candidates.pop(0)
+                logger.info(f"Translation exceeded {self.hedge_budget:.2f}s, hedging with {name}")
+                pending[self._executor.submit(self._call, name, text, source_language, target_language)] = name
+                continue
+
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.warning(f"Translation backend {name} failed: {str(e)}")
+                    continue
+
+                # The losing hedge keeps running and still records its statistics
+                return result, name
+
+        return None, None
+
+    def get_stats(self):
+        """
+        Get the statistics of every backend and language pair
+
+        Returns:
+            dict: {(backend, source_language, target_language): stats dict}
+        """
+        with self._lock:
+            return {key: stats.snapshot() for key, stats in self.stats.items()}
@@ -1,13 +1,18 @@
 import os
 import json
 import re
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
 import requests
 from openai import OpenAI
-from langdetect import detect, LangDetectException
 
 # Import our direct translators
 from utils.direct_translator import get_translator, TamilLegalTranslator, HindiLegalTranslator, BasicLegalTranslator
 from utils.google_translate import translate_text as google_translate
+from utils.translation_router import TranslationRouter
+from utils.language_detector import detect_language as detect_script_language, split_by_language
 
 # Try to import IndicTranslator
 try:
@@ -17,6 +22,22 @@ except Exception as e:
     print(f"IndicTrans not available: {e}")
     INDIC_TRANS_AVAILABLE = False
 
+# Seconds to wait on the fastest backend before hedging with the next one (0 disables hedging)
+HEDGE_BUDGET_SECONDS = float(os.getenv("TRANSLATION_HEDGE_BUDGET_MS", "1500")) / 1000
+
+# Optional NLLB-200 engine for the router: "ctranslate2", "pytorch" or empty to disable
+NLLB_ENGINE = os.getenv("NLLB_ENGINE", "").lower()
+
+# Maximum number of cached translations
+TRANSLATION_CACHE_SIZE = 2048
+
+# Maximum number of concurrent requests per translation backend
+BACKEND_CONCURRENCY = {
+    "google": 8,
+    "indictrans2": 2,
+    "nllb": 1,
+}
+
 # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
 # do not change this unless explicitly requested by the user
 MODEL_NAME = "gpt-4o"
@@ -70,6 +91,21 @@ class TranslationHelper:
                 self.indic_translator = None
         else:
             self.indic_translator = None
+            
+        # Optionally load an NLLB-200 engine (the model is large, so it is opt-in)
+        self.nllb_translator = None
+        if NLLB_ENGINE:
+            try:
+                from utils.nllb_translator import NLLBTranslator, CTranslate2NLLBTranslator
+                if NLLB_ENGINE == "pytorch":
+                    self.nllb_translator = NLLBTranslator()
+                else:
+                    self.nllb_translator = CTranslate2NLLBTranslator()
+                if not self.nllb_translator.is_available:
+                    self.nllb_translator = None
+            except Exception as e:
+                print(f"NLLB initialization failed: {e}")
+                self.nllb_translator = None
         
         # Supported languages with their codes
         self.languages = {
@@ -102,6 +138,19 @@ class TranslationHelper:
             "ur": "urdu",
             "or": "odia"
         }
+        
+        # Route machine translation requests to the fastest healthy backend
+        self.router = TranslationRouter(hedge_budget=HEDGE_BUDGET_SECONDS or None)
+        self.router.register("google", self._translate_with_google, max_concurrency=BACKEND_CONCURRENCY["google"])
+        if self.indic_translator and self.indic_translator.is_available:
+            self.router.register("indictrans2", self.indic_translator.translate,
+                                 max_concurrency=BACKEND_CONCURRENCY["indictrans2"])
+        if self.nllb_translator:
+            self.router.register("nllb", self.nllb_translator.translate, max_concurrency=BACKEND_CONCURRENCY["nllb"])
+        
+        # In-memory cache of finished translations, keyed by text hash and target language
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
     
     def detect_language(self, text):
         """
@@ -113,26 +162,42 @@ class TranslationHelper:
         Returns:
             str: Detected language name (english, hindi, etc.)
         """
-        if not text or len(text.strip()) < 20:
-            return "english"  # Default to English for very short or empty text
-            
-        try:
-            # Use langdetect library
-            lang_code = detect(text)
+        # Script histogram first, langdetect only for same-script languages; memoized
+        language = detect_script_language(text)
+        
+        # If not in our supported languages, default to English
+        if language not in self.languages:
+            return "english"
+        return language
+    
+    def _cache_key(self, text, target_language):
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        return digest, target_language.lower()
+    
+    def get_cached_translation(self, text, target_language):
+        """
+        Get a previously computed translation
+        
+        Args:
+            text (str): Source text
+            target_language (str): Target language name
             
-            # Map language code to language name
-            if lang_code in self.lang_code_to_name:
-                return self.lang_code_to_name[lang_code]
-            else:
-                # If not in our supported languages, default to English
-                return "english"
-        except LangDetectException:
-            # Fallback to our simple English detection
-            if self._is_english(text):
-                return "english"
-            else:
-                # Default to English if detection fails
-                return "english"
+        Returns:
+            str: Cached translation or None
+        """
+        key = self._cache_key(text, target_language)
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        return None
+    
+    def _store_translation(self, text, target_language, translated_text):
+        key = self._cache_key(text, target_language)
+        with self._cache_lock:
+            self._cache[key] = translated_text
+            if len(self._cache) > TRANSLATION_CACHE_SIZE:
+                self._cache.popitem(last=False)
     
     def translate_text(self, text, target_language):
         """
@@ -151,13 +216,93 @@ class TranslationHelper:
         if target_language.lower() not in self.languages:
             return f"Unsupported language: {target_language}. Supported languages are: {', '.join(self.languages.keys())}"
         
+        cached = self.get_cached_translation(text, target_language)
+        if cached is not None:
+            return cached
+        
+        translated_text, cacheable = self._translate_uncached(text, target_language)
+        if cacheable:
+            self._store_translation(text, target_language, translated_text)
+        return translated_text
+    
+    async def atranslate(self, texts, target_language):
+        """
+        Translate many texts concurrently
+        
+        Duplicates are translated once, cached texts are answered from the cache and
+        the remaining texts are translated concurrently. Each backend limits its own
+        concurrency, so a page of labels costs about one round trip.
+        
+        Args:
+            texts (list): Texts to translate
+            target_language (str): Target language name (english, hindi, tamil, etc.)
+            
+        Returns:
+            list: Translated texts in input order
+        """
+        results = {}
+        misses = []
+        for text in dict.fromkeys(texts):
+            cached = self.get_cached_translation(text, target_language) if text else ""
+            if cached is not None:
+                results[text] = cached
+            else:
+                misses.append(text)
+        
+        if misses:
+            translations = await asyncio.gather(
+                *(asyncio.to_thread(self.translate_text, text, target_language) for text in misses)
+            )
+            results.update(zip(misses, translations))
+        
+        return [results[text] for text in texts]
+    
+    def translate_many(self, texts, target_language):
+        """
+        Translate many texts concurrently from synchronous code
+        
+        Args:
+            texts (list): Texts to translate
+            target_language (str): Target language name (english, hindi, tamil, etc.)
+            
+        Returns:
+            list: Translated texts in input order
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.atranslate(texts, target_language))
+        
+        # Already inside an event loop - run ours on a separate thread
+        result = []
+        worker = threading.Thread(target=lambda: result.append(asyncio.run(self.atranslate(texts, target_language))))
+        worker.start()
+        worker.join()
+        return result[0]
+    
+    def _translate_uncached(self, text, target_language):
+        """
+        Translate text without consulting the cache
+        
+        Returns:
+            tuple: (translated_text, cacheable) where cacheable is False when no
+                   machine translation backend produced the result
+        """
+        # Mixed-language documents: translate only the segments not already in the target language
+        segments = split_by_language(text)
+        if len({language for _, language in segments if language}) > 1:
+            mixed_translation = self._translate_segments(segments, target_language.lower())
+            if mixed_translation is not None:
+                return mixed_translation, True
+            print("Segment translation failed, translating the whole document")
+        
         # Detect the source language
         source_language = self.detect_language(text)
         print(f"Detected source language: {source_language}")
         
         # If already in target language, return as is
         if source_language.lower() == target_language.lower():
-            return text
+            return text, True
         
         lang_code = self.languages[target_language.lower()]
         source_lang_code = self.languages.get(source_language.lower(), "en")
@@ -166,17 +311,15 @@ class TranslationHelper:
         translated_text = None
         translation_method = None
         
-        # Use a simpler approach - try each method in sequence until one works
-        
-        # Method 1: Try Google Translate first for full text translation
+        # Method 1: Machine translation through the router, which picks the fastest
+        # healthy backend for this language pair and hedges slow requests
         try:
-            print(f"Using Google Translate API for {target_language}")
-            google_result = google_translate(text, lang_code, source_lang_code)
-            if google_result and google_result != text:
-                translated_text = google_result
-                translation_method = "Google Translate API"
+            routed_text, backend_name = self.router.translate(text, source_language.lower(), target_language.lower())
+            if routed_text:
+                translated_text = routed_text
+                translation_method = backend_name
         except Exception as e:
-            print(f"Google Translate API failed: {str(e)}")
+            print(f"Translation router failed: {str(e)}")
             translated_text = None
                 
         # Method 2: Use our specialized direct translators as fallback
@@ -221,10 +364,49 @@ class TranslationHelper:
         
         # Final fallback
         if not translated_text:
-            return f"[Translation to {target_language} failed. All translation services failed.]\n\n{text}"
+            return f"[Translation to {target_language} failed. All translation services failed.]\n\n{text}", False
         
-        # Return the translated text without mentioning translation method
-        return translated_text
+        # Return the translated text without mentioning translation method.
+        # Template fallbacks are not cached so a recovered backend is used next time.
+        return translated_text, translation_method in self.router.backends
+    
+    def _translate_segments(self, segments, target_language):
+        """
+        Translate the segments of a mixed-language document and stitch them back in order
+        
+        Args:
+            segments (list): (chunk, language) tuples from split_by_language
+            target_language (str): Target language name
+            
+        Returns:
+            str: Translated document or None if a segment could not be translated
+        """
+        translated_segments = []
+        for chunk, language in segments:
+            if not language or language == target_language or language not in self.languages:
+                translated_segments.append(chunk)
+                continue
+            
+            # Translate the segment body and keep its surrounding whitespace
+            body = chunk.strip()
+            leading = chunk[:len(chunk) - len(chunk.lstrip())]
+            trailing = chunk[len(chunk.rstrip()):]
+            
+            print(f"Translating {len(body)} character {language} segment to {target_language}")
+            translated_body, _ = self.router.translate(body, language, target_language)
+            if not translated_body:
+                return None
+            translated_segments.append(leading + translated_body + trailing)
+        
+        return "".join(translated_segments)
+    
+    def _translate_with_google(self, text, source_language, target_language):
+        """Router backend for the Google Translate API"""
+        result = google_translate(text, self.languages[target_language], self.languages.get(source_language, "en"))
+        # google_translate returns the input unchanged when the request fails
+        if not result or result == text:
+            return None
+        return result
     
     def _translate_with_openai(self, text, target_language):
         """Use OpenAI for translation as a fallback"""
@@ -0,0 +1,559 @@
+"""
+Write-behind persistence for document history and summaries
+Saves return a document ID straight away; a background thread writes queued
+documents and summaries to the database in batches, retrying with backoff
+while the database is unavailable. Queued writes are kept in an encrypted
+journal file so they survive a restart of the process.
+
+The journal is encrypted with ENCRYPTION_KEY; the queue refuses to start
+without it, since queued writes could not be recovered after a restart.
+"""
+import base64
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import psycopg2
+from cryptography.fernet import InvalidToken
+
+from utils.database import (
+    encryption,
+    allocate_ids,
+    find_duplicate_document,
+    prepare_documents,
+    write_prepared_documents,
+    write_summaries
+)
+
+logger = logging.getLogger(__name__)
+
+# Journal of writes that have not reached the database yet
+JOURNAL_PATH = os.environ.get("WRITE_BEHIND_JOURNAL", os.path.join(".lawzio", "write_behind.journal"))
+
+# Jobs written per database round trip
+WRITE_BATCH_SIZE = int(os.environ.get("WRITE_BEHIND_BATCH_SIZE", 50))
+
+# Longest wait between retries while the database is unavailable
+MAX_RETRY_DELAY = float(os.environ.get("WRITE_BEHIND_MAX_RETRY_DELAY", 60))
+
+# Pre-allocated IDs fetched per sequence round trip
+ID_BLOCK_SIZE = int(os.environ.get("WRITE_BEHIND_ID_BLOCK", 20))
+
+# Sync every journal append to disk; turning this off trades durability for latency
+FSYNC_JOURNAL = os.environ.get("WRITE_BEHIND_FSYNC", "1") != "0"
+
+# Acknowledged records kept in the journal before it is rewritten
+COMPACT_THRESHOLD = 1000
+
+# IDs assigned by the writer that are remembered for summaries of pending documents
+ASSIGNED_IDS_KEPT = 10000
+
+# Errors after which a write is retried rather than given up
+TRANSIENT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, sqlite3.OperationalError)
+
+# Constraint violations of either storage backend
+INTEGRITY_ERRORS = (psycopg2.IntegrityError, sqlite3.IntegrityError)
+
+# Unique indexes on (privacy_level, content_hash), before and after partitioning
+CONTENT_HASH_INDEXES = ("idx_document_history_content_hash", "idx_document_keys_content_hash")
+
+
+def _is_content_hash_conflict(error):
+    """Tell whether an integrity error is a duplicate content hash"""
+    if isinstance(error, sqlite3.IntegrityError):
+        return "document_history.content_hash" in str(error)
+    diag = getattr(error, "diag", None)
+    return bool(diag and diag.constraint_name in CONTENT_HASH_INDEXES)
+
+
+def _to_json(value):
+    """JSON default hook for the bytes in prepared documents"""
+    if isinstance(value, (bytes, memoryview)):
+        return {"__bytes__": base64.b64encode(bytes(value)).decode("ascii")}
+    raise TypeError(f"Cannot journal {type(value).__name__}")
+
+
+def _from_json(value):
+    """JSON object hook reversing _to_json"""
+    if "__bytes__" in value:
+        return base64.b64decode(value["__bytes__"])
+    return value
+
+
+def _decrypt_line(line):
+    """
+    Decrypt a journal line
+
+    DocumentEncryption.decrypt reports failures as a message string; this
+    raises instead, so records written with another key are never mistaken
+    for torn lines.
+
+    Raises:
+        InvalidToken, ValueError: If the line cannot be decrypted
+    """
+    # DocumentEncryption.encrypt base64-encodes the Fernet token a second time
+    token = base64.urlsafe_b64decode(base64.urlsafe_b64decode(line))
+    return encryption.decrypt_bytes(token).decode("utf-8")
+
+
+class PendingDocument:
+    """
+    Reference to a queued document that has no ID yet
+
+    save_document_history returns one when no pre-allocated ID is at hand;
+    the writer assigns the ID when the document is written. It can be passed
+    to save_document_summary in place of an ID, and WriteBehindQueue.resolve
+    gives the ID once it is known.
+    """
+    __slots__ = ("seq",)
+
+    def __init__(self, seq):
+        self.seq = seq
+
+    def __repr__(self):
+        return f"PendingDocument({self.seq})"
+
+
+class IdAllocator:
+    """
+    Pool of IDs reserved from a table's sequence
+
+    The pool is only ever refilled by a background thread, in blocks, so
+    handing out an ID never waits for the database.
+    """
+    def __init__(self, table, block_size=ID_BLOCK_SIZE):
+        self.table = table
+        self.block_size = block_size
+        self._ids = []
+        self._lock = threading.Lock()
+        self._refilling = False
+
+    def _refill(self):
+        try:
+            ids = allocate_ids(self.table, self.block_size)
+            with self._lock:
+                self._ids.extend(ids)
+        except Exception as e:
+            logger.warning(f"Could not reserve {self.table} IDs: {e}")
+        finally:
+            with self._lock:
+                self._refilling = False
+
+    def refill(self):
+        """Top up the pool in the background if it is running low"""
+        with self._lock:
+            if self._refilling or len(self._ids) >= self.block_size // 2:
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill, name=f"id-allocator-{self.table}", daemon=True).start()
+
+    def take(self):
+        """
+        Get an unused ID without waiting for the database
+
+        Returns:
+            int: Reserved ID or None if the pool is empty
+        """
+        with self._lock:
+            next_id = self._ids.pop(0) if self._ids else None
+        self.refill()
+        return next_id
+
+
+class WriteBehindQueue:
+    """
+    Journaled queue of document and summary writes with one writer thread
+
+    Jobs are written in the order they were queued, so a summary is never
+    written before its document. Consecutive jobs of the same kind are
+    written together in one transaction.
+    """
+    def __init__(self, journal_path=JOURNAL_PATH, batch_size=WRITE_BATCH_SIZE):
+        if not os.environ.get("ENCRYPTION_KEY"):
+            # Without a fixed key the journal could not be read after a restart
+            raise RuntimeError("The write-behind queue needs ENCRYPTION_KEY to be set")
+        self.journal_path = journal_path
+        # Writes that failed permanently are moved here for inspection
+        self.dead_letter_path = journal_path + ".dead"
+        self.batch_size = batch_size
+        self.document_ids = IdAllocator("document_history")
+        self.summary_ids = IdAllocator("document_summaries")
+
+        self._queue = queue.Queue()
+        self._held = None
+        self._pending = {}
+        # Journal seq of documents written without a pre-allocated ID -> their ID
+        self._assigned = OrderedDict()
+        self._seq = 0
+        self._acked = 0
+        self._journal_lock = threading.Lock()
+        self._idle = threading.Condition(self._journal_lock)
+        self._stop_event = threading.Event()
+        self._stats = {
+            "queued": 0,
+            "written": 0,
+            "batches": 0,
+            "retries": 0,
+            "dead_lettered": 0,
+            "replayed": 0,
+            "last_error": None,
+        }
+
+        directory = os.path.dirname(self.journal_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._replay_journal()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self.document_ids.refill()
+        self.summary_ids.refill()
+
+        self._worker = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._worker.start()
+
+    # Journal
+
+    def _read_records(self, path):
+        """
+        Decrypt the records of a journal file
+
+        Returns:
+            tuple: (records, lines that could not be decrypted or parsed)
+        """
+        records = []
+        unreadable = []
+        if not os.path.exists(path):
+            return records, unreadable
+        with open(path, encoding="utf-8") as journal:
+            for line in journal:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(_decrypt_line(line), object_hook=_from_json))
+                except (InvalidToken, ValueError):
+                    unreadable.append(line)
+        return records, unreadable
+
+    def _replay_journal(self):
+        """Queue the unacknowledged records of an earlier process and compact the journal"""
+        records, unreadable = self._read_records(self.journal_path)
+        if unreadable:
+            # Kept verbatim: a torn last line, or records written under another key
+            with open(self.dead_letter_path, "a", encoding="utf-8") as dead_letters:
+                for line in unreadable:
+                    dead_letters.write(line + "\n")
+                dead_letters.flush()
+                os.fsync(dead_letters.fileno())
+            logger.error(
+                f"Moved {len(unreadable)} unreadable journal records to {self.dead_letter_path}; "
+                "check ENCRYPTION_KEY"
+            )
+
+        pending = {}
+        assigned = {}
+        for record in records:
+            self._seq = max(self._seq, record["seq"])
+            if record["op"] == "ack":
+                for seq in record["seqs"]:
+                    pending.pop(seq, None)
+                assigned.update({int(seq): document_id for seq, document_id in record.get("ids", {}).items()})
+            else:
+                pending[record["seq"]] = record
+
+        # Acks are dropped by the rewrite, so summaries of documents written
+        # without a pre-allocated ID take their ID along
+        for record in pending.values():
+            payload = record["payload"]
+            if record["op"] == "summary" and payload.get("document_id") is None:
+                payload["document_id"] = assigned.get(payload.get("document_seq"))
+
+        self._rewrite_journal(pending.values())
+        for seq in sorted(pending):
+            self._pending[seq] = pending[seq]
+            self._queue.put(pending[seq])
+        self._stats["replayed"] = len(pending)
+        if pending:
+            logger.info(f"Replaying {len(pending)} queued writes from {self.journal_path}")
+
+    def _rewrite_journal(self, records):
+        """Replace the journal with only the given records"""
+        temp_path = self.journal_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as journal:
+            for record in records:
+                journal.write(self._encode_record(record))
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(temp_path, self.journal_path)
+        self._acked = 0
+
+    @staticmethod
+    def _encode_record(record):
+        return encryption.encrypt(json.dumps(record, default=_to_json)) + "\n"
+
+    def _append(self, record):
+        """Append a record to the journal; the caller holds the journal lock"""
+        self._journal.write(self._encode_record(record))
+        self._journal.flush()
+        if FSYNC_JOURNAL:
+            os.fsync(self._journal.fileno())
+
+    def _enqueue(self, op, payload):
+        with self._journal_lock:
+            self._seq += 1
+            record = {"seq": self._seq, "op": op, "payload": payload}
+            self._append(record)
+            self._pending[record["seq"]] = record
+            self._stats["queued"] += 1
+        self._queue.put(record)
+        return record["seq"]
+
+    def _ack(self, records, assigned=None):
+        """Mark records as written and compact the journal once nothing is pending"""
+        with self._journal_lock:
+            ack = {"seq": 0, "op": "ack", "seqs": [record["seq"] for record in records]}
+            if assigned:
+                ack["ids"] = assigned
+                self._assigned.update(assigned)
+                while len(self._assigned) > ASSIGNED_IDS_KEPT:
+                    self._assigned.popitem(last=False)
+            self._append(ack)
+            for record in records:
+                self._pending.pop(record["seq"], None)
+            self._acked += len(records)
+            if not self._pending:
+                if self._acked >= COMPACT_THRESHOLD:
+                    self._journal.close()
+                    self._rewrite_journal([])
+                    self._journal = open(self.journal_path, "a", encoding="utf-8")
+                self._idle.notify_all()
+
+    def _dead_letter(self, records, error):
+        """Move records that cannot be written out of the journal"""
+        with open(self.dead_letter_path, "a", encoding="utf-8") as dead_letters:
+            for record in records:
+                dead_letters.write(self._encode_record(dict(record, error=str(error))))
+        self._stats["dead_lettered"] += len(records)
+        logger.error(f"Gave up on {len(records)} queued writes: {error}")
+        self._ack(records)
+
+    # Public API
+
+    def save_document_history(self, **document):
+        """
+        Queue a document for saving
+
+        Takes the keyword arguments of database.save_document_history. The
+        document is encrypted and indexed before it is queued, so the journal
+        never holds the plain text of encrypted documents.
+
+        Returns:
+            int or PendingDocument: ID the document will be stored under, or a
+                                    PendingDocument if no ID was reserved yet
+        """
+        document_id = self.document_ids.take()
+        prepared = prepare_documents([dict(document, document_id=document_id)])[0]
+        seq = self._enqueue("document", prepared)
+        return document_id if document_id is not None else PendingDocument(seq)
+
+    def save_document_summary(self, document_id, summary_text, detail_level, language="english"):
+        """
+        Queue a summary for saving
+
+        Takes the arguments of database.save_document_summary; document_id may
+        be a PendingDocument.
+
+        Returns:
+            int: ID the summary will be stored under, or None if it is assigned on writing
+        """
+        summary_id = self.summary_ids.take()
+        document_seq = document_id.seq if isinstance(document_id, PendingDocument) else None
+        self._enqueue("summary", {
+            "document_id": self.resolve(document_id),
+            "document_seq": document_seq,
+            "summary_text": summary_text,
+            "detail_level": detail_level,
+            "language": language,
+            "summary_id": summary_id,
+        })
+        return summary_id
+
+    def resolve(self, document_id):
+        """
+        Get the ID of a document returned by save_document_history
+
+        Args:
+            document_id (int or PendingDocument): Value returned by save_document_history
+
+        Returns:
+            int: Document ID, or None while a pending document is not written yet
+        """
+        if not isinstance(document_id, PendingDocument):
+            return document_id
+        with self._journal_lock:
+            return self._assigned.get(document_id.seq)
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued write has reached the database
+
+        Args:
+            timeout (float, optional): Seconds to wait
+
+        Returns:
+            bool: True if nothing is pending
+        """
+        with self._journal_lock:
+            return self._idle.wait_for(lambda: not self._pending, timeout)
+
+    def stats(self):
+        """
+        Get queue statistics
+
+        Returns:
+            dict: Counters plus the number of pending writes and the average batch size
+        """
+        with self._journal_lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+        stats["average_batch_size"] = stats["written"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def stop(self, timeout=5):
+        """Write what can be written within the timeout and stop the worker"""
+        self.flush(timeout)
+        self._stop_event.set()
+        self._queue.put(None)
+        self._worker.join(timeout)
+
+    # Worker
+
+    def _next_batch(self):
+        """Wait for a job, then take the queued jobs of the same kind that follow it"""
+        first, self._held = self._held or self._queue.get(), None
+        if first is None:
+            return []
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                record = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is None or record["op"] != first["op"]:
+                # Keep FIFO order across kinds: hold the job for the next batch
+                self._held = record
+                break
+            batch.append(record)
+        return batch
+
+    def _write(self, batch):
+        """
+        Write a batch of jobs of one kind
+
+        Returns:
+            tuple: (records written, {seq: ID} of documents that had no pre-allocated ID)
+        """
+        payloads = [record["payload"] for record in batch]
+        if batch[0]["op"] == "document":
+            # Noted before writing, which may fill in the payload IDs
+            unassigned = [record["payload"]["id"] is None for record in batch]
+            try:
+                document_ids = write_prepared_documents(payloads)
+            except INTEGRITY_ERRORS as e:
+                if not _is_content_hash_conflict(e):
+                    raise
+                # Another session, or an earlier job of the batch, stored the
+                # same file first; keep those copies without the hash
+                self._drop_duplicate_hashes(payloads)
+                document_ids = write_prepared_documents(payloads)
+            assigned = {
+                record["seq"]: document_id
+                for record, document_id, missing in zip(batch, document_ids, unassigned)
+                if missing
+            }
+            return batch, assigned
+
+        unresolved = []
+        for record in batch:
+            payload = record["payload"]
+            if payload["document_id"] is None:
+                payload["document_id"] = self.resolve(PendingDocument(payload.get("document_seq")))
+            if payload["document_id"] is None:
+                unresolved.append(record)
+        if unresolved:
+            self._dead_letter(unresolved, "the summary's document was never written")
+            batch = [record for record in batch if record not in unresolved]
+        if batch:
+            write_summaries([
+                {key: value for key, value in record["payload"].items() if key != "document_seq"}
+                for record in batch
+            ])
+        return batch, None
+
+    def _drop_duplicate_hashes(self, payloads):
+        """Clear the content hash of the documents whose file is already stored"""
+        seen = set()
+        for payload in payloads:
+            if not payload["content_hash"]:
+                continue
+            key = (payload["privacy_level"], payload["content_hash"])
+            stored = not payload["replace_duplicate"] and find_duplicate_document(
+                payload["content_hash"], payload["privacy_level"]
+            )
+            if key in seen or stored:
+                payload["content_hash"] = None
+                payload["replace_duplicate"] = False
+            else:
+                seen.add(key)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+
+            attempt = 0
+            while not self._stop_event.is_set():
+                try:
+                    written, assigned = self._write(batch)
+                except TRANSIENT_ERRORS as e:
+                    # Database unavailable; the journal keeps the batch across restarts
+                    attempt += 1
+                    self._stats["retries"] += 1
+                    self._stats["last_error"] = str(e)
+                    self._stop_event.wait(min(2 ** attempt, MAX_RETRY_DELAY))
+                    continue
+                except Exception as e:
+                    self._stats["last_error"] = str(e)
+                    self._dead_letter(batch, e)
+                    break
+                self._stats["written"] += len(written)
+                self._stats["batches"] += 1
+                self._ack(written, assigned)
+                break
+
+
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+
+def start_write_behind_queue(journal_path=JOURNAL_PATH):
+    """
+    Start the process-wide write-behind queue if it is not already running
+
+    Writes left in the journal by an earlier process are queued first.
+
+    Args:
+        journal_path (str): Journal file
+
+    Returns:
+        WriteBehindQueue: The running queue
+    """
+    global _write_queue
+    with _write_queue_lock:
+        if _write_queue is None:
+            _write_queue = WriteBehindQueue(journal_path=journal_path)
+        return _write_queue